@@ -137,6 +137,7 @@ from app.models.account import Account
 from app.models.transaction import Transaction
 from app.models.category import Category
 from app.models.bank_connection import BankConnection
+from app.models.transaction_rollup import TransactionDailyRollup
 
 # Alembic Config object
 config = context.config
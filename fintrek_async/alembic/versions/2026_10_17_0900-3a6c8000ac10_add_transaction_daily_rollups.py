@@ -0,0 +1,53 @@
+# alembic/script.py.mako
+"""Add transaction_daily_rollups table
+
+Revision ID: 3a6c8000ac10
+Revises: f05ee718e966
+Create Date: 2026-10-17 09:00:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3a6c8000ac10'
+down_revision = 'f05ee718e966'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('transaction_daily_rollups',
+    sa.Column('id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.UUID(), nullable=True),
+    sa.Column('transaction_type', postgresql.ENUM('INCOME', 'EXPENSE', 'TRANSFER', name='transactiontype', create_type=False), nullable=False),
+    sa.Column('total_amount', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('tx_count', sa.Integer(), nullable=False),
+    sa.Column('sum_squares', sa.Numeric(precision=30, scale=4), nullable=False),
+    sa.Column('min_amount', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('max_amount', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_transaction_daily_rollups_key', 'transaction_daily_rollups', ['user_id', 'day', 'category_id', 'transaction_type'], unique=True)
+
+    # Первичное заполнение из существующих транзакций
+    op.execute("""
+        INSERT INTO transaction_daily_rollups
+            (user_id, day, category_id, transaction_type,
+             total_amount, tx_count, sum_squares, min_amount, max_amount, updated_at)
+        SELECT user_id, CAST(transaction_date AS DATE), category_id, transaction_type,
+               SUM(amount), COUNT(*), SUM(amount * amount), MIN(amount), MAX(amount), now()
+        FROM transactions
+        GROUP BY user_id, CAST(transaction_date AS DATE), category_id, transaction_type
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transaction_daily_rollups_key', table_name='transaction_daily_rollups')
+    op.drop_table('transaction_daily_rollups')
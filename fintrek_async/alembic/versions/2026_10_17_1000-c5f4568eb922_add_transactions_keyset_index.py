@@ -0,0 +1,25 @@
+# alembic/script.py.mako
+"""Add composite index for transactions keyset pagination
+
+Revision ID: c5f4568eb922
+Revises: 3a6c8000ac10
+Create Date: 2026-10-17 10:00:41.207163
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f4568eb922'
+down_revision = '3a6c8000ac10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_user_date_id', 'transactions', ['user_id', sa.text('transaction_date DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_user_date_id', table_name='transactions')
@@ -0,0 +1,51 @@
+# alembic/script.py.mako
+"""Add covering indexes for hot transaction queries
+
+Revision ID: c76db5a49905
+Revises: c5f4568eb922
+Create Date: 2026-10-17 11:00:07.553914
+
+BRIN-индекс по transaction_date создается только по запросу:
+    alembic -x brin=true upgrade head
+Он почти ничего не весит и полезен на больших установках, где строки
+вставляются примерно в порядке дат (импорт из банков).
+"""
+from alembic import context, op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c76db5a49905'
+down_revision = 'c5f4568eb922'
+branch_labels = None
+depends_on = None
+
+
+def _brin_requested() -> bool:
+    return context.get_x_argument(as_dictionary=True).get('brin', '').lower() in ('1', 'true', 'yes')
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_transactions_user_type_date',
+        'transactions',
+        ['user_id', 'transaction_type', 'transaction_date'],
+        unique=False,
+        postgresql_include=['amount', 'category_id']
+    )
+
+    if _brin_requested():
+        op.create_index(
+            'ix_transactions_transaction_date_brin',
+            'transactions',
+            ['transaction_date'],
+            unique=False,
+            postgresql_using='brin'
+        )
+
+    # Актуальная статистика и карта видимости для index-only scan
+    op.execute('ANALYZE transactions')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS ix_transactions_transaction_date_brin')
+    op.drop_index('ix_transactions_user_type_date', table_name='transactions')
@@ -0,0 +1,42 @@
+# alembic/script.py.mako
+"""Add pg_trgm indexes for transaction search
+
+Revision ID: 3f30716d7a4e
+Revises: c76db5a49905
+Create Date: 2026-10-17 12:00:26.871402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f30716d7a4e'
+down_revision = 'c76db5a49905'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_transactions_description_trgm',
+        'transactions',
+        ['description'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'description': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_transactions_merchant_name_trgm',
+        'transactions',
+        ['merchant_name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'merchant_name': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_merchant_name_trgm', table_name='transactions')
+    op.drop_index('ix_transactions_description_trgm', table_name='transactions')
+    # Расширение не удаляем: им могут пользоваться другие объекты БД
@@ -0,0 +1,57 @@
+# alembic/script.py.mako
+"""Add merchants and user_merchant_categories tables
+
+Revision ID: 45fd1b948e16
+Revises: 3f30716d7a4e
+Create Date: 2026-10-17 13:00:41.207513
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '45fd1b948e16'
+down_revision = '3f30716d7a4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('merchants',
+    sa.Column('id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('category_id', sa.UUID(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_merchants_key_pattern', 'merchants', ['key'], unique=False, postgresql_ops={'key': 'text_pattern_ops'})
+
+    op.create_table('user_merchant_categories',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('merchant_id', sa.UUID(), nullable=False),
+    sa.Column('category_id', sa.UUID(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['merchant_id'], ['merchants.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'merchant_id')
+    )
+
+    op.add_column('transactions', sa.Column('merchant_id', sa.UUID(), nullable=True))
+    op.create_foreign_key('transactions_merchant_id_fkey', 'transactions', 'merchants', ['merchant_id'], ['id'], ondelete='SET NULL')
+    op.create_index('ix_transactions_user_merchant', 'transactions', ['user_id', 'merchant_id'], unique=False)
+    # Существующие транзакции связываются с продавцами скриптом scripts/backfill_merchants.py
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_user_merchant', table_name='transactions')
+    op.drop_constraint('transactions_merchant_id_fkey', 'transactions', type_='foreignkey')
+    op.drop_column('transactions', 'merchant_id')
+    op.drop_table('user_merchant_categories')
+    op.drop_index('ix_merchants_key_pattern', table_name='merchants')
+    op.drop_table('merchants')
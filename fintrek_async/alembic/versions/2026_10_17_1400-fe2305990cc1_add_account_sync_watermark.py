@@ -0,0 +1,38 @@
+# alembic/script.py.mako
+"""Add accounts.sync_watermark
+
+Revision ID: fe2305990cc1
+Revises: 45fd1b948e16
+Create Date: 2026-10-17 14:00:08.553190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fe2305990cc1'
+down_revision = '45fd1b948e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('accounts', sa.Column('sync_watermark', sa.DateTime(), nullable=True))
+
+    # Уже синхронизированные счета продолжают с последней полученной от банка транзакции
+    op.execute("""
+        UPDATE accounts
+        SET sync_watermark = latest.transaction_date
+        FROM (
+            SELECT account_id, MAX(transaction_date) AS transaction_date
+            FROM transactions
+            WHERE external_id IS NOT NULL
+            GROUP BY account_id
+        ) AS latest
+        WHERE latest.account_id = accounts.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('accounts', 'sync_watermark')
@@ -0,0 +1,50 @@
+# alembic/script.py.mako
+"""Add sync_jobs table
+
+Revision ID: baefda708435
+Revises: fe2305990cc1
+Create Date: 2026-10-17 15:00:27.184062
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'baefda708435'
+down_revision = 'fe2305990cc1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('sync_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('kind', sa.Enum('BANK_CONNECTION', 'VBANK_ACCOUNTS', 'VBANK_TRANSACTIONS', name='syncjobkind'), nullable=False),
+    sa.Column('params', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('dedupe_key', sa.String(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'SUCCEEDED', 'FAILED', name='syncjobstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_jobs_user_id'), 'sync_jobs', ['user_id'], unique=False)
+    op.create_index('ix_sync_jobs_pending_run_after', 'sync_jobs', ['run_after'], unique=False, postgresql_where=sa.text("status = 'PENDING'"))
+    op.create_index('uq_sync_jobs_active_dedupe_key', 'sync_jobs', ['dedupe_key'], unique=True, postgresql_where=sa.text("status IN ('PENDING', 'RUNNING')"))
+
+
+def downgrade() -> None:
+    op.drop_index('uq_sync_jobs_active_dedupe_key', table_name='sync_jobs')
+    op.drop_index('ix_sync_jobs_pending_run_after', table_name='sync_jobs')
+    op.drop_index(op.f('ix_sync_jobs_user_id'), table_name='sync_jobs')
+    op.drop_table('sync_jobs')
+    sa.Enum(name='syncjobstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='syncjobkind').drop(op.get_bind(), checkfirst=True)
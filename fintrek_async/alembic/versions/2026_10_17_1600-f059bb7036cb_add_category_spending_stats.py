@@ -0,0 +1,65 @@
+# alembic/script.py.mako
+"""Add category_spending_stats table and transactions.is_anomaly
+
+Revision ID: f059bb7036cb
+Revises: baefda708435
+Create Date: 2026-10-17 16:00:41.508217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f059bb7036cb'
+down_revision = 'baefda708435'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('category_spending_stats',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('category_id', sa.UUID(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('m2', sa.Float(), nullable=False),
+    sa.Column('decayed_weight', sa.Float(), nullable=False),
+    sa.Column('decayed_mean', sa.Float(), nullable=False),
+    sa.Column('decayed_m2', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'category_id')
+    )
+    op.add_column('transactions', sa.Column('is_anomaly', sa.Boolean(), nullable=True))
+
+    # Начальная статистика по существующим расходам (период полураспада - 90 дней)
+    op.execute("""
+        INSERT INTO category_spending_stats
+            (user_id, category_id, count, mean, m2, decayed_weight, decayed_mean, decayed_m2, updated_at)
+        SELECT
+            user_id,
+            category_id,
+            count(*),
+            avg(amount),
+            coalesce(var_pop(amount) * count(*), 0),
+            sum(w),
+            sum(w * amount) / sum(w),
+            greatest(sum(w * amount * amount) - sum(w * amount) * sum(w * amount) / sum(w), 0),
+            timezone('utc', now())
+        FROM (
+            SELECT
+                user_id,
+                category_id,
+                amount::float8 AS amount,
+                power(0.5, greatest(extract(epoch FROM timezone('utc', now()) - transaction_date) / (90 * 86400), 0)) AS w
+            FROM transactions
+            WHERE transaction_type = 'EXPENSE' AND category_id IS NOT NULL
+        ) AS weighted
+        GROUP BY user_id, category_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('transactions', 'is_anomaly')
+    op.drop_table('category_spending_stats')
@@ -0,0 +1,45 @@
+# alembic/script.py.mako
+"""Make transaction_daily_rollups key unique for rows without category
+
+Revision ID: 8d2b61f4c0e3
+Revises: f059bb7036cb
+Create Date: 2026-10-17 17:00:18.204611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2b61f4c0e3'
+down_revision = 'f059bb7036cb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_transaction_daily_rollups_key', table_name='transaction_daily_rollups')
+
+    # Параллельные пересчеты могли задвоить строки без категории - пересобрать агрегаты
+    op.execute("DELETE FROM transaction_daily_rollups")
+    op.execute("""
+        INSERT INTO transaction_daily_rollups
+            (user_id, day, category_id, transaction_type,
+             total_amount, tx_count, sum_squares, min_amount, max_amount, updated_at)
+        SELECT user_id, CAST(transaction_date AS DATE), category_id, transaction_type,
+               SUM(amount), COUNT(*), SUM(amount * amount), MIN(amount), MAX(amount), now()
+        FROM transactions
+        GROUP BY user_id, CAST(transaction_date AS DATE), category_id, transaction_type
+    """)
+
+    op.create_index(
+        'ix_transaction_daily_rollups_key',
+        'transaction_daily_rollups',
+        ['user_id', 'day', sa.text("COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid)"), 'transaction_type'],
+        unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transaction_daily_rollups_key', table_name='transaction_daily_rollups')
+    op.create_index('ix_transaction_daily_rollups_key', 'transaction_daily_rollups', ['user_id', 'day', 'category_id', 'transaction_type'], unique=True)
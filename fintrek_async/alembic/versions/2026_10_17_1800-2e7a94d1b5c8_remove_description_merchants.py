@@ -0,0 +1,32 @@
+# alembic/script.py.mako
+"""Remove merchants derived from transaction descriptions
+
+Revision ID: 2e7a94d1b5c8
+Revises: 8d2b61f4c0e3
+Create Date: 2026-10-17 18:00:07.530214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e7a94d1b5c8'
+down_revision = '8d2b61f4c0e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Продавец определялся по описанию, если банк не передал merchant_name:
+    # описания пользователей попадали в общую таблицу merchants
+    op.execute("UPDATE transactions SET merchant_id = NULL WHERE merchant_id IS NOT NULL AND merchant_name IS NULL")
+    op.execute("""
+        DELETE FROM merchants m
+        WHERE NOT EXISTS (SELECT 1 FROM transactions t WHERE t.merchant_id = m.id)
+    """)
+
+
+def downgrade() -> None:
+    # Удаленные данные не восстанавливаются
+    pass
@@ -2,7 +2,7 @@
 Сборка всех роутеров API v1
 """
 from fastapi import APIRouter
-from fintrek_async.app.api.v1.endpoints import auth, accounts, transactions, categories, bank_connections, ai_insights, analytics, users
+from fintrek_async.app.api.v1.endpoints import auth, accounts, transactions, categories, bank_connections, ai_insights, analytics, users, sync_jobs
 from .endpoints import vbank as vbank_router
 
 api_router = APIRouter()
@@ -63,4 +63,11 @@ api_router.include_router(
     tags=["Пользователи"]
 )
 
+# Подключаем роутер фоновых синхронизаций
+api_router.include_router(
+    sync_jobs.router,
+    prefix="/sync-jobs",
+    tags=["Фоновые синхронизации"]
+)
+
 api_router.include_router(vbank_router.router)
\ No newline at end of file
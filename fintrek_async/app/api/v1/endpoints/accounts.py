@@ -3,13 +3,16 @@
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, cast, Date
 from typing import List
 from uuid import UUID
 
 from fintrek_async.app.api.v1.deps import get_db, get_current_user
 from fintrek_async.app.models.user import User
 from fintrek_async.app.models.account import Account
+from fintrek_async.app.models.transaction import Transaction
+from fintrek_async.app.services.rollup_service import rollup_service
+from fintrek_async.app.core.cache import bump_user_data_version
 from fintrek_async.app.schemas.account import (
     AccountCreate,
     AccountUpdate,
@@ -81,6 +84,7 @@ async def create_account(
     
     db.add(account)
     await db.commit()
+    await bump_user_data_version(current_user.id)
     await db.refresh(account)
     
     return account
@@ -113,6 +117,7 @@ async def update_account(
         setattr(account, field, value)
     
     await db.commit()
+    await bump_user_data_version(current_user.id)
     await db.refresh(account)
     
     return account
@@ -138,7 +143,17 @@ async def delete_account(
             detail="Account not found"
         )
     
+    # Транзакции счета удаляются каскадно - агрегаты за их дни нужно пересчитать
+    affected_days = (await db.execute(
+        select(cast(Transaction.transaction_date, Date)).where(
+            Transaction.account_id == account.id
+        ).distinct()
+    )).scalars().all()
+    
     await db.delete(account)
+    await db.flush()
+    await rollup_service.refresh_days(db, current_user.id, affected_days)
     await db.commit()
+    await bump_user_data_version(current_user.id)
     
     return None
@@ -1,32 +1,60 @@
 """
 API эндпоинты для AI-инсайтов и рекомендаций
 """
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from fintrek_async.app.api.v1.deps import get_db, get_current_user
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.db.session import AsyncSessionLocal
 from fintrek_async.app.models.user import User
+from fintrek_async.app.core.cache import bump_user_data_version
 from fintrek_async.app.ml.transaction_categorizer import transaction_categorizer
 from fintrek_async.app.ml.spending_analyzer import spending_analyzer
 from fintrek_async.app.ml.recommendation_engine import recommendation_engine
 from fintrek_async.app.ml.forecasting_model import forecasting_model
+from fintrek_async.app.ml.financial_snapshot import UserFinancialSnapshot
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Сессии БД AI-дашбордов всех запросов процесса: без ограничения несколько
+# одновременных дашбордов исчерпывают пул соединений и блокируют остальные
+# эндпоинты. Загрузка снимка - один запрос без ожидания других сессий,
+# поэтому у нее свой семафор: сессия рекомендаций, ждущая снимок, не может
+# занять все разрешения, нужные загрузке.
+_snapshot_sessions = asyncio.Semaphore(settings.DASHBOARD_DB_CONCURRENCY)
+_recommendation_sessions = asyncio.Semaphore(settings.DASHBOARD_DB_CONCURRENCY)
+
+
+def _limited_session_factory(semaphore: asyncio.Semaphore):
+    """Фабрика сессий, открывающая не больше сессий, чем разрешений у semaphore"""
+    @asynccontextmanager
+    async def session():
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                yield db
+    return session
+
 
 @router.post("/categorize-transactions")
 async def categorize_transactions(
-    limit: int = Query(100, ge=1, le=1000),
+    limit: int = Query(100, ge=1, le=100000),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Автоматически категоризировать некатегоризированные транзакции
+    Автоматически категоризировать некатегоризированные транзакции текущего пользователя
     """
-    count = await transaction_categorizer.batch_categorize(db, limit=limit)
+    count = await transaction_categorizer.batch_categorize(db, user_id=current_user.id, limit=limit)
+    await bump_user_data_version(current_user.id)
     
     return {
         "message": f"Категоризировано {count} транзакций",
@@ -112,6 +140,7 @@ async def get_recurring_payments(
 @router.get("/anomalies")
 async def get_anomalies(
     threshold: float = Query(2.0, ge=1.0, le=5.0),
+    method: str = Query("stddev", pattern="^(stddev|mad|online)$", description="stddev - среднее и σ; mad - медиана и MAD (устойчив к выбросам); online - накопленная статистика категорий"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -119,7 +148,7 @@ async def get_anomalies(
     Получить список аномальных транзакций
     """
     anomalies = await spending_analyzer.detect_anomalies(
-        db, str(current_user.id), threshold_multiplier=threshold
+        db, str(current_user.id), threshold_multiplier=threshold, method=method
     )
     
     return {
@@ -250,34 +279,53 @@ async def get_ai_dashboard(
 ):
     """
     Получить сводную информацию для AI-дашборда
+    
+    Части считаются параллельно по общему снимку данных пользователя:
+    помесячные суммы, расходы по категориям и счета загружаются по одному
+    разу, каждая загрузка - в своей короткой сессии. Собственные запросы
+    есть только у рекомендаций (повторяющиеся платежи, аномалии), им
+    выделяется отдельная сессия; остальные части читают только снимок.
+    Число одновременных сессий дашбордов в процессе ограничено
+    DASHBOARD_DB_CONCURRENCY. Часть, не уложившаяся в
+    DASHBOARD_PART_TIMEOUT_SECONDS или завершившаяся ошибкой, возвращается
+    как null и перечисляется в unavailable.
     """
-    # Собрать все данные
-    health_score = await forecasting_model.calculate_financial_health_score(
-        db, str(current_user.id)
-    )
+    user_id = str(current_user.id)
+    # Сессия запроса частям не нужна - вернуть ее соединение в пул
+    await db.close()
+    snapshot = UserFinancialSnapshot(None, user_id, session_factory=_limited_session_factory(_snapshot_sessions))
+    recommendation_session = _limited_session_factory(_recommendation_sessions)
     
-    recommendations = await recommendation_engine.generate_recommendations(
-        db, str(current_user.id)
-    )
+    async def recommendations():
+        async with recommendation_session() as part_db:
+            return await recommendation_engine.generate_recommendations(part_db, user_id, snapshot)
     
-    trends = await spending_analyzer.get_spending_trends(
-        db, str(current_user.id)
-    )
+    parts = {
+        "financial_health": lambda: forecasting_model.calculate_financial_health_score(None, user_id, snapshot),
+        "recommendations": recommendations,
+        "spending_trends": lambda: spending_analyzer.get_spending_trends(None, user_id, snapshot),
+        "spending_forecast": lambda: forecasting_model.forecast_next_month_spending(None, user_id, snapshot),
+        "income_forecast": lambda: forecasting_model.forecast_next_month_income(None, user_id, snapshot),
+    }
     
-    spending_forecast = await forecasting_model.forecast_next_month_spending(
-        db, str(current_user.id)
-    )
+    async def run_part(name: str, compute):
+        try:
+            return await asyncio.wait_for(compute(), settings.DASHBOARD_PART_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"AI dashboard part {name} timed out for user {user_id}")
+        except Exception as e:
+            logger.error(f"AI dashboard part {name} failed for user {user_id}: {e}")
+        return None
     
-    income_forecast = await forecasting_model.forecast_next_month_income(
-        db, str(current_user.id)
-    )
+    results = dict(zip(parts, await asyncio.gather(*(run_part(name, compute) for name, compute in parts.items()))))
     
     return {
-        "financial_health": health_score,
-        "top_recommendations": recommendations[:3],  # Топ-3 рекомендации
-        "spending_trends": trends,
+        "financial_health": results["financial_health"],
+        "top_recommendations": (results["recommendations"] or [])[:3],  # Топ-3 рекомендации
+        "spending_trends": results["spending_trends"],
         "next_month_forecast": {
-            "spending": spending_forecast,
-            "income": income_forecast
-        }
+            "spending": results["spending_forecast"],
+            "income": results["income_forecast"]
+        },
+        "unavailable": [name for name, result in results.items() if result is None]
     }
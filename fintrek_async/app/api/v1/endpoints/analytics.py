@@ -9,16 +9,18 @@ from datetime import datetime, timedelta
 from fastapi_cache.decorator import cache
 
 from fintrek_async.app.api.v1.deps import get_db, get_current_user
+from fintrek_async.app.core.cache import user_cache_key_builder
 from fintrek_async.app.models.user import User
-from fintrek_async.app.models.transaction import Transaction, TransactionType
+from fintrek_async.app.models.transaction import TransactionType
 from fintrek_async.app.models.category import Category
 from fintrek_async.app.models.account import Account
+from fintrek_async.app.models.transaction_rollup import TransactionDailyRollup
 
 router = APIRouter()
 
 
 @router.get("/spending-by-category")
-@cache(expire=300)  # Кэш на 5 минут
+@cache(expire=300, namespace="analytics", key_builder=user_cache_key_builder)  # Кэш на 5 минут
 async def get_spending_by_category(
     start_date: Optional[datetime] = Query(None, description="Начальная дата"),
     end_date: Optional[datetime] = Query(None, description="Конечная дата"),
@@ -30,6 +32,7 @@ async def get_spending_by_category(
     
     Возвращает агрегированные данные о расходах, сгруппированные по категориям.
     Если даты не указаны, используется последние 30 дней.
+    Данные читаются из дневных агрегатов, поэтому период округляется до целых дней.
     """
     # Установить даты по умолчанию
     if not end_date:
@@ -41,24 +44,21 @@ async def get_spending_by_category(
     stmt = select(
         Category.name.label('category'),
         Category.category_type.label('type'),
-        func.sum(Transaction.amount).label('total'),
-        func.count(Transaction.id).label('count'),
-        func.avg(Transaction.amount).label('average')
+        func.sum(TransactionDailyRollup.total_amount).label('total'),
+        func.sum(TransactionDailyRollup.tx_count).label('count')
     ).join(
-        Transaction, Transaction.category_id == Category.id
-    ).join(
-        Account, Transaction.account_id == Account.id
+        TransactionDailyRollup, TransactionDailyRollup.category_id == Category.id
     ).filter(
         and_(
-            Account.user_id == current_user.id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.transaction_type == TransactionType.EXPENSE
+            TransactionDailyRollup.user_id == current_user.id,
+            TransactionDailyRollup.day >= start_date.date(),
+            TransactionDailyRollup.day <= end_date.date(),
+            TransactionDailyRollup.transaction_type == TransactionType.EXPENSE
         )
     ).group_by(
         Category.id, Category.name, Category.category_type
     ).order_by(
-        func.sum(Transaction.amount).desc()
+        func.sum(TransactionDailyRollup.total_amount).desc()
     )
     
     result = await db.execute(stmt)
@@ -75,8 +75,8 @@ async def get_spending_by_category(
             "category": row.category,
             "type": row.type,
             "total": round(amount, 2),
-            "count": row.count,
-            "average": round(float(row.average), 2)
+            "count": int(row.count),
+            "average": round(amount / row.count, 2) if row.count else 0
         })
     
     # Добавить процентное соотношение
@@ -95,7 +95,7 @@ async def get_spending_by_category(
 
 
 @router.get("/income-vs-expenses")
-@cache(expire=300)  # Кэш на 5 минут
+@cache(expire=300, namespace="analytics", key_builder=user_cache_key_builder)  # Кэш на 5 минут
 async def get_income_vs_expenses(
     months: int = Query(6, ge=1, le=24, description="Количество месяцев"),
     current_user: User = Depends(get_current_user),
@@ -111,25 +111,23 @@ async def get_income_vs_expenses(
     
     # Запрос с группировкой по месяцам и типу транзакции
     stmt = select(
-        extract('year', Transaction.transaction_date).label('year'),
-        extract('month', Transaction.transaction_date).label('month'),
-        Transaction.transaction_type,
-        func.sum(Transaction.amount).label('total')
-    ).join(
-        Account, Transaction.account_id == Account.id
+        extract('year', TransactionDailyRollup.day).label('year'),
+        extract('month', TransactionDailyRollup.day).label('month'),
+        TransactionDailyRollup.transaction_type,
+        func.sum(TransactionDailyRollup.total_amount).label('total')
     ).filter(
         and_(
-            Account.user_id == current_user.id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
+            TransactionDailyRollup.user_id == current_user.id,
+            TransactionDailyRollup.day >= start_date.date(),
+            TransactionDailyRollup.day <= end_date.date()
         )
     ).group_by(
-        extract('year', Transaction.transaction_date),
-        extract('month', Transaction.transaction_date),
-        Transaction.transaction_type
+        extract('year', TransactionDailyRollup.day),
+        extract('month', TransactionDailyRollup.day),
+        TransactionDailyRollup.transaction_type
     ).order_by(
-        extract('year', Transaction.transaction_date),
-        extract('month', Transaction.transaction_date)
+        extract('year', TransactionDailyRollup.day),
+        extract('month', TransactionDailyRollup.day)
     )
     
     result = await db.execute(stmt)
@@ -167,7 +165,7 @@ async def get_income_vs_expenses(
 
 
 @router.get("/account-summary")
-@cache(expire=60)  # Кэш на 1 минуту
+@cache(expire=60, namespace="analytics", key_builder=user_cache_key_builder)  # Кэш на 1 минуту
 async def get_account_summary(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -208,77 +206,85 @@ async def get_account_summary(
     }
 
 
-@router.get("/transaction-statistics")
-@cache(expire=300)  # Кэш на 5 минут
-async def get_transaction_statistics(
-    days: int = Query(30, ge=1, le=365, description="Количество дней"),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
+async def compute_transaction_statistics(db: AsyncSession, user_id, days: int) -> dict:
     """
-    Получить статистику по транзакциям за период
-    
-    Возвращает общее количество транзакций, средние суммы и другие метрики.
+    Статистика транзакций пользователя за последние days дней
+
+    Один запрос с условной агрегацией (FILTER по типу транзакции) поверх
+    дневных агрегатов: в Python возвращается одна строка скаляров,
+    независимо от числа транзакций за период.
     """
     end_date = datetime.utcnow()
     start_date = end_date - timedelta(days=days)
     
-    # Получить все транзакции пользователя за период
-    stmt = select(Transaction).join(
-        Account, Transaction.account_id == Account.id
+    R = TransactionDailyRollup
+    is_income = R.transaction_type == TransactionType.INCOME
+    is_expense = R.transaction_type == TransactionType.EXPENSE
+    
+    stmt = select(
+        func.coalesce(func.sum(R.tx_count), 0).label('total_count'),
+        func.coalesce(func.sum(R.tx_count).filter(is_income), 0).label('income_count'),
+        func.coalesce(func.sum(R.total_amount).filter(is_income), 0).label('income_total'),
+        func.coalesce(func.max(R.max_amount).filter(is_income), 0).label('income_largest'),
+        func.coalesce(func.sum(R.tx_count).filter(is_expense), 0).label('expense_count'),
+        func.coalesce(func.sum(R.total_amount).filter(is_expense), 0).label('expense_total'),
+        func.coalesce(func.max(R.max_amount).filter(is_expense), 0).label('expense_largest')
     ).filter(
         and_(
-            Account.user_id == current_user.id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date
+            R.user_id == user_id,
+            R.day >= start_date.date(),
+            R.day <= end_date.date()
         )
     )
     
-    result = await db.execute(stmt)
-    transactions = result.scalars().all()
+    row = (await db.execute(stmt)).one()
     
     # Вычислить статистику
-    total_count = len(transactions)
-    income_transactions = [t for t in transactions if t.transaction_type == TransactionType.INCOME]
-    expense_transactions = [t for t in transactions if t.transaction_type == TransactionType.EXPENSE]
-    
-    total_income = sum(float(t.amount) for t in income_transactions)
-    total_expenses = sum(float(t.amount) for t in expense_transactions)
+    income_count = int(row.income_count)
+    expense_count = int(row.expense_count)
     
-    avg_income = total_income / len(income_transactions) if income_transactions else 0
-    avg_expense = total_expenses / len(expense_transactions) if expense_transactions else 0
+    total_income = float(row.income_total)
+    total_expenses = float(row.expense_total)
     
-    # Найти самую большую транзакцию
-    largest_expense = max(
-        (float(t.amount) for t in expense_transactions),
-        default=0
-    )
-    largest_income = max(
-        (float(t.amount) for t in income_transactions),
-        default=0
-    )
+    avg_income = total_income / income_count if income_count else 0
+    avg_expense = total_expenses / expense_count if expense_count else 0
     
     return {
         "period_days": days,
-        "total_transactions": total_count,
+        "total_transactions": int(row.total_count),
         "income": {
-            "count": len(income_transactions),
+            "count": income_count,
             "total": round(total_income, 2),
             "average": round(avg_income, 2),
-            "largest": round(largest_income, 2)
+            "largest": round(float(row.income_largest), 2)
         },
         "expenses": {
-            "count": len(expense_transactions),
+            "count": expense_count,
             "total": round(total_expenses, 2),
             "average": round(avg_expense, 2),
-            "largest": round(largest_expense, 2)
+            "largest": round(float(row.expense_largest), 2)
         },
         "net_income": round(total_income - total_expenses, 2)
     }
 
 
+@router.get("/transaction-statistics")
+@cache(expire=300, namespace="analytics", key_builder=user_cache_key_builder)  # Кэш на 5 минут
+async def get_transaction_statistics(
+    days: int = Query(30, ge=1, le=365, description="Количество дней"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получить статистику по транзакциям за период
+    
+    Возвращает общее количество транзакций, средние суммы и другие метрики.
+    """
+    return await compute_transaction_statistics(db, current_user.id, days)
+
+
 @router.get("/daily-spending-trend")
-@cache(expire=600)  # Кэш на 10 минут
+@cache(expire=600, namespace="analytics", key_builder=user_cache_key_builder)  # Кэш на 10 минут
 async def get_daily_spending_trend(
     days: int = Query(30, ge=7, le=90, description="Количество дней"),
     current_user: User = Depends(get_current_user),
@@ -294,21 +300,19 @@ async def get_daily_spending_trend(
     
     # Запрос с группировкой по дням
     stmt = select(
-        func.date(Transaction.transaction_date).label('date'),
-        func.sum(Transaction.amount).label('total')
-    ).join(
-        Account, Transaction.account_id == Account.id
+        TransactionDailyRollup.day.label('date'),
+        func.sum(TransactionDailyRollup.total_amount).label('total')
     ).filter(
         and_(
-            Account.user_id == current_user.id,
-            Transaction.transaction_date >= start_date,
-            Transaction.transaction_date <= end_date,
-            Transaction.transaction_type == TransactionType.EXPENSE
+            TransactionDailyRollup.user_id == current_user.id,
+            TransactionDailyRollup.day >= start_date.date(),
+            TransactionDailyRollup.day <= end_date.date(),
+            TransactionDailyRollup.transaction_type == TransactionType.EXPENSE
         )
     ).group_by(
-        func.date(Transaction.transaction_date)
+        TransactionDailyRollup.day
     ).order_by(
-        func.date(Transaction.transaction_date)
+        TransactionDailyRollup.day
     )
     
     result = await db.execute(stmt)
@@ -14,10 +14,11 @@ from fintrek_async.app.schemas.bank_connection import (
     BankConnectionCreate,
     BankConnectionResponse,
     BankConnectionListResponse,
-    BankConnectionSync,
-    BankConnectionSyncResponse
+    BankConnectionSync
 )
-from fintrek_async.app.services.sync_service import sync_service
+from fintrek_async.app.models.sync_job import SyncJobKind
+from fintrek_async.app.schemas.sync_job import SyncJobResponse
+from fintrek_async.app.services.sync_job_service import sync_job_service
 
 router = APIRouter()
 
@@ -88,14 +89,17 @@ async def create_bank_connection(
     return connection
 
 
-@router.post("/sync", response_model=BankConnectionSyncResponse)
+@router.post("/sync", response_model=SyncJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def sync_bank_connection(
     sync_data: BankConnectionSync,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Синхронизировать данные с банком
+    Поставить синхронизацию с банком в очередь
+    
+    Синхронизация выполняется фоновым воркером; статус и результат
+    (BankConnectionSyncResponse) - GET /sync-jobs/{id}.
     """
     # Проверить что подключение принадлежит пользователю
     connection = (await db.execute(select(BankConnection).where(
@@ -109,14 +113,15 @@ async def sync_bank_connection(
             detail="Bank connection not found"
         )
     
-    # Выполнить синхронизацию
-    result = await sync_service.sync_bank_connection(
-        db=db,
-        connection_id=str(sync_data.connection_id),
-        user_id=str(current_user.id)
+    return await sync_job_service.enqueue(
+        db,
+        user_id=current_user.id,
+        kind=SyncJobKind.BANK_CONNECTION,
+        params={"connection_id": str(connection.id), "backfill_days": sync_data.backfill_days},
+        dedupe_key=sync_job_service.dedupe_key(
+            SyncJobKind.BANK_CONNECTION, connection.id, sync_data.backfill_days
+        )
     )
-    
-    return BankConnectionSyncResponse(**result)
 
 
 @router.delete("/{connection_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,33 @@
+"""
+Эндпоинты фоновых задач синхронизации
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+
+from fintrek_async.app.api.v1.deps import get_db, get_current_user
+from fintrek_async.app.models.user import User
+from fintrek_async.app.schemas.sync_job import SyncJobResponse
+from fintrek_async.app.services.sync_job_service import sync_job_service
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=SyncJobResponse)
+async def get_sync_job(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Получить статус фоновой синхронизации
+    """
+    job = await sync_job_service.get_job(db, job_id, current_user.id)
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sync job not found"
+        )
+    
+    return job
@@ -1,80 +1,296 @@
 """
 Эндпоинты для управления транзакциями
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, delete
-from typing import List, Optional
-from uuid import UUID
+from sqlalchemy import select, and_, or_, func, delete, tuple_
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Set
+from uuid import UUID, uuid4
 from datetime import datetime, timezone
+from enum import Enum
+import csv
+import io
+import json
 
 from fintrek_async.app.api.v1.deps import get_db, get_current_user
+from fintrek_async.app.db.session import AsyncSessionLocal
 from fintrek_async.app.models.user import User
-from fintrek_async.app.models.transaction import Transaction
+from fintrek_async.app.models.transaction import Transaction, TransactionStatus
 from fintrek_async.app.models.account import Account
 from fintrek_async.app.models.category import Category
+from fintrek_async.app.models.merchant import Merchant
 from fintrek_async.app.schemas.transaction import (
     TransactionCreate,
     TransactionUpdate,
     TransactionResponse,
     TransactionListResponse,
-    TransactionFilter
+    TransactionFilter,
+    TransactionBulkResponse
 )
+from fintrek_async.app.services.rollup_service import rollup_service, mark_touched_day
+from fintrek_async.app.services.merchant_service import merchant_service, normalize_merchant
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.cache import bump_user_data_version, get_or_compute_user_value
+from fintrek_async.app.core.pagination import encode_cursor, decode_cursor
+from fintrek_async.app.ml.transaction_categorizer import transaction_categorizer
 
 router = APIRouter()
 
 
+def _to_naive_utc(value: datetime) -> datetime:
+    """Нормализовать datetime для TIMESTAMP WITHOUT TIME ZONE (UTC без tzinfo)"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _apply_transaction_filters(
+    stmt,
+    user_id: UUID,
+    account_id: Optional[UUID],
+    category_id: Optional[UUID],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    q: Optional[str] = None
+):
+    """Применить общие фильтры списка и экспорта транзакций"""
+    stmt = stmt.filter(Transaction.user_id == user_id)
+    
+    if account_id:
+        stmt = stmt.filter(Transaction.account_id == account_id)
+    
+    if category_id:
+        stmt = stmt.filter(Transaction.category_id == category_id)
+    
+    if date_from:
+        stmt = stmt.filter(Transaction.transaction_date >= _to_naive_utc(date_from))
+    
+    if date_to:
+        stmt = stmt.filter(Transaction.transaction_date <= _to_naive_utc(date_to))
+    
+    if q:
+        # ILIKE по подстроке обслуживается GIN-индексами pg_trgm
+        pattern = f"%{_escape_like(q)}%"
+        conditions = [
+            Transaction.description.ilike(pattern, escape="\\"),
+            Transaction.merchant_name.ilike(pattern, escape="\\")
+        ]
+        # Другие написания того же продавца: префикс канонического ключа
+        # (ключ состоит только из [a-z0-9 ], экранирование не нужно)
+        merchant_key = normalize_merchant(q)
+        if merchant_key:
+            conditions.append(Transaction.merchant_id.in_(
+                select(Merchant.id).where(Merchant.key.like(f"{merchant_key}%"))
+            ))
+        stmt = stmt.filter(or_(*conditions))
+    
+    return stmt
+
+
+def _escape_like(value: str) -> str:
+    """Экранировать спецсимволы LIKE в пользовательском запросе"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_rank(q: str):
+    """Релевантность транзакции поисковому запросу (0..1) по описанию и продавцу"""
+    return func.greatest(
+        func.word_similarity(q, func.coalesce(Transaction.description, "")),
+        func.word_similarity(q, func.coalesce(Transaction.merchant_name, ""))
+    )
+
+
 @router.get("/", response_model=TransactionListResponse)
 async def get_transactions(
     account_id: Optional[UUID] = Query(None, description="Фильтр по счету"),
     category_id: Optional[UUID] = Query(None, description="Фильтр по категории"),
     date_from: Optional[datetime] = Query(None, description="Начальная дата"),
     date_to: Optional[datetime] = Query(None, description="Конечная дата"),
-    page: int = Query(1, ge=1, description="Номер страницы"),
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Поиск по описанию и продавцу"),
+    cursor: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    page: int = Query(1, ge=1, description="Номер страницы (игнорируется, если передан cursor)"),
     page_size: int = Query(50, ge=1, le=100, description="Размер страницы"),
+    include_total: bool = Query(True, description="Вернуть общее количество транзакций"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Получить список транзакций с фильтрацией и пагинацией
-    """
-    # Базовый запрос
-    stmt = select(Transaction).filter(
-        Transaction.user_id == current_user.id
-    )
     
-    # Применить фильтры
-    if account_id:
-        stmt = stmt.filter(Transaction.account_id == account_id)
+    Сортировка по (transaction_date desc, id desc). Для листания используйте
+    next_cursor: страница по курсору читается по индексу за постоянное время
+    независимо от глубины. Пагинация по page оставлена для совместимости.
     
-    if category_id:
-        stmt = stmt.filter(Transaction.category_id == category_id)
+    При поиске (q) транзакции сначала сортируются по релевантности
+    (триграммное сходство с описанием или названием продавца).
+    """
+    stmt = _apply_transaction_filters(
+        select(Transaction), current_user.id, account_id, category_id, date_from, date_to, q
+    )
     
-    if date_from:
-        stmt = stmt.filter(Transaction.transaction_date >= date_from)
+    # Общее количество кэшируется до следующего изменения данных пользователя
+    total = None
+    if include_total:
+        async def count_transactions() -> int:
+            count_stmt = select(func.count()).select_from(stmt.subquery())
+            return (await db.execute(count_stmt)).scalar()
+        
+        total = await get_or_compute_user_value(
+            current_user.id,
+            "transactions-count",
+            {
+                "account_id": account_id,
+                "category_id": category_id,
+                "date_from": date_from,
+                "date_to": date_to,
+                "q": q
+            },
+            count_transactions
+        )
     
-    if date_to:
-        stmt = stmt.filter(Transaction.transaction_date <= date_to)
+    # Применить пагинацию и сортировку
+    rank = _search_rank(q) if q else None
+    if rank is not None:
+        stmt = stmt.add_columns(rank.label("rank"))
     
-    # Подсчитать общее количество
-    count_stmt = select(func.count()).select_from(stmt.subquery())
-    count_result = await db.execute(count_stmt)
-    total = count_result.scalar()
+    if cursor:
+        cursor_date, cursor_id, cursor_rank = decode_cursor(cursor)
+        if rank is not None and cursor_rank is not None:
+            stmt = stmt.filter(
+                tuple_(rank, Transaction.transaction_date, Transaction.id)
+                < tuple_(cursor_rank, cursor_date, cursor_id)
+            )
+        else:
+            stmt = stmt.filter(
+                tuple_(Transaction.transaction_date, Transaction.id) < tuple_(cursor_date, cursor_id)
+            )
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
     
-    # Применить пагинацию и сортировку
-    offset = (page - 1) * page_size
-    stmt = stmt.order_by(
-        Transaction.transaction_date.desc()
-    ).offset(offset).limit(page_size)
+    # Лишняя строка показывает, есть ли следующая страница
+    order_by = [Transaction.transaction_date.desc(), Transaction.id.desc()]
+    if rank is not None:
+        order_by.insert(0, rank.desc())
+    stmt = stmt.order_by(*order_by).limit(page_size + 1)
     
     result = await db.execute(stmt)
-    transactions = result.scalars().all()
+    rows = result.all()
+    
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            last.Transaction.transaction_date,
+            last.Transaction.id,
+            last.rank if rank is not None else None
+        )
+    transactions = [row.Transaction for row in rows]
     
     return TransactionListResponse(
         transactions=transactions,
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=next_cursor
+    )
+
+
+# Колонки экспорта в порядке вывода
+_EXPORT_COLUMNS = [
+    Transaction.id,
+    Transaction.account_id,
+    Transaction.category_id,
+    Transaction.transaction_type,
+    Transaction.amount,
+    Transaction.currency,
+    Transaction.description,
+    Transaction.merchant_name,
+    Transaction.notes,
+    Transaction.transaction_date,
+    Transaction.posted_date,
+    Transaction.status,
+    Transaction.external_id,
+]
+_EXPORT_FIELDS = [column.key for column in _EXPORT_COLUMNS]
+
+
+def _export_value(value: Any) -> Any:
+    """Привести значение колонки к JSON/CSV-совместимому виду без pydantic"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)  # UUID, Decimal
+
+
+async def _stream_transactions(stmt, export_format: str) -> AsyncIterator[bytes]:
+    """
+    Отдавать строки экспорта пачками по серверному курсору
+    
+    Использует собственную сессию: сессия зависимости get_db не должна
+    жить, пока клиент читает ответ.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(_EXPORT_FIELDS)
+            yield buffer.getvalue().encode()
+        
+        async for partition in result.partitions():
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([_export_value(value) for value in row] for row in partition)
+                chunk = buffer.getvalue()
+            else:
+                chunk = "".join(
+                    json.dumps(
+                        dict(zip(_EXPORT_FIELDS, (_export_value(value) for value in row))),
+                        ensure_ascii=False
+                    ) + "\n"
+                    for row in partition
+                )
+            yield chunk.encode()
+
+
+@router.get("/export")
+async def export_transactions(
+    format: Literal["csv", "ndjson"] = Query("csv", description="Формат выгрузки"),
+    account_id: Optional[UUID] = Query(None, description="Фильтр по счету"),
+    category_id: Optional[UUID] = Query(None, description="Фильтр по категории"),
+    date_from: Optional[datetime] = Query(None, description="Начальная дата"),
+    date_to: Optional[datetime] = Query(None, description="Конечная дата"),
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Поиск по описанию и продавцу"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Выгрузить транзакции в CSV или NDJSON
+    
+    Поддерживает те же фильтры, что и список транзакций. Строки читаются
+    серверным курсором и отправляются потоком, поэтому потребление памяти
+    не зависит от объема истории.
+    """
+    stmt = _apply_transaction_filters(
+        select(*_EXPORT_COLUMNS), current_user.id, account_id, category_id, date_from, date_to, q
+    ).order_by(
+        Transaction.transaction_date.desc(),
+        Transaction.id.desc()
+    )
+    
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"transactions-{datetime.utcnow():%Y%m%d}.{format}"
+    return StreamingResponse(
+        _stream_transactions(stmt, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
@@ -141,10 +357,7 @@ async def create_transaction(
             )
     
     # Нормализуем datetime - убираем timezone для совместимости с TIMESTAMP WITHOUT TIME ZONE
-    transaction_date = transaction_data.transaction_date
-    if transaction_date.tzinfo is not None:
-        # Если datetime имеет timezone, преобразуем в UTC и убираем timezone info
-        transaction_date = transaction_date.astimezone(timezone.utc).replace(tzinfo=None)
+    transaction_date = _to_naive_utc(transaction_data.transaction_date)
     
     transaction = Transaction(
         user_id=current_user.id,
@@ -160,13 +373,231 @@ async def create_transaction(
         related_account_id=transaction_data.related_account_id
     )
     
+    # Продавец; категория из памяти, если не указана явно
+    await merchant_service.assign(db, current_user.id, [transaction])
+    if transaction_data.category_id and transaction.merchant_id:
+        await merchant_service.remember_user_categories(
+            db, current_user.id, {transaction.merchant_id: transaction_data.category_id}
+        )
+    
     db.add(transaction)
+    await db.flush()
+    await rollup_service.refresh_days(db, current_user.id, [transaction_date.date()])
     await db.commit()
+    await bump_user_data_version(current_user.id)
     await db.refresh(transaction)
     
     return transaction
 
 
+# Колонки COPY при массовом импорте
+_BULK_COLUMNS = [
+    "id",
+    "user_id",
+    "account_id",
+    "category_id",
+    "merchant_id",
+    "transaction_type",
+    "amount",
+    "currency",
+    "description",
+    "merchant_name",
+    "notes",
+    "transaction_date",
+    "related_account_id",
+    "status",
+    "created_at",
+    "updated_at",
+]
+
+
+async def _read_bulk_items(request: Request) -> List[Any]:
+    """
+    Прочитать тело массового импорта: JSON-массив или NDJSON (строка = объект)
+    
+    Некорректная строка NDJSON не прерывает импорт: вместо объекта
+    возвращается исключение, которое попадет в результат этой строки.
+    """
+    content_type = request.headers.get("content-type", "")
+    items: List[Any] = []
+    
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    items.append(_parse_ndjson_line(line))
+            if len(items) > settings.BULK_MAX_ROWS:
+                break
+        if buffer.strip():
+            items.append(_parse_ndjson_line(buffer))
+    else:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Request body must be a JSON array or NDJSON"
+            )
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Request body must be a JSON array of transactions"
+            )
+    
+    if len(items) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many rows, maximum is {settings.BULK_MAX_ROWS}"
+        )
+    return items
+
+
+def _parse_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+
+@router.post("/bulk", response_model=TransactionBulkResponse)
+async def create_transactions_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Массовый импорт транзакций
+    
+    Принимает JSON-массив объектов TransactionCreate или NDJSON
+    (Content-Type: application/x-ndjson). Принадлежность счетов и категорий
+    проверяется одним запросом на весь импорт, корректные строки вставляются
+    пачками через COPY в одной транзакции БД. Для каждой строки
+    возвращается результат: ID созданной транзакции или причина отказа.
+    """
+    items = await _read_bulk_items(request)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    
+    # Валидация схемы
+    parsed: Dict[int, TransactionCreate] = {}
+    for index, item in enumerate(items):
+        if isinstance(item, Exception):
+            results[index] = {"index": index, "status": "error", "error": f"Invalid JSON: {item}"}
+            continue
+        try:
+            parsed[index] = TransactionCreate.model_validate(item)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            results[index] = {"index": index, "status": "error", "error": errors}
+    
+    # Проверка счетов и категорий: один запрос на каждое множество ID
+    account_ids: Set[UUID] = set()
+    category_ids: Set[UUID] = set()
+    for data in parsed.values():
+        account_ids.add(data.account_id)
+        if data.related_account_id:
+            account_ids.add(data.related_account_id)
+        if data.category_id:
+            category_ids.add(data.category_id)
+    
+    owned_accounts: Set[UUID] = set()
+    if account_ids:
+        owned_accounts = set((await db.execute(select(Account.id).where(
+            Account.id.in_(account_ids),
+            Account.user_id == current_user.id
+        ))).scalars().all())
+    
+    allowed_categories: Set[UUID] = set()
+    if category_ids:
+        allowed_categories = set((await db.execute(select(Category.id).where(
+            Category.id.in_(category_ids),
+            or_(Category.user_id == current_user.id, Category.is_system == True)
+        ))).scalars().all())
+    
+    # Продавцы и запомненные категории: по одному запросу на пачку ключей
+    merchant_ids = await merchant_service.resolve(
+        db, (data.merchant_name for data in parsed.values())
+    )
+    merchant_categories = await merchant_service.lookup_categories(db, current_user.id, merchant_ids.values())
+    user_choices: Dict[UUID, UUID] = {}
+    
+    rows: List[tuple] = []
+    touched = {}
+    now = datetime.utcnow()
+    for index, data in parsed.items():
+        if data.account_id not in owned_accounts:
+            error = f"Account with id {data.account_id} not found or does not belong to current user"
+        elif data.related_account_id and data.related_account_id not in owned_accounts:
+            error = f"Related account with id {data.related_account_id} not found or does not belong to current user"
+        elif data.category_id and data.category_id not in allowed_categories:
+            error = f"Category with id {data.category_id} not found"
+        else:
+            error = None
+        
+        if error:
+            results[index] = {"index": index, "status": "error", "error": error}
+            continue
+        
+        transaction_date = _to_naive_utc(data.transaction_date)
+        merchant_id = merchant_ids.get(data.merchant_name)
+        category_id = data.category_id
+        if merchant_id and category_id:
+            user_choices[merchant_id] = category_id
+        elif merchant_id:
+            category_id = merchant_categories.get(merchant_id)
+        
+        row_id = uuid4()
+        # Порядок значений соответствует _BULK_COLUMNS; enum передаются именами, как их хранит PostgreSQL
+        rows.append((
+            row_id,
+            current_user.id,
+            data.account_id,
+            category_id,
+            merchant_id,
+            data.transaction_type.name,
+            data.amount,
+            data.currency,
+            data.description,
+            data.merchant_name,
+            data.notes,
+            transaction_date,
+            data.related_account_id,
+            TransactionStatus.COMPLETED.name,
+            now,
+            now
+        ))
+        mark_touched_day(touched, current_user.id, transaction_date)
+        results[index] = {"index": index, "status": "created", "id": row_id}
+    
+    # Вставка пачками через COPY в соединении текущей сессии (та же транзакция БД)
+    if rows:
+        connection = await db.connection()
+        raw_connection = (await connection.get_raw_connection()).driver_connection
+        chunk_size = settings.BULK_INSERT_CHUNK_SIZE
+        for start in range(0, len(rows), chunk_size):
+            await raw_connection.copy_records_to_table(
+                Transaction.__tablename__,
+                columns=_BULK_COLUMNS,
+                records=rows[start:start + chunk_size]
+            )
+    
+    if rows:
+        await merchant_service.remember_user_categories(db, current_user.id, user_choices)
+        await rollup_service.refresh_touched(db, touched)
+        await db.commit()
+        await bump_user_data_version(current_user.id)
+    
+    return {
+        "created": len(rows),
+        "failed": len(items) - len(rows),
+        "results": results
+    }
+
+
 @router.patch("/{transaction_id}", response_model=TransactionResponse)
 async def update_transaction(
     transaction_id: UUID,
@@ -195,6 +626,7 @@ async def update_transaction(
     update_data = transaction_data.model_dump(exclude_unset=True)
     
     # Если указан category_id, проверить что категория существует
+    category = None
     if 'category_id' in update_data and update_data['category_id'] is not None:
         category = (await db.execute(select(Category).where(
             Category.id == update_data['category_id'],
@@ -210,10 +642,31 @@ async def update_transaction(
                 detail=f"Category with id {update_data['category_id']} not found or not accessible"
             )
     
+    # Ручная смена категории - пример для дообучения модели категоризации
+    category_corrected = category is not None and transaction.category_id != category.id
+    
     for field, value in update_data.items():
         setattr(transaction, field, value)
     
+    # Запомнить выбор пользователя для этого продавца
+    if category_corrected and transaction.merchant_id:
+        await merchant_service.remember_user_categories(
+            db, current_user.id, {transaction.merchant_id: category.id}
+        )
+    
+    # Категория входит в ключ дневных агрегатов
+    if 'category_id' in update_data:
+        # Аномальность оценивается по статистике категории - переоценить
+        transaction.is_anomaly = None
+        await db.flush()
+        await rollup_service.refresh_days(db, current_user.id, [transaction.transaction_date.date()])
+    
     await db.commit()
+    await bump_user_data_version(current_user.id)
+    
+    if category_corrected:
+        transaction_categorizer.learn_correction(transaction.description, transaction.merchant_name, category)
+    
     await db.refresh(transaction)
     
     return transaction
@@ -239,7 +692,11 @@ async def delete_transaction(
             detail="Transaction not found"
         )
     
+    transaction_day = transaction.transaction_date.date()
     await db.delete(transaction)
+    await db.flush()
+    await rollup_service.refresh_days(db, current_user.id, [transaction_day])
     await db.commit()
+    await bump_user_data_version(current_user.id)
     
     return None
@@ -1,38 +1,61 @@
-from fastapi import APIRouter, Depends, Query, Request
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
 from fintrek_async.app.api.v1.deps import get_current_user
 from fintrek_async.app.db.session import get_db
-from fintrek_async.app.services.vbank_import import VBankImportService
+from fintrek_async.app.models.account import Account
+from fintrek_async.app.models.sync_job import SyncJobKind
+from fintrek_async.app.schemas.sync_job import SyncJobResponse
+from fintrek_async.app.services.sync_job_service import sync_job_service
 
 router = APIRouter(prefix="/vbank", tags=["vbank"])
 limiter = Limiter(key_func=get_remote_address)
 
-@router.post("/sync-accounts")
+@router.post("/sync-accounts", response_model=SyncJobResponse, status_code=status.HTTP_202_ACCEPTED)
 @limiter.limit("10/minute")  # Ограничение для дорогих операций с внешним API
 async def sync_accounts(
     request: Request,
     current_user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    svc = VBankImportService()
-    await svc.fetch_accounts(db, user_id=current_user.id)
-    await db.commit()
-    return {"status": "ok"}
+    # загрузка выполняется фоновым воркером, статус - GET /sync-jobs/{id}
+    return await sync_job_service.enqueue(
+        db,
+        user_id=current_user.id,
+        kind=SyncJobKind.VBANK_ACCOUNTS,
+        params={},
+        dedupe_key=sync_job_service.dedupe_key(SyncJobKind.VBANK_ACCOUNTS, current_user.id),
+    )
 
-@router.post("/sync-transactions")
+@router.post("/sync-transactions", response_model=SyncJobResponse, status_code=status.HTTP_202_ACCEPTED)
 @limiter.limit("10/minute")  # Ограничение для дорогих операций с внешним API
 async def sync_transactions(
     request: Request,
-    account_id: str = Query(..., description="external account id из VBank"),
+    account_id: Optional[UUID] = Query(None, description="ID счета; если не указан - все VBank-счета пользователя"),
     date_from: str | None = Query(None),
     date_to: str | None = Query(None),
     current_user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    svc = VBankImportService()
-    await svc.fetch_transactions(db, user_id=current_user.id, account_id=account_id, date_from=date_from, date_to=date_to)
-    await db.commit()
-    return {"status": "ok"}
+    if account_id:
+        account = await db.scalar(
+            select(Account.id).where(Account.id == account_id, Account.user_id == current_user.id)
+        )
+        if not account:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Account not found")
+    # без account_id воркер запрашивает все VBank-счета параллельно
+    return await sync_job_service.enqueue(
+        db,
+        user_id=current_user.id,
+        kind=SyncJobKind.VBANK_TRANSACTIONS,
+        params={"account_id": str(account_id) if account_id else None, "date_from": date_from, "date_to": date_to},
+        dedupe_key=sync_job_service.dedupe_key(
+            SyncJobKind.VBANK_TRANSACTIONS, current_user.id, account_id or "all", f"{date_from or ''}..{date_to or ''}"
+        ),
+    )
@@ -0,0 +1,66 @@
+"""
+Общие HTTP-клиенты с пулом keep-alive соединений для внешних банковских API
+"""
+import asyncio
+import weakref
+from typing import Dict
+
+import httpx
+import logging
+
+from fintrek_async.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientPool:
+    """
+    Один долгоживущий httpx.AsyncClient на базовый URL банка
+
+    Соединения переиспользуются между вызовами, поэтому TCP+TLS рукопожатие
+    выполняется один раз на соединение, а не на каждый запрос. Клиенты
+    создаются при старте приложения (lifespan) или лениво при первом
+    обращении (скрипты, фоновые задачи) и закрываются через aclose().
+    Соединения httpx привязаны к циклу событий, поэтому клиенты хранятся
+    отдельно для каждого цикла.
+    """
+
+    def __init__(self):
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _create(self, base_url: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+        )
+        options = dict(base_url=base_url, limits=limits, timeout=settings.HTTP_TIMEOUT_SECONDS)
+        if settings.HTTP2_ENABLED:
+            try:
+                return httpx.AsyncClient(http2=True, **options)
+            except ImportError:
+                # HTTP/2 требует пакет h2 (httpx[http2])
+                logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+        return httpx.AsyncClient(**options)
+
+    def client(self, base_url: str) -> httpx.AsyncClient:
+        """Общий клиент для базового URL (создается при первом обращении)"""
+        base_url = base_url.rstrip("/")
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(base_url)
+        if client is None or client.is_closed:
+            client = clients[base_url] = self._create(base_url)
+            logger.info(f"HTTP client created for {base_url}")
+        return client
+
+    async def aclose(self) -> None:
+        """Закрыть клиенты текущего цикла событий"""
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+
+# Singleton instance
+http_client_pool = HTTPClientPool()
@@ -0,0 +1,215 @@
+"""
+Повторы с экспоненциальной задержкой и circuit breaker для банковских API
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+import logging
+
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.exceptions import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker одного банковского API
+
+    Учитывает исходы последних BANK_BREAKER_WINDOW запросов. Когда доля
+    ошибок (таймауты, ошибки соединения, 5xx) достигает
+    BANK_BREAKER_FAILURE_RATIO, breaker размыкается: запросы к банку
+    BANK_BREAKER_OPEN_SECONDS секунд сразу завершаются CircuitOpenError,
+    вместо того чтобы каждая синхронизация ждала полный таймаут. Затем
+    пропускается один пробный запрос: успех замыкает breaker, ошибка
+    размыкает снова.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=settings.BANK_BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < settings.BANK_BREAKER_OPEN_SECONDS:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record(self, success: bool) -> None:
+        """Учесть исход запроса"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if success:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                logger.info(f"Circuit breaker {self.name} closed")
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if (
+            self.state == self.CLOSED
+            and len(self._outcomes) >= settings.BANK_BREAKER_MIN_CALLS
+            and failures / len(self._outcomes) >= settings.BANK_BREAKER_FAILURE_RATIO
+        ):
+            self._open()
+
+    def release(self) -> None:
+        """Освободить пробный запрос, исход которого неизвестен (запрос отменен)"""
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        _metrics[self.name]["breaker_opened"] += 1
+        logger.warning(f"Circuit breaker {self.name} opened for {settings.BANK_BREAKER_OPEN_SECONDS} s")
+
+
+# Breaker на банк, общий для процесса (без примитивов asyncio - не привязан к циклу событий)
+_breakers: Dict[str, CircuitBreaker] = {}
+
+# Счетчики повторов и срабатываний breaker по банкам
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def circuit_breaker(provider: str) -> CircuitBreaker:
+    """Circuit breaker банковского API (создается при первом обращении)"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = _breakers[provider] = CircuitBreaker(provider)
+    return breaker
+
+
+def get_resilience_stats() -> Dict[str, Any]:
+    """
+    Состояние breaker и счетчики повторов по банкам
+
+    Returns:
+        {банк: {"state": ..., "retries": ..., ...}}
+    """
+    providers = set(_breakers) | set(_metrics)
+    return {
+        provider: {
+            "state": _breakers[provider].state if provider in _breakers else CircuitBreaker.CLOSED,
+            **_metrics[provider]
+        }
+        for provider in sorted(providers)
+    }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Задержка из заголовка Retry-After (секунды или HTTP-дата)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _backoff(attempt: int) -> float:
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 1)"""
+    cap = min(settings.BANK_RETRY_MAX_DELAY_SECONDS, settings.BANK_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+
+async def send_with_retry(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    *,
+    provider: str,
+    idempotent: bool = True,
+    **kwargs
+) -> httpx.Response:
+    """
+    Выполнить запрос к банку через circuit breaker, повторяя временные ошибки
+
+    Идемпотентные запросы повторяются до BANK_RETRY_MAX_ATTEMPTS раз после
+    таймаута, ошибки соединения, 429 и 5xx. На 429/503 выдерживается
+    Retry-After (не больше BANK_RETRY_MAX_DELAY_SECONDS), иначе -
+    экспоненциальная задержка с джиттером. Неидемпотентные запросы
+    (выдача токенов) отправляются один раз, но тоже через breaker.
+
+    Returns:
+        Последний ответ банка (проверка статуса - на вызывающей стороне)
+
+    Raises:
+        CircuitOpenError: Breaker банка разомкнут
+        httpx.RequestError: Ошибка соединения/таймаут после всех попыток
+    """
+    breaker = circuit_breaker(provider)
+    metrics = _metrics[provider]
+    attempts = settings.BANK_RETRY_MAX_ATTEMPTS if idempotent else 1
+
+    for attempt in range(1, attempts + 1):
+        if not breaker.allow():
+            metrics["rejected"] += 1
+            raise CircuitOpenError(
+                f"{provider} API is unavailable, requests are paused",
+                status_code=503,
+                details={"provider": provider}
+            )
+
+        metrics["requests"] += 1
+        try:
+            response = await client.request(method, url, **kwargs)
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            breaker.record(False)
+            if attempt == attempts:
+                raise
+            reason = "timeout" if isinstance(e, httpx.TimeoutException) else "connection"
+            delay = _backoff(attempt)
+        except asyncio.CancelledError:
+            # Отмена вызывающей стороной (таймаут, gather) - не отказ банка, но пробный
+            # запрос нужно освободить, иначе breaker в half_open не пропустит следующий
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False)
+            raise
+        else:
+            # 429 - ограничение частоты, а не отказ банка: breaker не размыкаем
+            breaker.record(response.status_code < 500)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == attempts:
+                return response
+            reason = str(response.status_code)
+            delay = _retry_after(response) if response.status_code in (429, 503) else None
+            delay = min(delay, settings.BANK_RETRY_MAX_DELAY_SECONDS) if delay is not None else _backoff(attempt)
+
+        metrics["retries"] += 1
+        metrics[f"retries_{reason}"] += 1
+        logger.warning(f"{provider} {method} {url}: {reason}, retry {attempt}/{attempts - 1} in {delay:.2f} s")
+        await asyncio.sleep(delay)
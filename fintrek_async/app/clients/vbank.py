@@ -5,7 +5,9 @@ from typing import Any, Dict, Optional
 
 import httpx
 from fintrek_async.app.core.config import settings
-from fintrek_async.app.core.exceptions import VBankAPIError
+from fintrek_async.app.core.exceptions import ExternalAPIError, VBankAPIError
+from fintrek_async.app.clients.http_pool import http_client_pool
+from fintrek_async.app.clients.resilience import send_with_retry
 import logging
 
 logger = logging.getLogger(__name__)
@@ -37,7 +39,11 @@ class VBankAuth:
                 payload = {
                     "bank": self.bank_code,
                 }
-                resp = await http.post(f"{self.base_url}/auth/bank-token", params=params, json=payload, timeout=20.0)
+                # выдача токена не идемпотентна - без повторов, но через circuit breaker
+                resp = await send_with_retry(
+                    http, "POST", f"{self.base_url}/auth/bank-token",
+                    provider=self.bank_code, idempotent=False, params=params, json=payload, timeout=20.0
+                )
                 resp.raise_for_status()
                 data = resp.json()
                 # типичные поля: access_token / expires_in
@@ -67,6 +73,9 @@ class VBankAuth:
                     status_code=503,
                     details={"error": str(e)}
                 )
+            except ExternalAPIError:
+                # breaker разомкнут - отдаем как есть
+                raise
             except Exception as e:
                 logger.error(f"Unexpected VBank auth error: {e}")
                 raise VBankAPIError(
@@ -78,8 +87,13 @@ class VBankAuth:
 class VBankClient:
     def __init__(self, base_url: str, client_id: str, client_secret: str, bank_code: str):
         self.base_url = base_url.rstrip("/")
+        self.bank_code = bank_code
         self._auth = VBankAuth(base_url, client_id, client_secret, bank_code)
-        self._http = httpx.AsyncClient(base_url=self.base_url, timeout=30.0)
+
+    @property
+    def _http(self) -> httpx.AsyncClient:
+        # общий клиент с пулом keep-alive соединений (закрывается при остановке приложения)
+        return http_client_pool.client(self.base_url)
 
     async def _headers(self) -> Dict[str, str]:
         token = await self._auth.token(self._http)
@@ -89,7 +103,8 @@ class VBankClient:
         try:
             # примерный путь — в sandbox обычно /accounts или /client/accounts
             # если у них другой — поправим одну строку тут, без касания остального кода
-            r = await self._http.get("/accounts", headers=await self._headers())
+            # GET идемпотентен: временные ошибки повторяются с задержкой
+            r = await send_with_retry(self._http, "GET", "/accounts", provider=self.bank_code, headers=await self._headers())
             r.raise_for_status()
             return r.json()
             
@@ -106,6 +121,8 @@ class VBankClient:
                 "VBank API timeout while fetching accounts",
                 status_code=504
             )
+        except ExternalAPIError:
+            raise
         except Exception as e:
             logger.error(f"VBank get_accounts error: {e}")
             raise VBankAPIError(f"Error fetching accounts: {str(e)}")
@@ -116,7 +133,10 @@ class VBankClient:
             if date_from: params["dateFrom"] = date_from
             if date_to: params["dateTo"] = date_to
             # частый профиль: /accounts/{id}/transactions
-            r = await self._http.get(f"/accounts/{account_id}/transactions", params=params, headers=await self._headers())
+            r = await send_with_retry(
+                self._http, "GET", f"/accounts/{account_id}/transactions",
+                provider=self.bank_code, params=params, headers=await self._headers()
+            )
             r.raise_for_status()
             return r.json()
             
@@ -133,12 +153,15 @@ class VBankClient:
                 "VBank API timeout while fetching transactions",
                 status_code=504
             )
+        except ExternalAPIError:
+            raise
         except Exception as e:
             logger.error(f"VBank get_transactions error: {e}")
             raise VBankAPIError(f"Error fetching transactions: {str(e)}")
 
     async def aclose(self):
-        await self._http.aclose()
+        # соединения принадлежат общему пулу, их закрывает http_client_pool.aclose()
+        pass
 
 
 class MockVBankClient:
@@ -1,9 +1,18 @@
 """
 Настройка Redis для кэширования
 """
+import hashlib
+import json
+from datetime import date, datetime, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from uuid import UUID
+
 import redis.asyncio as redis
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
+from starlette.requests import Request
+from starlette.responses import Response
 from fintrek_async.app.core.config import settings
 import logging
 
@@ -12,6 +21,28 @@ logger = logging.getLogger(__name__)
 # Флаг для отслеживания состояния кэша
 _cache_enabled = False
 
+# Клиент Redis, общий для бэкенда кэша, версий данных и счетчиков
+_redis_client: Optional[redis.Redis] = None
+
+# Ключи служебных значений в Redis
+DATA_VERSION_KEY = "fintrek-data-version:{user_id}"
+CACHE_STATS_KEY = "fintrek-cache-stats"
+
+# Параметры эндпоинтов, которые не должны попадать в ключ кэша
+_NON_KEY_PARAMS = {"db", "current_user", "request", "response"}
+
+
+class CountingRedisBackend(RedisBackend):
+    """Redis-бэкенд fastapi_cache, считающий попадания и промахи кэша"""
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        ttl, cached = await super().get_with_ttl(key)
+        try:
+            await self.redis.hincrby(CACHE_STATS_KEY, "hits" if cached is not None else "misses", 1)
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to update cache stats: {e}")
+        return ttl, cached
+
 
 async def init_cache():
     """
@@ -19,7 +50,7 @@ async def init_cache():
     
     Если Redis недоступен, приложение продолжит работу без кэширования
     """
-    global _cache_enabled
+    global _cache_enabled, _redis_client
     
     try:
         redis_client = redis.from_url(
@@ -33,7 +64,8 @@ async def init_cache():
         # Проверяем подключение
         await redis_client.ping()
         
-        FastAPICache.init(RedisBackend(redis_client), prefix="fintrek-cache:")
+        FastAPICache.init(CountingRedisBackend(redis_client), prefix="fintrek-cache:")
+        _redis_client = redis_client
         _cache_enabled = True
         logger.info("✅ Redis cache initialized successfully")
         
@@ -51,16 +83,21 @@ async def init_cache():
 async def close_cache():
     """
     Закрытие соединения с Redis при остановке приложения
+    
+    Содержимое кэша не удаляется: Redis общий для всех процессов API и
+    воркеров, перезапуск одного процесса не должен сбрасывать кэш остальных.
     """
-    global _cache_enabled
+    global _cache_enabled, _redis_client
     
-    if not _cache_enabled:
+    if not _cache_enabled or _redis_client is None:
         logger.info("Cache was not enabled, skipping close")
         return
     
     try:
-        await FastAPICache.clear()
-        logger.info("✅ Redis cache closed successfully")
+        await _redis_client.aclose()
+        _redis_client = None
+        _cache_enabled = False
+        logger.info("✅ Redis cache connection closed successfully")
     except Exception as e:
         logger.error(f"❌ Error closing Redis cache: {e}")
 
@@ -73,3 +110,145 @@ def is_cache_enabled() -> bool:
         True если Redis доступен, False если работаем без кэша
     """
     return _cache_enabled
+
+
+def _normalize_param(value: Any) -> str:
+    """Привести значение параметра запроса к каноническому строковому виду"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        # Одинаковый момент времени в разных часовых поясах дает один ключ
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return str(value.value)
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+async def get_user_data_version(user_id: UUID) -> int:
+    """
+    Получить текущую версию данных пользователя
+
+    Версия входит в ключ кэша аналитики: после ее увеличения
+    старые записи кэша больше не читаются и истекают по TTL.
+    """
+    if not _cache_enabled or _redis_client is None:
+        return 0
+    try:
+        value = await _redis_client.get(DATA_VERSION_KEY.format(user_id=user_id))
+        return int(value) if value else 0
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to read data version for user {user_id}: {e}")
+        return 0
+
+
+async def bump_user_data_version(user_id: UUID) -> None:
+    """
+    Инвалидировать кэш аналитики пользователя
+
+    Вызывается после commit() любых изменений транзакций и счетов
+    (ручной CRUD и синхронизация с банками).
+    """
+    if not _cache_enabled or _redis_client is None:
+        return
+    try:
+        await _redis_client.incr(DATA_VERSION_KEY.format(user_id=user_id))
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to bump data version for user {user_id}: {e}")
+
+
+async def user_cache_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: Tuple[Any, ...],
+    kwargs: Dict[str, Any],
+) -> str:
+    """
+    Построитель ключей кэша для пользовательских эндпоинтов
+
+    Ключ строится из ID текущего пользователя, версии его данных и
+    нормализованных параметров запроса. Сессия БД и объект пользователя
+    в ключ не попадают, поэтому одинаковые запросы одного пользователя
+    получают один и тот же ключ.
+    """
+    current_user = kwargs.get("current_user")
+    user_id = getattr(current_user, "id", None)
+    version = await get_user_data_version(user_id) if user_id is not None else 0
+
+    params = "&".join(
+        f"{name}={_normalize_param(value)}"
+        for name, value in sorted(kwargs.items())
+        if name not in _NON_KEY_PARAMS
+    )
+    params_hash = hashlib.md5(params.encode()).hexdigest()
+
+    return f"{namespace}:{func.__module__}:{func.__name__}:{user_id}:v{version}:{params_hash}"
+
+
+async def get_cache_stats() -> Dict[str, Any]:
+    """
+    Счетчики попаданий и промахов кэша (суммарно по всем воркерам)
+
+    Returns:
+        Словарь с hits, misses и hit_rate
+    """
+    hits = misses = 0
+    if _cache_enabled and _redis_client is not None:
+        try:
+            stats = await _redis_client.hgetall(CACHE_STATS_KEY)
+            hits = int(stats.get("hits", 0))
+            misses = int(stats.get("misses", 0))
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to read cache stats: {e}")
+
+    total = hits + misses
+    return {
+        "enabled": _cache_enabled,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0
+    }
+
+
+async def get_or_compute_user_value(
+    user_id: UUID,
+    name: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Awaitable[Any]],
+    expire: int = 300,
+) -> Any:
+    """
+    Получить значение из кэша или вычислить и сохранить его
+
+    Ключ включает версию данных пользователя, поэтому значение
+    инвалидируется теми же вызовами bump_user_data_version.
+    Значение должно сериализоваться в JSON. Без Redis просто вычисляется.
+    """
+    if not _cache_enabled or _redis_client is None:
+        return await compute()
+
+    version = await get_user_data_version(user_id)
+    raw = "&".join(f"{k}={_normalize_param(v)}" for k, v in sorted(params.items()))
+    key = f"fintrek-user-value:{name}:{user_id}:v{version}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+    try:
+        cached = await _redis_client.get(key)
+        if cached is not None:
+            return json.loads(cached)
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to read cached value {name}: {e}")
+
+    value = await compute()
+    try:
+        await _redis_client.set(key, json.dumps(value), ex=expire)
+    except Exception as e:
+        logger.warning(f"⚠️  Failed to cache value {name}: {e}")
+    return value
@@ -0,0 +1,51 @@
+"""
+Ограничение параллельных запросов к внешним банковским API
+"""
+import asyncio
+import weakref
+from typing import Dict
+
+from fintrek_async.app.core.config import settings
+
+# Семафоры привязаны к циклу событий, поэтому хранятся отдельно для каждого цикла
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Блокировки живут, пока их кто-то держит или ждет (слабые ссылки на значения)
+_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, weakref.WeakValueDictionary]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def bank_semaphore(bank: str) -> asyncio.Semaphore:
+    """
+    Общий для процесса семафор запросов к банку
+
+    Ограничивает число одновременных запросов ко всем счетам банка,
+    в том числе из параллельных синхронизаций разных пользователей.
+    Лимит - BANK_FETCH_CONCURRENCY или значение из BANK_FETCH_CONCURRENCY_OVERRIDES.
+    """
+    loop_semaphores = _semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = loop_semaphores.get(bank)
+    if semaphore is None:
+        limit = settings.BANK_FETCH_CONCURRENCY_OVERRIDES.get(bank, settings.BANK_FETCH_CONCURRENCY)
+        semaphore = loop_semaphores[bank] = asyncio.Semaphore(max(limit, 1))
+    return semaphore
+
+
+def keyed_lock(key: str) -> asyncio.Lock:
+    """
+    Блокировка процесса по ключу (например, одно обновление токена на подключение)
+
+    Согласует только корутины одного процесса; между процессами
+    дополнительно нужна advisory-блокировка PostgreSQL.
+    """
+    loop_locks = _locks.get(asyncio.get_running_loop())
+    if loop_locks is None:
+        loop_locks = _locks[asyncio.get_running_loop()] = weakref.WeakValueDictionary()
+    lock = loop_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        loop_locks[key] = lock
+    return lock
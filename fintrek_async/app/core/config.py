@@ -4,7 +4,7 @@
 """
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     """Настройки приложения"""
@@ -28,6 +28,29 @@ class Settings(BaseSettings):
     VBANK_CLIENT_SECRET: str = Field(default="", description="VBank client secret")
     VBANK_BANK_CODE: str = Field(default="VBank", description="Код банка VBank")
     
+    # Параллельная загрузка счетов при синхронизации
+    BANK_FETCH_CONCURRENCY: int = Field(default=4, description="Максимум одновременных запросов к одному банку")
+    BANK_FETCH_CONCURRENCY_OVERRIDES: Dict[str, int] = Field(
+        default_factory=dict,
+        description="Лимит одновременных запросов для отдельных банков: {название банка: лимит}"
+    )
+    
+    # HTTP-клиенты банковских API (общий пул соединений на базовый URL)
+    HTTP_MAX_CONNECTIONS: int = Field(default=20, description="Максимум соединений к одному банку")
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=10, description="Максимум простаивающих keep-alive соединений")
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = Field(default=30.0, description="Время жизни простаивающего соединения")
+    HTTP_TIMEOUT_SECONDS: float = Field(default=30.0, description="Таймаут запросов к банковским API")
+    HTTP2_ENABLED: bool = Field(default=False, description="Использовать HTTP/2 (нужен пакет h2)")
+
+    # Повторы и circuit breaker запросов к банковским API
+    BANK_RETRY_MAX_ATTEMPTS: int = Field(default=3, description="Максимум попыток идемпотентного запроса к банку")
+    BANK_RETRY_BASE_DELAY_SECONDS: float = Field(default=0.5, description="Базовая задержка экспоненциального повтора")
+    BANK_RETRY_MAX_DELAY_SECONDS: float = Field(default=10.0, description="Предел задержки повтора, в том числе по Retry-After")
+    BANK_BREAKER_WINDOW: int = Field(default=20, description="Число последних запросов, по которым считается доля ошибок")
+    BANK_BREAKER_MIN_CALLS: int = Field(default=10, description="Минимум запросов в окне для размыкания breaker")
+    BANK_BREAKER_FAILURE_RATIO: float = Field(default=0.5, description="Доля ошибок, при которой breaker размыкается")
+    BANK_BREAKER_OPEN_SECONDS: float = Field(default=30.0, description="Пауза запросов к банку после размыкания breaker")
+    
     @property
     def DATABASE_URL(self) -> str:
         """Формирование URL для подключения к БД"""
@@ -91,6 +114,48 @@ class Settings(BaseSettings):
                 )
         return v
     
+    # Категоризация транзакций
+    CATEGORY_CACHE_TTL_SECONDS: int = Field(default=300, description="Время жизни кэша системных категорий в памяти процесса, секунд; изменения системных категорий видны после его истечения")
+    CATEGORIZE_CHUNK_SIZE: int = Field(default=1000, description="Размер пачки при массовой категоризации транзакций")
+    CATEGORY_MODEL_PATH: str = Field(default="data/category_model.npz", description="Файл обучаемой модели категоризации")
+    CATEGORY_MODEL_FEATURES: int = Field(default=2 ** 18, description="Размер пространства хешированных n-грамм (степень двойки)")
+    CATEGORY_MODEL_MIN_SAMPLES: int = Field(default=50, description="Минимум обучающих примеров, после которого модель используется")
+    CATEGORY_MODEL_MIN_CONFIDENCE: float = Field(default=0.6, description="Порог уверенности модели; ниже - правила по ключевым словам")
+    CATEGORY_MODEL_SAVE_INTERVAL_SECONDS: int = Field(default=300, description="Период слияния исправлений процесса с моделью на диске (0 - только при остановке)")
+    MERCHANT_GLOBAL_MIN_USERS: int = Field(default=3, description="Сколько разных пользователей должны выбрать продавцу одну системную категорию, чтобы она стала глобальной")
+    
+    # Повторяющиеся платежи (подписки)
+    RECURRING_LOOKBACK_DAYS: int = Field(default=180, description="Глубина поиска повторяющихся платежей (дней)")
+    RECURRING_AMOUNT_TOLERANCE: float = Field(default=0.1, description="Допустимое относительное изменение суммы платежа подписки")
+    RECURRING_MIN_REGULARITY: float = Field(default=0.5, description="Минимальная регулярность интервалов (1 - коэффициент вариации)")
+
+    # Накопленная статистика расходов по категориям и пометка аномалий
+    CATEGORY_STATS_HALF_LIFE_DAYS: float = Field(default=90.0, description="Период полураспада веса транзакции в затухающей статистике (дней)")
+    CATEGORY_STATS_MIN_COUNT: int = Field(default=10, description="Минимум транзакций в категории для пометки аномалий")
+    ANOMALY_THRESHOLD_MULTIPLIER: float = Field(default=2.0, description="Порог аномалии при записи транзакции: среднее + k * σ")
+
+    # AI-дашборд
+    DASHBOARD_PART_TIMEOUT_SECONDS: float = Field(default=5.0, description="Предельное время расчета одной части AI-дашборда; после него часть возвращается пустой")
+    DASHBOARD_DB_CONCURRENCY: int = Field(default=3, description="Максимум одновременных сессий БД AI-дашбордов на процесс - отдельно для загрузок снимка данных и для рекомендаций (всего до 2x)")
+
+    # Массовый импорт и экспорт транзакций
+    BULK_MAX_ROWS: int = Field(default=10000, description="Максимум строк в одном запросе POST /transactions/bulk")
+    BULK_INSERT_CHUNK_SIZE: int = Field(default=1000, description="Размер пачки COPY при массовом импорте")
+    EXPORT_BATCH_SIZE: int = Field(default=1000, description="Размер пачки серверного курсора при экспорте транзакций")
+    SYNC_UPSERT_CHUNK_SIZE: int = Field(default=1000, description="Размер пачки INSERT ... ON CONFLICT при синхронизации с банком")
+    SYNC_INITIAL_DAYS: int = Field(default=30, description="Глубина первой синхронизации счета (дней)")
+    SYNC_WATERMARK_OVERLAP_HOURS: int = Field(default=72, description="Перекрытие с предыдущей синхронизацией для поздно проведенных операций (часов)")
+    TOKEN_REFRESH_MARGIN_SECONDS: int = Field(default=300, description="Обновлять токен банка заранее, за столько секунд до истечения")
+
+    # Фоновые синхронизации с банками (очередь sync_jobs)
+    SYNC_WORKER_IN_PROCESS: bool = Field(default=False, description="Запускать воркер и планировщик внутри API-процесса (только локальная разработка с одним процессом)")
+    SYNC_WORKER_CONCURRENCY: int = Field(default=4, description="Число одновременно выполняемых задач в воркере")
+    SYNC_WORKER_POLL_SECONDS: float = Field(default=1.0, description="Интервал опроса очереди, когда задач нет")
+    SYNC_JOB_TIMEOUT_SECONDS: int = Field(default=600, description="Предельное время выполнения задачи; зависшие задачи возвращаются в очередь")
+    SYNC_JOB_MAX_ATTEMPTS: int = Field(default=3, description="Максимум запусков задачи, прерванной таймаутом или падением воркера")
+    SYNC_SCHEDULE_INTERVAL_SECONDS: int = Field(default=3600, description="Период автоматической синхронизации активных подключений (0 - отключено)")
+    SYNC_SCHEDULE_JITTER_SECONDS: int = Field(default=300, description="Случайный сдвиг запуска запланированных синхронизаций")
+
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = Field(
         default=[
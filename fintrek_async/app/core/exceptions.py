@@ -38,6 +38,11 @@ class OpenBankingAPIError(ExternalAPIError):
     pass
 
 
+class CircuitOpenError(ExternalAPIError):
+    """Запросы к банковскому API приостановлены circuit breaker"""
+    pass
+
+
 class AuthenticationError(FinTrekException):
     """Ошибка аутентификации"""
     pass
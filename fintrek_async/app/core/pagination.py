@@ -0,0 +1,55 @@
+"""
+Keyset-пагинация: кодирование и разбор курсоров
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(transaction_date: datetime, row_id: UUID, rank: Optional[float] = None) -> str:
+    """
+    Закодировать позицию последней строки страницы в непрозрачный курсор
+
+    Args:
+        transaction_date: Дата транзакции последней строки
+        row_id: ID последней строки
+        rank: Релевантность последней строки (при сортировке по релевантности)
+
+    Returns:
+        Строка base64url без паддинга
+    """
+    data = {"d": transaction_date.isoformat(), "id": str(row_id)}
+    if rank is not None:
+        data["r"] = rank
+    payload = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID, Optional[float]]:
+    """
+    Разобрать курсор, выданный encode_cursor
+
+    Returns:
+        (transaction_date, id, rank); rank равен None для курсора без релевантности
+
+    Raises:
+        HTTPException 400: Если курсор поврежден
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        rank = payload.get("r")
+        return (
+            datetime.fromisoformat(payload["d"]),
+            UUID(payload["id"]),
+            float(rank) if rank is not None else None
+        )
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
@@ -16,6 +16,9 @@ engine = create_async_engine(
     future=True,
     pool_pre_ping=True,  # Проверка соединения перед использованием
     pool_recycle=3600,  # Переподключение каждый час
+    # Не больше 15 соединений на процесс. AI-дашборды занимают не больше
+    # 2 * DASHBOARD_DB_CONCURRENCY из них, при увеличении этой настройки
+    # увеличьте и пул
     pool_size=5,
     max_overflow=10
 )
@@ -9,6 +9,7 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -17,7 +18,7 @@ from slowapi.errors import RateLimitExceeded
 
 from fintrek_async.app.core.config import settings
 from fintrek_async.app.api.v1.api import api_router
-from fintrek_async.app.core.cache import init_cache, close_cache, is_cache_enabled
+from fintrek_async.app.core.cache import init_cache, close_cache, is_cache_enabled, get_cache_stats
 from fintrek_async.app.core.exceptions import (
     DatabaseConnectionError,
     RedisConnectionError,
@@ -25,6 +26,11 @@ from fintrek_async.app.core.exceptions import (
     FinTrekException
 )
 from fintrek_async.app.middleware.security import SecurityHeadersMiddleware
+from fintrek_async.app.ml.category_classifier import category_classifier
+from fintrek_async.app.clients.http_pool import http_client_pool
+from fintrek_async.app.clients.resilience import get_resilience_stats
+from fintrek_async.app.services.open_banking_service import open_banking_service
+from fintrek_async.app.services.sync_job_service import sync_job_service
 
 logger = logging.getLogger(__name__)
 
@@ -55,9 +61,51 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ Error during startup: {e}")
         # Продолжаем работу даже если кэш не инициализирован
     
+    # Долгоживущие HTTP-клиенты банковских API с пулом соединений
+    http_client_pool.client(open_banking_service.base_url)
+    if settings.VBANK_CLIENT_ID and settings.VBANK_CLIENT_SECRET:
+        http_client_pool.client(settings.VBANK_BASE_URL)
+    
+    try:
+        category_classifier.load()
+    except Exception as e:
+        logger.error(f"❌ Error loading category model: {e}")
+        # Категоризация продолжит работать по ключевым словам
+    
+    # Воркер фоновых синхронизаций в процессе API - только для локальной разработки
+    # (в production - scripts/run_sync_worker.py)
+    sync_stop = asyncio.Event()
+    sync_tasks = []
+    if settings.SYNC_WORKER_IN_PROCESS:
+        sync_tasks = [
+            asyncio.create_task(sync_job_service.run_worker(sync_stop)),
+            asyncio.create_task(sync_job_service.run_scheduler(sync_stop))
+        ]
+    # Периодическое слияние исправлений категорий с моделью на диске
+    sync_tasks.append(asyncio.create_task(category_classifier.run_autosave(sync_stop)))
+    
     yield
     
+    # Дождаться текущих синхронизаций; прерванные вернутся в очередь
+    sync_stop.set()
+    if sync_tasks:
+        try:
+            await asyncio.wait_for(asyncio.gather(*sync_tasks), timeout=30)
+        except Exception as e:
+            logger.error(f"❌ Error stopping sync worker: {e}")
+    
     # Завершаем
+    try:
+        # Слить оставшиеся исправления пользователей с моделью на диске
+        category_classifier.save_if_dirty()
+    except Exception as e:
+        logger.error(f"❌ Error saving category model: {e}")
+    
+    try:
+        await http_client_pool.aclose()
+    except Exception as e:
+        logger.error(f"❌ Error closing HTTP clients: {e}")
+    
     try:
         await close_cache()
         logger.info("✅ Application shutdown complete")
@@ -246,3 +294,15 @@ async def root():
 async def health_check():
     """Health check эндпоинт"""
     return {"status": "healthy"}
+
+
+@app.get("/health/cache")
+async def cache_health_check():
+    """Статистика попаданий в кэш аналитики"""
+    return await get_cache_stats()
+
+
+@app.get("/health/bank-apis")
+async def bank_apis_health_check():
+    """Состояние circuit breaker и счетчики повторов запросов к банкам (в этом процессе)"""
+    return get_resilience_stats()
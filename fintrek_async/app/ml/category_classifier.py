@@ -0,0 +1,402 @@
+"""
+Обучаемый классификатор категорий транзакций (наивный Байес на хешированных n-граммах)
+"""
+import asyncio
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки файла между процессами
+    fcntl = None
+
+import numpy as np
+
+from fintrek_async.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Множители полиномиального хеша n-грамм (стабильны между процессами, в отличие от hash())
+_HASH_BASE = np.uint32(1_000_003)
+_HASH_MIX = np.uint32(0x2C1B3C6D)
+
+
+class CategoryClassifier:
+    """
+    Мультиномиальный наивный Байес по символьным n-граммам
+
+    Признаки - хеши символьных n-грамм нормализованного текста
+    (описание + продавец) в пространстве фиксированного размера, поэтому
+    словарь не нужен, а дообучение на новой строке стоит O(длина строки).
+    Классы - системные категории; при предсказании учитываются только
+    категории того же типа (доход/расход), что и транзакция.
+
+    Модель живет в памяти каждого процесса отдельно: дообучение на
+    исправлениях пользователей сразу видно только в этом процессе. Чтобы
+    процессы не затирали исправления друг друга, save_if_dirty не
+    перезаписывает файл своим состоянием, а под блокировкой файла
+    загружает модель с диска, добавляет к ней свои исправления с прошлого
+    сохранения и принимает результат (с исправлениями других процессов).
+    При падении процесса теряются только исправления с последнего
+    периодического сохранения (см. run_autosave).
+    """
+
+    def __init__(
+        self,
+        n_features: Optional[int] = None,
+        ngram_sizes: Sequence[int] = (2, 3, 4),
+        max_chars: int = 64,
+        alpha: float = 0.1
+    ):
+        self.n_features = n_features or settings.CATEGORY_MODEL_FEATURES
+        if self.n_features & (self.n_features - 1):
+            raise ValueError("n_features must be a power of two")
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.max_chars = max_chars
+        self.alpha = alpha
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """Очистить все выученные параметры"""
+        self.classes: List[str] = []
+        self.class_types: List[str] = []
+        # Счетчики n-грамм: строка на признак, столбец на класс
+        self._counts = np.zeros((self.n_features, 0), dtype=np.float32)
+        self._class_count = np.zeros(0, dtype=np.float64)
+        self._class_tokens = np.zeros(0, dtype=np.float64)
+        self._log_counts = np.zeros((self.n_features, 0), dtype=np.float32)
+        # Исправления, еще не записанные в файл: (текст, ID категории, тип)
+        self._pending: List[Tuple[str, str, str]] = []
+
+    # ------------------------------------------------------------------ признаки
+
+    @staticmethod
+    def normalize(description: Optional[str], merchant_name: Optional[str]) -> str:
+        """Текст транзакции для классификации"""
+        return f"{description or ''} {merchant_name or ''}".lower()
+
+    def _hash_features(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Хеши n-грамм для массива текстов в разреженном виде
+
+        Returns:
+            (индексы признаков, номер текста для каждого признака);
+            признаки упорядочены по номеру текста, у каждого текста есть
+            хотя бы один признак
+        """
+        clipped = [f" {text[:self.max_chars - 2]} " for text in texts]
+        width = max(map(len, clipped))
+        padded = np.array(clipped, dtype=f"<U{width}")
+        codes = padded.view(np.uint32).reshape(len(texts), width)
+        lengths = np.char.str_len(padded)
+        mask = np.uint32(self.n_features - 1)
+
+        blocks = []
+        valid_blocks = []
+        for size in self.ngram_sizes:
+            positions = width - size + 1
+            if positions <= 0:
+                continue
+            hashes = np.full((len(texts), positions), size, dtype=np.uint32)
+            for offset in range(size):
+                hashes = hashes * _HASH_BASE + codes[:, offset:offset + positions]
+            # Перемешивание битов, чтобы младшие биты зависели от всех символов
+            hashes ^= hashes >> np.uint32(15)
+            hashes *= _HASH_MIX
+            hashes ^= hashes >> np.uint32(13)
+
+            blocks.append(hashes & mask)
+            valid_blocks.append(np.arange(positions)[None, :] + size <= lengths[:, None])
+
+        features = np.concatenate(blocks, axis=1)
+        valid = np.concatenate(valid_blocks, axis=1)
+        rows = np.nonzero(valid)[0]
+        return features[valid].astype(np.int64), rows
+
+    # ------------------------------------------------------------------ обучение
+
+    def _class_index(self, category_id: str, category_type: str) -> int:
+        """Индекс класса; новый класс добавляется столбцом"""
+        try:
+            return self.classes.index(category_id)
+        except ValueError:
+            pass
+        self.classes.append(category_id)
+        self.class_types.append(category_type)
+        self._counts = np.hstack([self._counts, np.zeros((self.n_features, 1), dtype=np.float32)])
+        self._log_counts = np.hstack([
+            self._log_counts,
+            np.full((self.n_features, 1), np.log(self.alpha), dtype=np.float32)
+        ])
+        self._class_count = np.append(self._class_count, 0.0)
+        self._class_tokens = np.append(self._class_tokens, 0.0)
+        return len(self.classes) - 1
+
+    def partial_fit(
+        self,
+        texts: Sequence[str],
+        category_ids: Sequence[str],
+        category_types: Sequence[str]
+    ) -> None:
+        """
+        Дообучить модель на размеченных текстах
+
+        Обновляются только строки признаков, встретившихся в текстах.
+        Примеры запоминаются до следующего save_if_dirty.
+
+        Args:
+            texts: Нормализованные тексты (см. normalize)
+            category_ids: ID системных категорий
+            category_types: Типы категорий (CategoryType.value)
+        """
+        if not texts:
+            return
+
+        examples = [
+            (text, str(category_id), str(category_type))
+            for text, category_id, category_type in zip(texts, category_ids, category_types)
+        ]
+        with self._lock:
+            self._apply(examples)
+            self._pending.extend(examples)
+
+    def _apply(self, examples: Sequence[Tuple[str, str, str]]) -> None:
+        """Добавить примеры к счетчикам (вызывается под self._lock)"""
+        if not examples:
+            return
+        texts, category_ids, category_types = zip(*examples)
+        features, rows = self._hash_features(texts)
+        labels = np.array([
+            self._class_index(category_id, category_type)
+            for category_id, category_type in zip(category_ids, category_types)
+        ])
+
+        feature_labels = labels[rows]
+        np.add.at(self._counts, (features, feature_labels), 1.0)
+
+        self._class_count += np.bincount(labels, minlength=len(self.classes))
+        self._class_tokens += np.bincount(feature_labels, minlength=len(self.classes))
+
+        touched = np.unique(features)
+        self._log_counts[touched] = np.log(self._counts[touched] + self.alpha)
+
+    def fit(
+        self,
+        texts: Sequence[str],
+        category_ids: Sequence[str],
+        category_types: Sequence[str],
+        chunk_size: int = 10000
+    ) -> None:
+        """Обучить модель с нуля"""
+        with self._lock:
+            self._reset()
+            for start in range(0, len(texts), chunk_size):
+                self._apply(list(zip(
+                    texts[start:start + chunk_size],
+                    map(str, category_ids[start:start + chunk_size]),
+                    map(str, category_types[start:start + chunk_size])
+                )))
+
+    # ------------------------------------------------------------------ предсказание
+
+    @property
+    def is_ready(self) -> bool:
+        """Модель обучена на достаточном количестве примеров"""
+        return float(self._class_count.sum()) >= settings.CATEGORY_MODEL_MIN_SAMPLES
+
+    def predict(
+        self,
+        texts: Sequence[str],
+        category_types: Sequence[str],
+        chunk_size: int = 2048
+    ) -> Tuple[List[Optional[str]], np.ndarray]:
+        """
+        Пакетное предсказание категорий
+
+        Args:
+            texts: Нормализованные тексты
+            category_types: Тип категории для каждого текста (CategoryType.value)
+
+        Returns:
+            (ID категорий или None, уверенность 0..1) для каждого текста
+        """
+        count = len(texts)
+        if count == 0 or not self.classes:
+            return [None] * count, np.zeros(count)
+
+        with self._lock:
+            log_counts = self._log_counts
+            log_totals = np.log(self._class_tokens + self.alpha * self.n_features)
+            log_prior = np.log(self._class_count + 1.0) - np.log(self._class_count.sum() + len(self.classes))
+            class_types = np.array(self.class_types)
+            classes = list(self.classes)
+
+        scores = np.empty((count, len(classes)), dtype=np.float64)
+        for start in range(0, count, chunk_size):
+            features, rows = self._hash_features(texts[start:start + chunk_size])
+            # Сумма логарифмов по признакам каждого текста: признаки идут подряд по rows
+            row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            block = np.add.reduceat(log_counts[features], row_starts, axis=0)
+            tokens = np.diff(np.r_[row_starts, len(rows)])
+            scores[start:start + chunk_size] = block - tokens[:, None] * log_totals[None, :]
+        scores += log_prior[None, :]
+
+        # Только категории подходящего типа
+        allowed = class_types[None, :] == np.asarray(category_types)[:, None]
+        scores[~allowed] = -np.inf
+
+        best = scores.argmax(axis=1)
+        top = scores[np.arange(count), best]
+        has_class = np.isfinite(top)
+        with np.errstate(invalid="ignore", over="ignore"):
+            confidence = 1.0 / np.exp(scores - np.where(has_class, top, 0.0)[:, None]).sum(axis=1)
+        confidence = np.where(has_class, confidence, 0.0)
+
+        predicted = [classes[index] if ok else None for index, ok in zip(best, has_class)]
+        return predicted, confidence
+
+    def predict_one(self, text: str, category_type: str) -> Tuple[Optional[str], float]:
+        """Предсказание для одного текста"""
+        predicted, confidence = self.predict([text], [category_type])
+        return predicted[0], float(confidence[0])
+
+    # ------------------------------------------------------------------ хранение
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Сохранить модель на диск (.npz), заменив файл целиком
+
+        Для обученной с нуля модели (scripts/train_category_model.py);
+        дообучение в работающих процессах сохраняет save_if_dirty.
+        """
+        path = path or settings.CATEGORY_MODEL_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            self._write(path)
+            self._pending = []
+        logger.info(f"Category model saved to {path} ({len(self.classes)} classes)")
+
+    def _write(self, path: str) -> None:
+        """Атомарно записать состояние в файл (вызывается под self._lock)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            counts=self._counts,
+            class_count=self._class_count,
+            class_tokens=self._class_tokens,
+            classes=np.array(self.classes, dtype=str),
+            class_types=np.array(self.class_types, dtype=str),
+            params=np.array([self.n_features, self.max_chars, *self.ngram_sizes]),
+            alpha=np.array(self.alpha)
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """
+        Загрузить модель с диска
+
+        Returns:
+            False, если файла нет
+        """
+        path = path or settings.CATEGORY_MODEL_PATH
+        if not os.path.exists(path):
+            logger.info(f"Category model not found at {path}, using keyword rules only")
+            return False
+
+        state = self._read(path)
+        with self._lock:
+            self._set_state(*state)
+            self._pending = []
+
+        logger.info(f"Category model loaded from {path} ({len(self.classes)} classes, {int(self._class_count.sum())} samples)")
+        return True
+
+    @staticmethod
+    def _read(path: str) -> tuple:
+        """Прочитать состояние модели из файла"""
+        with np.load(path) as data:
+            n_features, max_chars, *ngram_sizes = (int(value) for value in data["params"])
+            return (
+                n_features,
+                max_chars,
+                tuple(ngram_sizes),
+                float(data["alpha"]),
+                [str(value) for value in data["classes"]],
+                [str(value) for value in data["class_types"]],
+                data["counts"].astype(np.float32),
+                data["class_count"],
+                data["class_tokens"]
+            )
+
+    def _set_state(
+        self, n_features, max_chars, ngram_sizes, alpha, classes, class_types, counts, class_count, class_tokens
+    ) -> None:
+        """Заменить параметры модели прочитанными из файла (вызывается под self._lock)"""
+        self.n_features = n_features
+        self.max_chars = max_chars
+        self.ngram_sizes = ngram_sizes
+        self.alpha = alpha
+        self.classes = classes
+        self.class_types = class_types
+        self._counts = counts
+        self._class_count = class_count
+        self._class_tokens = class_tokens
+        self._log_counts = np.log(counts + alpha).astype(np.float32)
+
+    def save_if_dirty(self, path: Optional[str] = None) -> None:
+        """
+        Слить исправления этого процесса с моделью на диске
+
+        Под блокировкой файла (fcntl) модель читается с диска - с
+        исправлениями, сохраненными другими процессами, и с результатом
+        переобучения, - к ней добавляются исправления этого процесса с
+        прошлого сохранения, результат записывается и становится текущей
+        моделью процесса.
+        """
+        path = path or settings.CATEGORY_MODEL_PATH
+        with self._lock:
+            saved = len(self._pending)
+        if not saved:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f"{path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = self._read(path) if os.path.exists(path) else None
+            with self._lock:
+                if state is None:
+                    # Файла еще нет: в памяти уже все исправления
+                    self._write(path)
+                    self._pending = []
+                else:
+                    self._set_state(*state)
+                    self._apply(self._pending[:saved])
+                    self._write(path)
+                    # Исправления, пришедшие во время чтения файла, - до следующего сохранения
+                    self._pending = self._pending[saved:]
+                    self._apply(self._pending)
+        logger.info(f"Category model merged into {path} ({saved} corrections)")
+
+    async def run_autosave(self, stop: asyncio.Event, path: Optional[str] = None) -> None:
+        """Периодически сливать исправления с моделью на диске до установки stop"""
+        interval = settings.CATEGORY_MODEL_SAVE_INTERVAL_SECONDS
+        if interval <= 0:
+            return
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await asyncio.to_thread(self.save_if_dirty, path)
+            except Exception as e:
+                logger.error(f"Error saving category model: {e}")
+
+
+# Singleton instance
+category_classifier = CategoryClassifier()
@@ -0,0 +1,183 @@
+"""
+Снимок финансовых данных пользователя, общий для ML-анализаторов в рамках запроса
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import func, and_, select
+import logging
+
+from fintrek_async.app.models.transaction import Transaction, TransactionType
+from fintrek_async.app.models.category import Category
+from fintrek_async.app.models.account import Account
+
+logger = logging.getLogger(__name__)
+
+# Глубина истории для прогнозов (дней)
+HISTORY_DAYS = 180
+# Окно "последнего месяца" для сбережений и структуры расходов (дней)
+RECENT_DAYS = 30
+
+
+@dataclass(frozen=True)
+class MonthlyTotal:
+    """Суммы транзакций одного типа за календарный месяц"""
+    month: datetime
+    transaction_type: TransactionType
+    total: Optional[Decimal]  # Транзакции окна истории до текущего момента; None - таких нет
+    recent: Decimal  # Из них за последние RECENT_DAYS дней
+    upcoming: Decimal  # Транзакции с датой позже текущего момента
+
+
+class UserFinancialSnapshot:
+    """
+    Данные пользователя для одного запроса аналитики
+
+    Базовые данные (помесячные суммы за HISTORY_DAYS дней, расходы по
+    категориям за RECENT_DAYS дней, счета) загружаются по одному запросу при
+    первом обращении, а производные результаты (тренды, прогнозы)
+    запоминаются через memoize. SpendingAnalyzer, ForecastingModel и
+    RecommendationEngine, получившие один снимок, не повторяют запросы друг
+    за другом. Все окна отсчитываются от одного момента now.
+
+    Снимок можно использовать из параллельных задач: одновременные
+    обращения ждут одну и ту же загрузку. В этом случае передается
+    session_factory - каждая загрузка идет в своей короткой сессии, так
+    как AsyncSession нельзя использовать из нескольких задач сразу.
+    """
+
+    def __init__(
+        self,
+        db: Optional[AsyncSession],
+        user_id: str,
+        now: Optional[datetime] = None,
+        session_factory: Optional[async_sessionmaker] = None
+    ):
+        self.db = db
+        self.user_id = user_id
+        self.now = now or datetime.utcnow()
+        self.session_factory = session_factory
+        self._memo: Dict[Hashable, asyncio.Future] = {}
+
+    async def memoize(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат compute, вычисленный один раз на снимок"""
+        if key not in self._memo:
+            self._memo[key] = asyncio.ensure_future(compute())
+        # Отмена одного ожидающего (таймаут части дашборда) не прерывает общую загрузку
+        return await asyncio.shield(self._memo[key])
+
+    async def _load(self, loader: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """Выполнить загрузку в сессии запроса или в отдельной сессии"""
+        if self.session_factory is None:
+            return await loader(self.db)
+        async with self.session_factory() as db:
+            return await loader(db)
+
+    @property
+    def history_start(self) -> datetime:
+        return self.now - timedelta(days=HISTORY_DAYS)
+
+    @property
+    def recent_start(self) -> datetime:
+        return self.now - timedelta(days=RECENT_DAYS)
+
+    async def monthly_totals(self) -> List[MonthlyTotal]:
+        """Помесячные суммы доходов и расходов с начала окна истории, по возрастанию месяца"""
+        return await self.memoize("monthly_totals", lambda: self._load(self._load_monthly_totals))
+
+    async def _load_monthly_totals(self, db: AsyncSession) -> List[MonthlyTotal]:
+        month = func.date_trunc('month', Transaction.transaction_date).label('month')
+        in_past = Transaction.transaction_date <= self.now
+        result = await db.execute(
+            select(
+                month,
+                Transaction.transaction_type,
+                func.sum(Transaction.amount).filter(in_past),
+                func.sum(Transaction.amount).filter(in_past, Transaction.transaction_date >= self.recent_start),
+                func.sum(Transaction.amount).filter(Transaction.transaction_date > self.now)
+            ).filter(
+                and_(
+                    Transaction.user_id == self.user_id,
+                    Transaction.transaction_type.in_((TransactionType.INCOME, TransactionType.EXPENSE)),
+                    Transaction.transaction_date >= self.history_start
+                )
+            ).group_by(month, Transaction.transaction_type).order_by(month)
+        )
+        return [
+            MonthlyTotal(month_start, transaction_type, total, recent or Decimal(0), upcoming or Decimal(0))
+            for month_start, transaction_type, total, recent, upcoming in result.all()
+        ]
+
+    async def monthly_series(self, transaction_type: TransactionType) -> List[float]:
+        """Суммы по месяцам окна истории (только месяцы с транзакциями)"""
+        return [
+            float(row.total)
+            for row in await self.monthly_totals()
+            if row.transaction_type == transaction_type and row.total is not None
+        ]
+
+    async def total_since(self, transaction_type: TransactionType, month: datetime) -> Decimal:
+        """Сумма с начала месяца month, включая транзакции с датой в будущем"""
+        return sum(
+            (
+                (row.total or Decimal(0)) + row.upcoming
+                for row in await self.monthly_totals()
+                if row.transaction_type == transaction_type and row.month >= month
+            ),
+            Decimal(0)
+        )
+
+    async def month_total(self, transaction_type: TransactionType, month: datetime) -> Decimal:
+        """Сумма за календарный месяц, начинающийся в month"""
+        return sum(
+            (
+                (row.total or Decimal(0)) + row.upcoming
+                for row in await self.monthly_totals()
+                if row.transaction_type == transaction_type and row.month == month
+            ),
+            Decimal(0)
+        )
+
+    async def recent_total(self, transaction_type: TransactionType, include_upcoming: bool = True) -> Decimal:
+        """Сумма за последние RECENT_DAYS дней"""
+        return sum(
+            (
+                row.recent + (row.upcoming if include_upcoming else Decimal(0))
+                for row in await self.monthly_totals()
+                if row.transaction_type == transaction_type
+            ),
+            Decimal(0)
+        )
+
+    async def category_spending(self) -> Dict[str, float]:
+        """Расходы по категориям за последние RECENT_DAYS дней: {название_категории: сумма}"""
+        return await self.memoize("category_spending", lambda: self._load(self._load_category_spending))
+
+    async def _load_category_spending(self, db: AsyncSession) -> Dict[str, float]:
+        result = await db.execute(
+            select(
+                Category.name,
+                func.sum(Transaction.amount).label('total')
+            ).join(
+                Transaction, Transaction.category_id == Category.id
+            ).filter(
+                and_(
+                    Transaction.user_id == self.user_id,
+                    Transaction.transaction_type == TransactionType.EXPENSE,
+                    Transaction.transaction_date >= self.recent_start,
+                    Transaction.transaction_date <= self.now
+                )
+            ).group_by(Category.name)
+        )
+        return {name: float(total) for name, total in result.all()}
+
+    async def accounts(self) -> List[Account]:
+        """Счета пользователя"""
+        return await self.memoize("accounts", lambda: self._load(self._load_accounts))
+
+    async def _load_accounts(self, db: AsyncSession) -> List[Account]:
+        result = await db.execute(select(Account).filter(Account.user_id == self.user_id))
+        return list(result.scalars().all())
@@ -1,14 +1,13 @@
 """
 Прогностическая модель для предсказания будущих доходов и расходов
 """
-from typing import Dict, List
-from datetime import datetime, timedelta
-from decimal import Decimal
+from typing import Dict, List, Optional
+from datetime import timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, and_, select
 import logging
 
-from fintrek_async.app.models.transaction import Transaction, TransactionType
+from fintrek_async.app.models.transaction import TransactionType
+from fintrek_async.app.ml.financial_snapshot import UserFinancialSnapshot
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +18,8 @@ class ForecastingModel:
     async def forecast_next_month_spending(
         self,
         db: AsyncSession,
-        user_id: str
+        user_id: str,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> Dict:
         """
         Прогнозировать расходы на следующий месяц
@@ -27,30 +27,19 @@ class ForecastingModel:
         Args:
             db: Database session
             user_id: ID пользователя
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Прогноз расходов
         """
-        # Получить данные за последние 6 месяцев
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=180)
-        
-        result = await db.execute(
-            select(
-                func.date_trunc('month', Transaction.transaction_date).label('month'),
-                func.sum(Transaction.amount).label('total')
-            ).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.EXPENSE,
-                    Transaction.transaction_date >= start_date,
-                    Transaction.transaction_date <= end_date
-                )
-            ).group_by('month').order_by('month')
-        )
-        monthly_spending = result.all()
-        
-        if not monthly_spending:
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
+        return await snapshot.memoize("forecast_spending", lambda: self._forecast_spending(snapshot))
+    
+    async def _forecast_spending(self, snapshot: UserFinancialSnapshot) -> Dict:
+        # Помесячные расходы за последние 6 месяцев
+        spending_values = await snapshot.monthly_series(TransactionType.EXPENSE)
+        
+        if not spending_values:
             return {
                 'forecast': 0,
                 'confidence': 'low',
@@ -58,7 +47,6 @@ class ForecastingModel:
             }
         
         # Простое скользящее среднее
-        spending_values = [float(total) for _, total in monthly_spending]
         avg_spending = sum(spending_values) / len(spending_values)
         
         # Вычислить тренд (линейная регрессия)
@@ -110,7 +98,8 @@ class ForecastingModel:
     async def forecast_next_month_income(
         self,
         db: AsyncSession,
-        user_id: str
+        user_id: str,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> Dict:
         """
         Прогнозировать доход на следующий месяц
@@ -118,30 +107,19 @@ class ForecastingModel:
         Args:
             db: Database session
             user_id: ID пользователя
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Прогноз дохода
         """
-        # Получить данные за последние 6 месяцев
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=180)
-        
-        result = await db.execute(
-            select(
-                func.date_trunc('month', Transaction.transaction_date).label('month'),
-                func.sum(Transaction.amount).label('total')
-            ).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.INCOME,
-                    Transaction.transaction_date >= start_date,
-                    Transaction.transaction_date <= end_date
-                )
-            ).group_by('month').order_by('month')
-        )
-        monthly_income = result.all()
-        
-        if not monthly_income:
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
+        return await snapshot.memoize("forecast_income", lambda: self._forecast_income(snapshot))
+    
+    async def _forecast_income(self, snapshot: UserFinancialSnapshot) -> Dict:
+        # Помесячные доходы за последние 6 месяцев
+        income_values = await snapshot.monthly_series(TransactionType.INCOME)
+        
+        if not income_values:
             return {
                 'forecast': 0,
                 'confidence': 'low',
@@ -149,7 +127,6 @@ class ForecastingModel:
             }
         
         # Среднее значение
-        income_values = [float(total) for _, total in monthly_income]
         avg_income = sum(income_values) / len(income_values)
         
         # Для дохода обычно используем медиану, так как она менее чувствительна к выбросам
@@ -180,7 +157,8 @@ class ForecastingModel:
         self,
         db: AsyncSession,
         user_id: str,
-        months_ahead: int = 3
+        months_ahead: int = 3,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> List[Dict]:
         """
         Прогнозировать баланс на несколько месяцев вперед
@@ -189,20 +167,20 @@ class ForecastingModel:
             db: Database session
             user_id: ID пользователя
             months_ahead: Количество месяцев для прогноза
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Список прогнозов по месяцам
         """
-        # Получить текущий баланс
-        from fintrek_async.app.models.account import Account
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
         
-        result = await db.execute(select(Account).filter(Account.user_id == user_id))
-        accounts = result.scalars().all()
+        # Получить текущий баланс
+        accounts = await snapshot.accounts()
         current_balance = sum(float(acc.balance) for acc in accounts)
         
         # Получить прогнозы дохода и расходов
-        income_forecast = await self.forecast_next_month_income(db, user_id)
-        spending_forecast = await self.forecast_next_month_spending(db, user_id)
+        income_forecast = await self.forecast_next_month_income(db, user_id, snapshot)
+        spending_forecast = await self.forecast_next_month_spending(db, user_id, snapshot)
         
         monthly_income = income_forecast.get('forecast', 0)
         monthly_spending = spending_forecast.get('forecast', 0)
@@ -215,7 +193,7 @@ class ForecastingModel:
         for month in range(1, months_ahead + 1):
             balance += monthly_net
             
-            next_month = datetime.utcnow() + timedelta(days=30 * month)
+            next_month = snapshot.now + timedelta(days=30 * month)
             
             forecasts.append({
                 'month': next_month.strftime('%Y-%m'),
@@ -230,7 +208,8 @@ class ForecastingModel:
     async def calculate_financial_health_score(
         self,
         db: AsyncSession,
-        user_id: str
+        user_id: str,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> Dict:
         """
         Вычислить показатель финансового здоровья (0-100)
@@ -238,39 +217,19 @@ class ForecastingModel:
         Args:
             db: Database session
             user_id: ID пользователя
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Оценка и детали
         """
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
         score = 0
         max_score = 100
         details = []
         
-        # 1. Уровень сбережений (30 баллов)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-        
-        result = await db.execute(
-            select(func.sum(Transaction.amount)).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.INCOME,
-                    Transaction.transaction_date >= start_date
-                )
-            )
-        )
-        total_income = result.scalar() or Decimal(0)
-        
-        result = await db.execute(
-            select(func.sum(Transaction.amount)).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.EXPENSE,
-                    Transaction.transaction_date >= start_date
-                )
-            )
-        )
-        total_expenses = result.scalar() or Decimal(0)
+        # 1. Уровень сбережений (30 баллов), последние 30 дней
+        total_income = await snapshot.recent_total(TransactionType.INCOME)
+        total_expenses = await snapshot.recent_total(TransactionType.EXPENSE)
         
         if total_income > 0:
             savings_rate = ((total_income - total_expenses) / total_income) * 100
@@ -293,7 +252,7 @@ class ForecastingModel:
             })
         
         # 2. Стабильность дохода (20 баллов)
-        income_forecast = await self.forecast_next_month_income(db, user_id)
+        income_forecast = await self.forecast_next_month_income(db, user_id, snapshot)
         
         if income_forecast['confidence'] == 'high':
             income_score = 20
@@ -311,7 +270,7 @@ class ForecastingModel:
         })
         
         # 3. Контроль расходов (25 баллов)
-        spending_forecast = await self.forecast_next_month_spending(db, user_id)
+        spending_forecast = await self.forecast_next_month_spending(db, user_id, snapshot)
         
         if spending_forecast.get('trend') == 'decreasing':
             spending_score = 25
@@ -329,10 +288,7 @@ class ForecastingModel:
         })
         
         # 4. Баланс счетов (15 баллов)
-        from fintrek_async.app.models.account import Account
-        
-        result = await db.execute(select(Account).filter(Account.user_id == user_id))
-        accounts = result.scalars().all()
+        accounts = await snapshot.accounts()
         total_balance = sum(float(acc.balance) for acc in accounts)
         
         # Оценить баланс относительно месячных расходов
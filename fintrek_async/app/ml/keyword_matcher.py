@@ -0,0 +1,78 @@
+"""
+Поиск ключевых слов в тексте алгоритмом Ахо-Корасик
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class KeywordMatcher:
+    """
+    Автомат Ахо-Корасик для набора ключевых слов
+
+    Строится один раз; поиск всех вхождений всех ключевых слов выполняется
+    за один проход по тексту независимо от количества слов в словаре.
+    Переходы хранятся как полный ДКА по алфавиту ключевых слов, поэтому
+    на каждый символ текста приходится один поиск в словаре.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = []
+        self._index: Dict[str, int] = {}
+        for keyword in keywords:
+            if keyword and keyword not in self._index:
+                self._index[keyword] = len(self.keywords)
+                self.keywords.append(keyword)
+
+        # Бор: goto[state][char] -> state, output[state] -> ID ключевых слов
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[int]] = [set()]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(set())
+                state = next_state
+            output[state].add(keyword_id)
+
+        # Суффиксные ссылки (BFS) и достраивание переходов до полного ДКА
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            # Переходы состояния = переходы суффиксной ссылки + собственные ребра бора
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            output[state] |= output[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                queue.append(child)
+
+        self._delta = delta
+        # None вместо пустого множества: дешевая проверка в горячем цикле
+        self._output = [frozenset(ids) or None for ids in output]
+
+    def find(self, text: str) -> Set[int]:
+        """
+        Найти ключевые слова, входящие в текст
+
+        Returns:
+            Множество ID ключевых слов (индексы в self.keywords)
+        """
+        delta = self._delta
+        output = self._output
+        state = 0
+        found: Set[int] = set()
+        for char in text:
+            state = delta[state].get(char, 0)
+            matched = output[state]
+            if matched is not None:
+                found |= matched
+        return found
+
+    def find_keywords(self, text: str) -> Set[str]:
+        """Найти ключевые слова, входящие в текст (сами строки)"""
+        return {self.keywords[keyword_id] for keyword_id in self.find(text)}
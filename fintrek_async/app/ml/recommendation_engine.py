@@ -1,15 +1,15 @@
 """
 Система рекомендаций для улучшения финансового положения
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, and_, select
 
 from fintrek_async.app.models.transaction import Transaction, TransactionType
-from fintrek_async.app.models.account import Account
 from fintrek_async.app.ml.spending_analyzer import spending_analyzer
+from fintrek_async.app.ml.financial_snapshot import UserFinancialSnapshot
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,7 +21,8 @@ class RecommendationEngine:
     async def generate_recommendations(
         self,
         db: AsyncSession,
-        user_id: str
+        user_id: str,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> List[Dict]:
         """
         Сгенерировать рекомендации для пользователя
@@ -29,10 +30,12 @@ class RecommendationEngine:
         Args:
             db: Database session
             user_id: ID пользователя
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Список рекомендаций
         """
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
         recommendations = []
         
         # 1. Анализ повторяющихся платежей
@@ -63,7 +66,7 @@ class RecommendationEngine:
             })
         
         # 3. Анализ трендов
-        trends = await spending_analyzer.get_spending_trends(db, user_id)
+        trends = await spending_analyzer.get_spending_trends(db, user_id, snapshot)
         if trends['trend'] == 'up' and trends['change_percent'] > 20:
             recommendations.append({
                 'type': 'spending_increase',
@@ -75,12 +78,8 @@ class RecommendationEngine:
                 'action': 'review_budget'
             })
         
-        # 4. Анализ расходов по категориям
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-        spending_by_category = await spending_analyzer.get_spending_by_category(
-            db, user_id, start_date, end_date
-        )
+        # 4. Анализ расходов по категориям за последние 30 дней
+        spending_by_category = await snapshot.category_spending()
         
         if spending_by_category:
             total_spending = sum(spending_by_category.values())
@@ -102,7 +101,7 @@ class RecommendationEngine:
                 })
         
         # 5. Рекомендации по сбережениям
-        total_income = await self._get_total_income(db, user_id, start_date, end_date)
+        total_income = float(await snapshot.recent_total(TransactionType.INCOME, include_upcoming=False))
         total_expenses = sum(spending_by_category.values())
         
         if total_income > 0:
@@ -129,8 +128,7 @@ class RecommendationEngine:
                 })
         
         # 6. Проверка баланса счетов
-        result = await db.execute(select(Account).filter(Account.user_id == user_id))
-        accounts = result.scalars().all()
+        accounts = await snapshot.accounts()
         low_balance_accounts = [acc for acc in accounts if acc.balance < 1000]
         
         if low_balance_accounts:
@@ -153,28 +151,6 @@ class RecommendationEngine:
         
         return recommendations
     
-    async def _get_total_income(
-        self,
-        db: AsyncSession,
-        user_id: str,
-        start_date: datetime,
-        end_date: datetime
-    ) -> float:
-        """Получить общий доход за период"""
-        result = await db.execute(
-            select(func.sum(Transaction.amount)).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.INCOME,
-                    Transaction.transaction_date >= start_date,
-                    Transaction.transaction_date <= end_date
-                )
-            )
-        )
-        total = result.scalar()
-        
-        return float(total) if total else 0.0
-    
     async def generate_proactive_advice(
         self,
         db: AsyncSession,
@@ -204,7 +180,8 @@ class RecommendationEngine:
                         Transaction.transaction_type == TransactionType.EXPENSE,
                         Transaction.transaction_date >= start_date,
                         Transaction.transaction_date <= end_date,
-                        func.lower(Transaction.description).contains('кофе')
+                        # ILIKE использует триграммный индекс, в отличие от lower(...) LIKE
+                        Transaction.description.ilike('%кофе%')
                     )
                 )
             )
@@ -5,11 +5,17 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, and_, select
+from sqlalchemy import func, and_, select, case, cast, String
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 import logging
 
 from fintrek_async.app.models.transaction import Transaction, TransactionType
 from fintrek_async.app.models.category import Category
+from fintrek_async.app.models.merchant import Merchant
+from fintrek_async.app.models.category_stats import CategorySpendingStats
+from fintrek_async.app.ml.financial_snapshot import UserFinancialSnapshot
+from fintrek_async.app.services.category_stats_service import anomaly_threshold
+from fintrek_async.app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -102,69 +108,107 @@ class SpendingAnalyzer:
         self,
         db: AsyncSession,
         user_id: str,
-        min_occurrences: int = 3
+        min_occurrences: int = 3,
+        lookback_days: Optional[int] = None
     ) -> List[Dict]:
         """
         Выявить повторяющиеся платежи (подписки)
         
+        Считается одним запросом в PostgreSQL. Платежи продавца, отсортированные
+        по сумме, разбиваются на группы: новая группа начинается, когда сумма
+        больше предыдущей более чем на RECURRING_AMOUNT_TOLERANCE, поэтому
+        подписка с немного меняющейся ценой остается одной группой. Внутри
+        группы интервалы между платежами считаются через LAG по дате;
+        регулярность = 1 - коэффициент вариации интервалов.
+        
         Args:
             db: Database session
             user_id: ID пользователя
             min_occurrences: Минимальное количество повторений
+            lookback_days: Глубина анализа в днях (по умолчанию RECURRING_LOOKBACK_DAYS)
             
         Returns:
             Список повторяющихся платежей
         """
-        # Получить транзакции за последние 6 месяцев
         end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=180)
+        start_date = end_date - timedelta(days=lookback_days or settings.RECURRING_LOOKBACK_DAYS)
         
-        result = await db.execute(select(Transaction).filter(
+        # Разные написания одного продавца сводятся к нормализованному продавцу, если он определен
+        merchant_key = func.coalesce(cast(Transaction.merchant_id, String), Transaction.merchant_name)
+        # Порядок (сумма, дата) должен совпадать с порядком нумерации групп ниже
+        previous_amount = func.lag(Transaction.amount).over(
+            partition_by=merchant_key, order_by=(Transaction.amount, Transaction.transaction_date)
+        )
+        payments = select(
+            merchant_key.label('merchant_key'),
+            func.coalesce(Merchant.name, Transaction.merchant_name).label('merchant'),
+            Transaction.amount,
+            Transaction.transaction_date,
+            case(
+                (Transaction.amount - previous_amount > func.abs(previous_amount) * settings.RECURRING_AMOUNT_TOLERANCE, 1),
+                else_=0
+            ).label('amount_break')
+        ).outerjoin(Merchant, Merchant.id == Transaction.merchant_id).filter(
             and_(
                 Transaction.user_id == user_id,
                 Transaction.transaction_type == TransactionType.EXPENSE,
                 Transaction.transaction_date >= start_date,
-                Transaction.transaction_date <= end_date
+                Transaction.transaction_date <= end_date,
+                Transaction.merchant_name != None
             )
-        ))
-        transactions = result.scalars().all()
+        ).cte('payments')
         
-        # Группировать по продавцу и сумме
-        payment_groups = {}
+        # Номер группы близких сумм внутри продавца
+        groups = select(
+            payments,
+            func.sum(payments.c.amount_break).over(
+                partition_by=payments.c.merchant_key,
+                order_by=(payments.c.amount, payments.c.transaction_date),
+                rows=(None, 0)
+            ).label('amount_group')
+        ).cte('groups')
         
-        for txn in transactions:
-            if not txn.merchant_name:
-                continue
-            
-            key = (txn.merchant_name, float(txn.amount))
-            
-            if key not in payment_groups:
-                payment_groups[key] = []
-            
-            payment_groups[key].append(txn.transaction_date)
+        intervals = select(
+            groups,
+            (func.extract('epoch', groups.c.transaction_date - func.lag(groups.c.transaction_date).over(
+                partition_by=(groups.c.merchant_key, groups.c.amount_group),
+                order_by=groups.c.transaction_date
+            )) / 86400).label('interval_days')
+        ).cte('intervals')
+        
+        result = await db.execute(
+            select(
+                func.min(intervals.c.merchant).label('merchant'),
+                func.count().label('occurrences'),
+                # Текущая цена - сумма последнего платежа
+                func.array_agg(aggregate_order_by(intervals.c.amount, intervals.c.transaction_date.desc()))[1].label('amount'),
+                func.avg(intervals.c.interval_days).label('avg_interval'),
+                func.stddev_samp(intervals.c.interval_days).label('stddev_interval'),
+                func.max(intervals.c.transaction_date).label('last_payment')
+            ).group_by(
+                intervals.c.merchant_key, intervals.c.amount_group
+            ).having(func.count() >= min_occurrences)
+        )
         
-        # Найти повторяющиеся платежи
         recurring = []
         
-        for (merchant, amount), dates in payment_groups.items():
-            if len(dates) >= min_occurrences:
-                # Вычислить средний интервал между платежами
-                if len(dates) > 1:
-                    sorted_dates = sorted(dates)
-                    intervals = [
-                        (sorted_dates[i+1] - sorted_dates[i]).days
-                        for i in range(len(sorted_dates) - 1)
-                    ]
-                    avg_interval = sum(intervals) / len(intervals)
-                    
-                    recurring.append({
-                        'merchant': merchant,
-                        'amount': amount,
-                        'occurrences': len(dates),
-                        'avg_interval_days': round(avg_interval, 1),
-                        'last_payment': max(dates).isoformat(),
-                        'next_expected': (max(dates) + timedelta(days=avg_interval)).isoformat()
-                    })
+        for merchant, occurrences, amount, avg_interval, stddev_interval, last_payment in result.all():
+            avg_interval = float(avg_interval or 0)
+            if avg_interval <= 0:
+                continue
+            regularity = max(0.0, 1 - float(stddev_interval or 0) / avg_interval)
+            if regularity < settings.RECURRING_MIN_REGULARITY:
+                continue
+            
+            recurring.append({
+                'merchant': merchant,
+                'amount': float(amount),
+                'occurrences': occurrences,
+                'avg_interval_days': round(avg_interval, 1),
+                'regularity': round(regularity, 2),
+                'last_payment': last_payment.isoformat(),
+                'next_expected': (last_payment + timedelta(days=avg_interval)).isoformat()
+            })
         
         return sorted(recurring, key=lambda x: x['amount'], reverse=True)
     
@@ -172,91 +216,126 @@ class SpendingAnalyzer:
         self,
         db: AsyncSession,
         user_id: str,
-        threshold_multiplier: float = 2.0
+        threshold_multiplier: float = 2.0,
+        method: str = "stddev"
     ) -> List[Dict]:
         """
         Выявить аномальные транзакции (необычно большие расходы)
         
+        Статистика категорий за 3 месяца, отбор расходов последнего месяца
+        выше порога и названия категорий считаются одним запросом с CTE;
+        из БД возвращаются только аномальные транзакции.
+        
         Args:
             db: Database session
             user_id: ID пользователя
             threshold_multiplier: Множитель для определения аномалии
+            method: "stddev" - порог среднее + k * стандартное отклонение;
+                "mad" - устойчивый к выбросам порог медиана + k * MAD;
+                "online" - среднее + k * σ по накопленной статистике категорий
+                (category_spending_stats), без агрегации истории в запросе
             
         Returns:
             Список аномальных транзакций
         """
-        # Получить статистику по категориям за последние 3 месяца
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=90)
-        
-        # Вычислить среднюю и максимальную сумму по каждой категории
-        result = await db.execute(
-            select(
-                Transaction.category_id,
-                func.avg(Transaction.amount).label('avg_amount'),
-                func.stddev(Transaction.amount).label('stddev_amount')
-            ).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.EXPENSE,
-                    Transaction.transaction_date >= start_date,
-                    Transaction.transaction_date <= end_date
-                )
-            ).group_by(Transaction.category_id)
-        )
-        category_stats = result.all()
-        
-        # Создать словарь статистики
-        stats_dict = {
-            cat_id: {'avg': float(avg), 'stddev': float(stddev) if stddev else 0}
-            for cat_id, avg, stddev in category_stats
-        }
-        
-        # Найти аномальные транзакции за последний месяц
         recent_start = end_date - timedelta(days=30)
         
-        result = await db.execute(select(Transaction).filter(
-            and_(
+        def expenses_since(since: datetime):
+            return and_(
                 Transaction.user_id == user_id,
                 Transaction.transaction_type == TransactionType.EXPENSE,
-                Transaction.transaction_date >= recent_start,
+                Transaction.transaction_date >= since,
                 Transaction.transaction_date <= end_date
             )
-        ))
-        recent_transactions = result.scalars().all()
         
-        anomalies = []
+        stmt = select(
+            Transaction.id,
+            Transaction.transaction_date,
+            Transaction.amount,
+            Transaction.merchant_name,
+            Transaction.description,
+            Category.name
+        )
         
-        for txn in recent_transactions:
-            if not txn.category_id or txn.category_id not in stats_dict:
-                continue
-            
-            stats = stats_dict[txn.category_id]
-            threshold = stats['avg'] + (stats['stddev'] * threshold_multiplier)
+        if method == "online":
+            stats = CategorySpendingStats
+            stmt = stmt.join(
+                stats, and_(stats.user_id == Transaction.user_id, stats.category_id == Transaction.category_id)
+            ).outerjoin(
+                Category, Category.id == Transaction.category_id
+            ).filter(stats.count >= settings.CATEGORY_STATS_MIN_COUNT)
+            threshold = anomaly_threshold(threshold_multiplier)
+            return await self._select_anomalies(db, stmt, threshold, expenses_since(recent_start))
+        
+        stats_columns = [Transaction.category_id]
+        if method == "mad":
+            stats_columns.append(func.percentile_cont(0.5).within_group(Transaction.amount).label('median_amount'))
+        else:
+            stats_columns += [
+                func.avg(Transaction.amount).label('avg_amount'),
+                func.stddev(Transaction.amount).label('stddev_amount')
+            ]
+        category_stats = select(*stats_columns).filter(
+            expenses_since(start_date),
+            Transaction.category_id != None
+        ).group_by(Transaction.category_id).cte('category_stats')
+        
+        stmt = stmt.join(
+            category_stats, category_stats.c.category_id == Transaction.category_id
+        ).outerjoin(
+            Category, Category.id == Transaction.category_id
+        )
+        
+        if method == "mad":
+            # Медиана абсолютных отклонений от медианы; 1.4826 * MAD ~ σ для нормального распределения
+            category_mad = select(
+                Transaction.category_id,
+                func.percentile_cont(0.5).within_group(
+                    func.abs(Transaction.amount - category_stats.c.median_amount)
+                ).label('mad')
+            ).join(
+                category_stats, category_stats.c.category_id == Transaction.category_id
+            ).filter(expenses_since(start_date)).group_by(Transaction.category_id).cte('category_mad')
             
-            if float(txn.amount) > threshold:
-                result = await db.execute(select(Category).filter(
-                    Category.id == txn.category_id
-                ))
-                category = result.scalars().first()
-                
-                anomalies.append({
-                    'transaction_id': str(txn.id),
-                    'date': txn.transaction_date.isoformat(),
-                    'amount': float(txn.amount),
-                    'category': category.name if category else 'Unknown',
-                    'merchant': txn.merchant_name,
-                    'description': txn.description,
-                    'expected_max': round(threshold, 2),
-                    'deviation': round(float(txn.amount) - threshold, 2)
-                })
+            stmt = stmt.join(category_mad, category_mad.c.category_id == Transaction.category_id)
+            threshold = category_stats.c.median_amount + category_mad.c.mad * 1.4826 * threshold_multiplier
+        else:
+            threshold = category_stats.c.avg_amount + (
+                func.coalesce(category_stats.c.stddev_amount, 0) * threshold_multiplier
+            )
         
-        return sorted(anomalies, key=lambda x: x['deviation'], reverse=True)
+        return await self._select_anomalies(db, stmt, threshold, expenses_since(recent_start))
+    
+    async def _select_anomalies(self, db: AsyncSession, stmt, threshold, recent_filter) -> List[Dict]:
+        """Отобрать расходы выше порога и привести к формату ответа"""
+        result = await db.execute(
+            stmt.add_columns(threshold.label('threshold')).filter(
+                recent_filter,
+                Transaction.amount > threshold
+            ).order_by((Transaction.amount - threshold).desc())
+        )
+        
+        return [
+            {
+                'transaction_id': str(txn_id),
+                'date': transaction_date.isoformat(),
+                'amount': float(amount),
+                'category': category_name or 'Unknown',
+                'merchant': merchant_name,
+                'description': description,
+                'expected_max': round(float(threshold), 2),
+                'deviation': round(float(amount) - float(threshold), 2)
+            }
+            for txn_id, transaction_date, amount, merchant_name, description, category_name, threshold in result.all()
+        ]
     
     async def get_spending_trends(
         self,
         db: AsyncSession,
-        user_id: str
+        user_id: str,
+        snapshot: Optional[UserFinancialSnapshot] = None
     ) -> Dict:
         """
         Получить тренды расходов
@@ -264,39 +343,21 @@ class SpendingAnalyzer:
         Args:
             db: Database session
             user_id: ID пользователя
+            snapshot: Общий снимок данных запроса (иначе создается свой)
             
         Returns:
             Словарь с трендами
         """
+        snapshot = snapshot or UserFinancialSnapshot(db, user_id)
+        return await snapshot.memoize("spending_trends", lambda: self._spending_trends(snapshot))
+    
+    async def _spending_trends(self, snapshot: UserFinancialSnapshot) -> Dict:
         # Сравнить текущий месяц с предыдущим
-        now = datetime.utcnow()
-        current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        current_month_start = snapshot.now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         prev_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
         
-        # Расходы текущего месяца
-        result = await db.execute(
-            select(func.sum(Transaction.amount)).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.EXPENSE,
-                    Transaction.transaction_date >= current_month_start
-                )
-            )
-        )
-        current_spending = result.scalar() or Decimal(0)
-        
-        # Расходы предыдущего месяца
-        result = await db.execute(
-            select(func.sum(Transaction.amount)).filter(
-                and_(
-                    Transaction.user_id == user_id,
-                    Transaction.transaction_type == TransactionType.EXPENSE,
-                    Transaction.transaction_date >= prev_month_start,
-                    Transaction.transaction_date < current_month_start
-                )
-            )
-        )
-        prev_spending = result.scalar() or Decimal(0)
+        current_spending = await snapshot.total_since(TransactionType.EXPENSE, current_month_start)
+        prev_spending = await snapshot.month_total(TransactionType.EXPENSE, prev_month_start)
         
         # Вычислить изменение
         if prev_spending > 0:
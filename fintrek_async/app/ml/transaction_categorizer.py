@@ -2,13 +2,22 @@
 Модель машинного обучения для автоматической категоризации транзакций
 """
 import re
-from typing import Optional, Dict, List
+import time
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+from uuid import UUID
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, values, column
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 
-from fintrek_async.app.models.transaction import Transaction
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.models.transaction import Transaction, TransactionType
 from fintrek_async.app.models.category import Category, CategoryType
+from fintrek_async.app.ml.keyword_matcher import KeywordMatcher
+from fintrek_async.app.ml.category_classifier import category_classifier
+from fintrek_async.app.services.rollup_service import rollup_service, mark_touched_day
+from fintrek_async.app.services.merchant_service import merchant_service
 
 logger = logging.getLogger(__name__)
 
@@ -74,13 +83,163 @@ class TransactionCategorizer:
                 "подарок", "gift", "перевод от", "transfer from"
             ],
         }
+        
+        # Автоматы ключевых слов строятся один раз на словарь
+        self._expense_matcher = self._compile_keywords(self.expense_keywords)
+        self._income_matcher = self._compile_keywords(self.income_keywords)
+        
+        # Кэш системных категорий: (название, тип) -> ID и ID -> тип
+        self._system_categories: Dict[Tuple[str, CategoryType], str] = {}
+        self._system_category_types: Dict[str, CategoryType] = {}
+        self._categories_loaded_at: Optional[float] = None
+    
+    @staticmethod
+    def _compile_keywords(keywords_dict: Dict[str, List[str]]) -> Tuple[KeywordMatcher, List[str], List[List[int]]]:
+        """
+        Скомпилировать словарь {категория: [ключевые слова]} в автомат
+        
+        Returns:
+            (автомат, названия категорий по порядку, ID слова -> индексы категорий)
+        """
+        category_names = list(keywords_dict)
+        matcher = KeywordMatcher(
+            keyword for keywords in keywords_dict.values() for keyword in keywords
+        )
+        keyword_categories: List[List[int]] = [[] for _ in matcher.keywords]
+        for category_index, keywords in enumerate(keywords_dict.values()):
+            for keyword in set(keywords):
+                keyword_categories[matcher.keywords.index(keyword)].append(category_index)
+        return matcher, category_names, keyword_categories
+    
+    def match_category_name(self, text: str, is_expense: bool) -> Optional[str]:
+        """
+        Найти название категории по ключевым словам (без обращения к БД)
+        
+        Категория с наибольшим числом различных совпавших ключевых слов;
+        при равенстве - первая в словаре.
+        """
+        matcher, category_names, keyword_categories = (
+            self._expense_matcher if is_expense else self._income_matcher
+        )
+        
+        found = matcher.find(text)
+        if not found:
+            return None
+        
+        scores: Dict[int, int] = {}
+        for keyword_id in found:
+            for category_index in keyword_categories[keyword_id]:
+                scores[category_index] = scores.get(category_index, 0) + 1
+        
+        best_index = min(scores, key=lambda index: (-scores[index], index))
+        return category_names[best_index]
+    
+    async def load_system_categories(self, db: AsyncSession) -> None:
+        """Загрузить ID системных категорий в память (один запрос)"""
+        result = await db.execute(select(
+            Category.id, Category.name, Category.category_type
+        ).filter(Category.is_system == True))
+        
+        categories: Dict[Tuple[str, CategoryType], str] = {}
+        category_types: Dict[str, CategoryType] = {}
+        for category_id, name, category_type in result.all():
+            # Как и раньше, при дублях побеждает первая найденная категория
+            categories.setdefault((name, category_type), str(category_id))
+            category_types[str(category_id)] = category_type
+        
+        self._system_categories = categories
+        self._system_category_types = category_types
+        self._categories_loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(categories)} system categories")
+    
+    async def _ensure_system_categories(self, db: AsyncSession) -> None:
+        """
+        Перечитать кэш системных категорий, если истек CATEGORY_CACHE_TTL_SECONDS
+        
+        Кэш обновляется только по TTL: через API системные категории не
+        меняются, а scripts/init_categories.py работает в отдельном процессе
+        и сбросить кэш API-процессов не может.
+        """
+        if (
+            self._categories_loaded_at is None
+            or time.monotonic() - self._categories_loaded_at > settings.CATEGORY_CACHE_TTL_SECONDS
+        ):
+            await self.load_system_categories(db)
+    
+    async def _get_system_category_id(
+        self,
+        db: AsyncSession,
+        name: str,
+        category_type: CategoryType
+    ) -> Optional[str]:
+        """ID системной категории из кэша"""
+        await self._ensure_system_categories(db)
+        return self._system_categories.get((name, category_type))
+    
+    async def predict_with_model(
+        self,
+        db: AsyncSession,
+        texts: List[str],
+        category_types: List[CategoryType]
+    ) -> List[Optional[str]]:
+        """
+        Пакетное предсказание обучаемой моделью
+        
+        Возвращает None там, где модель не обучена, не уверена
+        (ниже CATEGORY_MODEL_MIN_CONFIDENCE) или предсказала категорию,
+        которой больше нет среди системных, - для таких строк
+        используются правила по ключевым словам.
+        """
+        if not texts or not category_classifier.is_ready:
+            return [None] * len(texts)
+        
+        await self._ensure_system_categories(db)
+        predicted, confidence = category_classifier.predict(
+            texts, [category_type.value for category_type in category_types]
+        )
+        return [
+            category_id
+            if category_id is not None
+            and score >= settings.CATEGORY_MODEL_MIN_CONFIDENCE
+            and self._system_category_types.get(category_id) == category_type
+            else None
+            for category_id, score, category_type in zip(predicted, confidence, category_types)
+        ]
+    
+    def learn_correction(
+        self,
+        description: Optional[str],
+        merchant_name: Optional[str],
+        category: Category
+    ) -> bool:
+        """
+        Дообучить модель на категории, выбранной пользователем вручную
+        
+        Учитываются только системные категории: пользовательские
+        у каждого свои и общей модели не подходят.
+        
+        Returns:
+            True если модель была дообучена
+        """
+        if not category.is_system or category.user_id is not None:
+            return False
+        
+        category_classifier.partial_fit(
+            [category_classifier.normalize(description, merchant_name)],
+            [str(category.id)],
+            [CategoryType(category.category_type).value]
+        )
+        return True
     
     async def categorize(
         self,
         description: str,
         merchant_name: Optional[str],
         amount: float,
-        db: AsyncSession
+        db: AsyncSession,
+        transaction_type: Optional[TransactionType] = None,
+        user_id: Optional[UUID] = None,
+        merchant_id: Optional[UUID] = None
     ) -> Optional[str]:
         """
         Определить категорию транзакции
@@ -90,51 +249,58 @@ class TransactionCategorizer:
             merchant_name: Название продавца
             amount: Сумма транзакции
             db: Database session
+            transaction_type: Тип транзакции; если не указан, определяется по знаку суммы
+            user_id: ID пользователя (для запомненной категории продавца)
+            merchant_id: ID нормализованного продавца
             
         Returns:
             ID категории или None
         """
+        # Известный продавец - категория из памяти
+        if user_id and merchant_id:
+            memo = await merchant_service.lookup_categories(db, user_id, [merchant_id])
+            if merchant_id in memo:
+                return str(memo[merchant_id])
+        
         # Объединить описание и название продавца
-        text = f"{description or ''} {merchant_name or ''}".lower()
+        text = category_classifier.normalize(description, merchant_name)
         
         # Определить тип транзакции (доход или расход)
-        is_expense = amount < 0
+        if transaction_type is not None:
+            is_expense = transaction_type == TransactionType.EXPENSE
+        else:
+            is_expense = amount < 0
         
-        # Выбрать соответствующий словарь ключевых слов
-        keywords_dict = self.expense_keywords if is_expense else self.income_keywords
+        # Выбрать тип категории
         category_type = CategoryType.EXPENSE if is_expense else CategoryType.INCOME
         
-        # Поиск совпадений с ключевыми словами
-        best_match = None
-        max_matches = 0
+        # Сначала обучаемая модель, если она уверена в ответе
+        predicted = await self.predict_with_model(db, [text], [category_type])
+        if predicted[0]:
+            return predicted[0]
         
-        for category_name, keywords in keywords_dict.items():
-            matches = sum(1 for keyword in keywords if keyword in text)
-            if matches > max_matches:
-                max_matches = matches
-                best_match = category_name
+        return await self._categorize_by_keywords(db, text, category_type)
+    
+    async def _categorize_by_keywords(
+        self,
+        db: AsyncSession,
+        text: str,
+        category_type: CategoryType
+    ) -> Optional[str]:
+        """Категория по правилам ключевых слов; без совпадений - 'Другое'"""
+        is_expense = category_type == CategoryType.EXPENSE
+        
+        # Поиск совпадений с ключевыми словами за один проход по тексту
+        best_match = self.match_category_name(text, is_expense)
         
         # Если найдено совпадение, вернуть ID категории
         if best_match:
-            result = await db.execute(select(Category).filter(
-                Category.name == best_match,
-                Category.category_type == category_type,
-                Category.is_system == True
-            ))
-            category = result.scalars().first()
-            
-            if category:
-                return str(category.id)
+            category_id = await self._get_system_category_id(db, best_match, category_type)
+            if category_id:
+                return category_id
         
         # Если не найдено совпадений, вернуть категорию "Другое"
-        result = await db.execute(select(Category).filter(
-            Category.name == "Другое",
-            Category.category_type == category_type,
-            Category.is_system == True
-        ))
-        other_category = result.scalars().first()
-        
-        return str(other_category.id) if other_category else None
+        return await self._get_system_category_id(db, "Другое", category_type)
     
     async def categorize_transaction(self, transaction: Transaction, db: AsyncSession) -> bool:
         """
@@ -154,7 +320,10 @@ class TransactionCategorizer:
             description=transaction.description,
             merchant_name=transaction.merchant_name,
             amount=float(transaction.amount),
-            db=db
+            db=db,
+            transaction_type=transaction.transaction_type,
+            user_id=transaction.user_id,
+            merchant_id=transaction.merchant_id
         )
         
         if category_id:
@@ -165,30 +334,116 @@ class TransactionCategorizer:
         
         return False
     
-    async def batch_categorize(self, db: AsyncSession, limit: int = 100) -> int:
+    async def batch_categorize(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        limit: Optional[int] = 100,
+        chunk_size: Optional[int] = None
+    ) -> int:
         """
-        Категоризировать пакет некатегоризированных транзакций
+        Категоризировать некатегоризированные транзакции пользователя
+        
+        Строки читаются пачками по keyset на id. Категория известного
+        продавца берется из памяти продавцов, остальные определяются моделью
+        (одним векторизованным вызовом на пачку) и правилами - для строк,
+        где модель не уверена. Результаты пишутся одним UPDATE ... FROM (VALUES ...)
+        на пачку. Дневные агрегаты пересчитываются и изменения фиксируются
+        одним commit в конце.
         
         Args:
             db: Database session
-            limit: Максимальное количество транзакций
+            user_id: ID пользователя
+            limit: Максимальное количество транзакций (None - все)
+            chunk_size: Размер пачки (по умолчанию CATEGORIZE_CHUNK_SIZE)
             
         Returns:
             Количество категоризированных транзакций
         """
-        # Получить некатегоризированные транзакции
-        result = await db.execute(select(Transaction).filter(
-            Transaction.category_id == None
-        ).limit(limit))
-        transactions = result.scalars().all()
-        
+        chunk_size = chunk_size or settings.CATEGORIZE_CHUNK_SIZE
         categorized_count = 0
+        processed = 0
+        last_id = None
+        touched = {}
+        
+        while limit is None or processed < limit:
+            batch_size = chunk_size if limit is None else min(chunk_size, limit - processed)
+            stmt = select(
+                Transaction.id,
+                Transaction.description,
+                Transaction.merchant_name,
+                Transaction.amount,
+                Transaction.transaction_type,
+                Transaction.transaction_date,
+                Transaction.merchant_id
+            ).filter(
+                Transaction.user_id == user_id,
+                Transaction.category_id == None
+            ).order_by(Transaction.id).limit(batch_size)
+            if last_id is not None:
+                stmt = stmt.filter(Transaction.id > last_id)
+            
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                break
+            processed += len(rows)
+            last_id = rows[-1].id
+            
+            # Известные продавцы: категория из памяти одним запросом на пачку
+            memo = await merchant_service.lookup_categories(
+                db, user_id, (row.merchant_id for row in rows if row.merchant_id)
+            )
+            updates = []
+            unknown = []
+            for row in rows:
+                if row.merchant_id in memo:
+                    updates.append((row.id, memo[row.merchant_id]))
+                    mark_touched_day(touched, user_id, row.transaction_date)
+                else:
+                    unknown.append(row)
+            
+            texts = [category_classifier.normalize(row.description, row.merchant_name) for row in unknown]
+            category_types = [
+                CategoryType.EXPENSE if row.transaction_type == TransactionType.EXPENSE else CategoryType.INCOME
+                for row in unknown
+            ]
+            predicted = await self.predict_with_model(db, texts, category_types)
+            
+            # Догадки модели и правил за продавцом не запоминаются: глобальная
+            # категория продавца - только из явного выбора пользователей
+            for row, text, category_type, category_id in zip(unknown, texts, category_types, predicted):
+                if category_id is None:
+                    category_id = await self._categorize_by_keywords(db, text, category_type)
+                if category_id:
+                    updates.append((row.id, UUID(category_id)))
+                    mark_touched_day(touched, user_id, row.transaction_date)
+            
+            if updates:
+                new_categories = values(
+                    column("id", PG_UUID(as_uuid=True)),
+                    column("category_id", PG_UUID(as_uuid=True)),
+                    name="new_categories"
+                ).data(updates)
+                await db.execute(
+                    update(Transaction).where(
+                        Transaction.id == new_categories.c.id,
+                        Transaction.user_id == user_id,
+                        Transaction.category_id == None
+                    ).values(
+                        category_id=new_categories.c.category_id,
+                        updated_at=datetime.utcnow()
+                    ).execution_options(synchronize_session=False)
+                )
+                categorized_count += len(updates)
+            
+            if len(rows) < batch_size:
+                break
         
-        for transaction in transactions:
-            if await self.categorize_transaction(transaction, db):
-                categorized_count += 1
+        if categorized_count:
+            await rollup_service.refresh_touched(db, touched)
+        await db.commit()
         
-        logger.info(f"Batch categorized {categorized_count} transactions")
+        logger.info(f"Batch categorized {categorized_count} of {processed} transactions for user {user_id}")
         return categorized_count
 
 
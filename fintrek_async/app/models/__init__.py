@@ -10,6 +10,10 @@ try:
     from fintrek_async.app.models.transaction import Transaction, TransactionType, TransactionStatus
     from fintrek_async.app.models.category import Category, CategoryType
     from fintrek_async.app.models.bank_connection import BankConnection, BankConnectionStatus
+    from fintrek_async.app.models.transaction_rollup import TransactionDailyRollup
+    from fintrek_async.app.models.merchant import Merchant, UserMerchantCategory
+    from fintrek_async.app.models.sync_job import SyncJob, SyncJobKind, SyncJobStatus
+    from fintrek_async.app.models.category_stats import CategorySpendingStats
 except ImportError:
     # Fallback на относительные импорты (для alembic)
     from .user import User, SubscriptionTier
@@ -17,6 +21,10 @@ except ImportError:
     from .transaction import Transaction, TransactionType, TransactionStatus
     from .category import Category, CategoryType
     from .bank_connection import BankConnection, BankConnectionStatus
+    from .transaction_rollup import TransactionDailyRollup
+    from .merchant import Merchant, UserMerchantCategory
+    from .sync_job import SyncJob, SyncJobKind, SyncJobStatus
+    from .category_stats import CategorySpendingStats
 
 __all__ = [
     "User",
@@ -31,4 +39,11 @@ __all__ = [
     "CategoryType",
     "BankConnection",
     "BankConnectionStatus",
+    "TransactionDailyRollup",
+    "Merchant",
+    "UserMerchantCategory",
+    "SyncJob",
+    "SyncJobKind",
+    "SyncJobStatus",
+    "CategorySpendingStats",
 ]
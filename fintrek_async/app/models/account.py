@@ -59,6 +59,7 @@ class Account(Base):
     status = Column(Enum(AccountStatus), default=AccountStatus.ACTIVE, nullable=False)
     last_synced_at = Column(DateTime, nullable=True)  # Время последней синхронизации
     sync_error = Column(String, nullable=True)  # Описание ошибки синхронизации
+    sync_watermark = Column(DateTime, nullable=True)  # Дата последней полученной от банка транзакции
     
     # Метаданные
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,41 @@
+"""
+Модель накопленной статистики расходов по категориям для SQLAlchemy
+"""
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+
+try:
+    from fintrek_async.app.db.base import Base
+except ImportError:
+    from ..db.base import Base
+
+
+class CategorySpendingStats(Base):
+    """
+    Статистика сумм расходов пользователя в категории
+
+    Обновляется инкрементально при каждой записи транзакций (rollup_service):
+    Welford-состояние (count, mean, m2) по всей истории и экспоненциально
+    затухающий по времени вариант (decayed_*) с периодом полураспада
+    CATEGORY_STATS_HALF_LIFE_DAYS (время отсчитывается от записи транзакции,
+    при полном пересчете - от ее даты). Дисперсия = m2 / (count - 1).
+    """
+    __tablename__ = "category_spending_stats"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Без внешнего ключа, как у дневных агрегатов
+    category_id = Column(UUID(as_uuid=True), primary_key=True)
+
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)  # Сумма квадратов отклонений от среднего
+
+    decayed_weight = Column(Float, nullable=False, default=0.0)
+    decayed_mean = Column(Float, nullable=False, default=0.0)
+    decayed_m2 = Column(Float, nullable=False, default=0.0)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # Момент, к которому приведено затухание
+
+    def __repr__(self):
+        return f"<CategorySpendingStats(user_id={self.user_id}, category_id={self.category_id}, count={self.count})>"
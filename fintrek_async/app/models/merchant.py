@@ -0,0 +1,57 @@
+"""
+Модели продавцов и запомненных категорий продавцов для SQLAlchemy
+"""
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+
+try:
+    from fintrek_async.app.db.base import Base
+except ImportError:
+    from ..db.base import Base
+
+
+class Merchant(Base):
+    """
+    Продавец/получатель с каноническим ключом
+
+    Разные написания одного продавца ("YANDEX*TAXI 1234", "Яндекс.Такси")
+    сводятся нормализатором merchant_service к одному ключу.
+    """
+    __tablename__ = "merchants"
+    __table_args__ = (
+        # Поиск по префиксу ключа (LIKE 'yandex%') при фильтрации транзакций
+        Index("ix_merchants_key_pattern", "key", postgresql_ops={"key": "text_pattern_ops"}),
+    )
+
+    # Генерируется на стороне БД, чтобы строки можно было вставлять через INSERT ... ON CONFLICT
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    key = Column(String, nullable=False, unique=True)  # Канонический ключ
+    name = Column(String, nullable=False)  # Первое встреченное написание
+
+    # Глобально запомненная системная категория продавца
+    category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<Merchant(id={self.id}, key={self.key})>"
+
+
+class UserMerchantCategory(Base):
+    """
+    Категория продавца, выбранная пользователем
+
+    Имеет приоритет над глобальной категорией продавца.
+    """
+    __tablename__ = "user_merchant_categories"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    merchant_id = Column(UUID(as_uuid=True), ForeignKey("merchants.id", ondelete="CASCADE"), primary_key=True)
+    category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UserMerchantCategory(user_id={self.user_id}, merchant_id={self.merchant_id})>"
@@ -0,0 +1,73 @@
+"""
+Модель фоновой задачи синхронизации с банком для SQLAlchemy
+"""
+from sqlalchemy import Column, String, DateTime, ForeignKey, Enum, Integer, Text, Index, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from datetime import datetime
+import uuid
+import enum
+
+try:
+    from fintrek_async.app.db.base import Base
+except ImportError:
+    from ..db.base import Base
+
+
+class SyncJobKind(str, enum.Enum):
+    """Виды фоновых синхронизаций"""
+    BANK_CONNECTION = "bank_connection"      # Подключение Open Banking целиком
+    VBANK_ACCOUNTS = "vbank_accounts"        # Счета VBank
+    VBANK_TRANSACTIONS = "vbank_transactions"  # Транзакции VBank
+
+
+class SyncJobStatus(str, enum.Enum):
+    """Статусы фоновой задачи"""
+    PENDING = "pending"      # В очереди
+    RUNNING = "running"      # Выполняется воркером
+    SUCCEEDED = "succeeded"  # Завершена успешно
+    FAILED = "failed"        # Завершена с ошибкой
+
+
+class SyncJob(Base):
+    """
+    Задача синхронизации в очереди на PostgreSQL
+
+    Воркеры забирают задачи через SELECT ... FOR UPDATE SKIP LOCKED.
+    Для одного dedupe_key одновременно существует не больше одной
+    незавершенной задачи: повторный запрос возвращает уже поставленную.
+    """
+    __tablename__ = "sync_jobs"
+    __table_args__ = (
+        # Очередь: выборка ближайших задач в ожидании
+        Index(
+            "ix_sync_jobs_pending_run_after",
+            "run_after",
+            postgresql_where=text("status = 'PENDING'")
+        ),
+        Index(
+            "uq_sync_jobs_active_dedupe_key",
+            "dedupe_key",
+            unique=True,
+            postgresql_where=text("status IN ('PENDING', 'RUNNING')")
+        ),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    kind = Column(Enum(SyncJobKind), nullable=False)
+    params = Column(JSONB, nullable=False, default=dict)  # Аргументы синхронизации
+    dedupe_key = Column(String, nullable=False)  # Вид + объект синхронизации
+
+    status = Column(Enum(SyncJobStatus), default=SyncJobStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)  # Не запускать раньше
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<SyncJob(id={self.id}, kind={self.kind}, status={self.status})>"
@@ -1,7 +1,7 @@
 """
 Модель транзакции для SQLAlchemy
 """
-from sqlalchemy import Column, String, DateTime, Numeric, ForeignKey, Enum, Text
+from sqlalchemy import Column, String, DateTime, Numeric, ForeignKey, Enum, Text, Index, Boolean
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -36,6 +36,7 @@ class Transaction(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     account_id = Column(UUID(as_uuid=True), ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False, index=True)
     category_id = Column(UUID(as_uuid=True), ForeignKey("categories.id", ondelete="SET NULL"), nullable=True, index=True)
+    merchant_id = Column(UUID(as_uuid=True), ForeignKey("merchants.id", ondelete="SET NULL"), nullable=True)
     
     # Информация о транзакции
     transaction_type = Column(Enum(TransactionType), nullable=False)
@@ -55,6 +56,8 @@ class Transaction(Base):
     
     # Статус
     status = Column(Enum(TransactionStatus), default=TransactionStatus.COMPLETED, nullable=False)
+    # Необычно большой расход для категории; определяется при записи (NULL - еще не оценен)
+    is_anomaly = Column(Boolean, nullable=True)
     
     # Для переводов между счетами
     related_account_id = Column(UUID(as_uuid=True), ForeignKey("accounts.id", ondelete="SET NULL"), nullable=True)
@@ -74,3 +77,43 @@ class Transaction(Base):
     
     def __repr__(self):
         return f"<Transaction(id={self.id}, type={self.transaction_type}, amount={self.amount})>"
+
+
+# Горячие запросы аналитики и ML: user_id + тип + диапазон дат с агрегацией суммы.
+# INCLUDE позволяет суммировать по категориям через index-only scan
+Index(
+    "ix_transactions_user_type_date",
+    Transaction.user_id,
+    Transaction.transaction_type,
+    Transaction.transaction_date,
+    postgresql_include=["amount", "category_id"]
+)
+
+# Keyset-пагинация списка транзакций: (transaction_date desc, id desc)
+Index(
+    "ix_transactions_user_date_id",
+    Transaction.user_id,
+    Transaction.transaction_date.desc(),
+    Transaction.id.desc()
+)
+
+# Транзакции пользователя по нормализованному продавцу (повторяющиеся платежи, поиск)
+Index(
+    "ix_transactions_user_merchant",
+    Transaction.user_id,
+    Transaction.merchant_id
+)
+
+# Поиск по подстроке (q=) в описании и названии продавца: GIN-индексы pg_trgm
+Index(
+    "ix_transactions_description_trgm",
+    Transaction.description,
+    postgresql_using="gin",
+    postgresql_ops={"description": "gin_trgm_ops"}
+)
+Index(
+    "ix_transactions_merchant_name_trgm",
+    Transaction.merchant_name,
+    postgresql_using="gin",
+    postgresql_ops={"merchant_name": "gin_trgm_ops"}
+)
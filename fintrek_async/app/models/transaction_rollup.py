@@ -0,0 +1,55 @@
+"""
+Модель дневных агрегатов транзакций для SQLAlchemy
+"""
+from sqlalchemy import Column, Date, DateTime, Numeric, Integer, ForeignKey, Enum, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+
+try:
+    from fintrek_async.app.db.base import Base
+    from fintrek_async.app.models.transaction import TransactionType
+except ImportError:
+    from ..db.base import Base
+    from .transaction import TransactionType
+
+# Значение category_id строк без категории в уникальном ключе
+NO_CATEGORY = "00000000-0000-0000-0000-000000000000"
+
+
+class TransactionDailyRollup(Base):
+    """
+    Дневной агрегат транзакций пользователя
+
+    Одна строка на (user_id, day, category_id, transaction_type).
+    Поддерживается сервисом rollup_service при каждой записи транзакций,
+    аналитические эндпоинты читают только эту таблицу.
+    """
+    __tablename__ = "transaction_daily_rollups"
+    __table_args__ = (
+        # COALESCE: строки без категории тоже уникальны (обычный индекс считает NULL различными)
+        Index(
+            "ix_transaction_daily_rollups_key",
+            "user_id", "day", text(f"COALESCE(category_id, '{NO_CATEGORY}'::uuid)"), "transaction_type",
+            unique=True
+        ),
+    )
+
+    # Генерируется на стороне БД, чтобы строки можно было вставлять через INSERT ... SELECT
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    # Без внешнего ключа: агрегат денормализован, удаление категории его не ломает
+    category_id = Column(UUID(as_uuid=True), nullable=True)
+    transaction_type = Column(Enum(TransactionType), nullable=False)
+
+    # Агрегаты за день
+    total_amount = Column(Numeric(18, 2), nullable=False)
+    tx_count = Column(Integer, nullable=False)
+    sum_squares = Column(Numeric(30, 4), nullable=False)  # Для дисперсии без повторного чтения сырых строк
+    min_amount = Column(Numeric(15, 2), nullable=False)
+    max_amount = Column(Numeric(15, 2), nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<TransactionDailyRollup(user_id={self.user_id}, day={self.day}, total={self.total_amount})>"
@@ -42,6 +42,12 @@ class BankConnectionListResponse(BaseModel):
 class BankConnectionSync(BaseModel):
     """Схема для запроса синхронизации"""
     connection_id: UUID4 = Field(..., description="ID подключения к банку")
+    backfill_days: Optional[int] = Field(
+        None,
+        ge=1,
+        le=3650,
+        description="Разовая глубокая загрузка за N дней вместо инкрементальной синхронизации"
+    )
 
 
 class BankConnectionSyncResponse(BaseModel):
@@ -49,4 +55,6 @@ class BankConnectionSyncResponse(BaseModel):
     success: bool
     message: str
     accounts_synced: int
-    transactions_synced: int
+    transactions_synced: int = Field(..., description="Количество новых транзакций")
+    transactions_updated: int = Field(default=0, description="Количество измененных банком транзакций")
+    transactions_skipped: int = Field(default=0, description="Количество пропущенных транзакций банка без внешнего ID")
@@ -0,0 +1,24 @@
+"""
+Pydantic схемы для SyncJob
+"""
+from pydantic import BaseModel, UUID4
+from datetime import datetime
+from typing import Any, Dict, Optional
+from fintrek_async.app.models.sync_job import SyncJobKind, SyncJobStatus
+
+
+class SyncJobResponse(BaseModel):
+    """Схема ответа с фоновой задачей синхронизации"""
+    id: UUID4
+    kind: SyncJobKind
+    status: SyncJobStatus
+    attempts: int
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    run_after: datetime
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
@@ -4,7 +4,7 @@ Pydantic схемы для Transaction
 from pydantic import BaseModel, UUID4, Field, field_validator
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, Union
+from typing import Optional, Union, Literal
 from fintrek_async.app.models.transaction import TransactionType, TransactionStatus
 
 
@@ -92,10 +92,12 @@ class TransactionResponse(TransactionBase):
     user_id: UUID4
     account_id: UUID4
     category_id: Optional[UUID4]
+    merchant_id: Optional[UUID4] = None
     related_account_id: Optional[UUID4]
     posted_date: Optional[datetime]
     status: TransactionStatus
     external_id: Optional[str]
+    is_anomaly: Optional[bool] = Field(None, description="Необычно большой расход для категории (оценивается при записи)")
     created_at: datetime
     updated_at: datetime
     
@@ -106,9 +108,25 @@ class TransactionResponse(TransactionBase):
 class TransactionListResponse(BaseModel):
     """Схема для списка транзакций"""
     transactions: list[TransactionResponse]
-    total: int
+    total: Optional[int] = Field(None, description="Общее количество (null, если include_total=false)")
     page: int
     page_size: int
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (null на последней странице)")
+
+
+class TransactionBulkItemResult(BaseModel):
+    """Результат импорта одной строки"""
+    index: int = Field(..., description="Порядковый номер строки во входных данных (с 0)")
+    status: Literal["created", "error"]
+    id: Optional[UUID4] = Field(None, description="ID созданной транзакции")
+    error: Optional[str] = Field(None, description="Причина отказа")
+
+
+class TransactionBulkResponse(BaseModel):
+    """Схема ответа массового импорта транзакций"""
+    created: int
+    failed: int
+    results: list[TransactionBulkItemResult]
 
 
 class TransactionFilter(BaseModel):
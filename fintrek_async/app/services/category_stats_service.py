@@ -0,0 +1,210 @@
+"""
+Сервис накопленной статистики расходов по категориям (category_spending_stats)
+"""
+from typing import Dict, Iterable, Optional, Tuple
+from datetime import date, datetime
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, insert, func, case, cast, literal, values, column, Date, Float, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert, UUID as PG_UUID
+import logging
+
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.models.transaction import Transaction, TransactionType
+from fintrek_async.app.models.category_stats import CategorySpendingStats
+
+logger = logging.getLogger(__name__)
+
+# Изменение статистики категории: (число транзакций, сумма, сумма квадратов); может быть отрицательным
+StatsDelta = Tuple[int, float, float]
+
+
+def stats_stddev(stats=CategorySpendingStats):
+    """SQL-выражение выборочного стандартного отклонения по Welford-состоянию"""
+    return func.sqrt(stats.m2 / func.greatest(stats.count - 1, 1))
+
+
+def anomaly_threshold(threshold_multiplier: float, stats=CategorySpendingStats):
+    """SQL-выражение порога аномалии: среднее + k * σ"""
+    return stats.mean + stats_stddev(stats) * threshold_multiplier
+
+
+class CategoryStatsService:
+    """
+    Поддержка таблицы category_spending_stats
+
+    Изменения приходят из rollup_service как разница дневных агрегатов
+    до и после записи транзакций (число, сумма, сумма квадратов), поэтому
+    вставка, изменение и удаление обрабатываются одинаково - изменение
+    знакового размера объединяется с текущим состоянием формулой Чана в
+    форме со сдвигом к текущему среднему:
+
+        n' = n + Δn,  D = Δsum - Δn·mean,  Q = Δsumsq - 2·mean·Δsum + Δn·mean²
+        mean' = mean + D / n',  m2' = m2 + Q - D² / n'
+
+    Формулы выполняются в UPDATE, поэтому параллельные записи не теряют
+    изменений. Для затухающего варианта текущее состояние сначала
+    умножается на 0.5^(прошедшее время / период полураспада). Удаление
+    старых транзакций из затухающего варианта вычитается с весом 1, то есть
+    приближенно.
+    """
+
+    async def flag_new_transactions(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        range_start: datetime,
+        range_end: datetime,
+        days: Iterable[date]
+    ) -> None:
+        """
+        Оценить еще не оцененные расходы за дни по текущей статистике категорий
+
+        Вызывается до учета новых транзакций в статистике: транзакция
+        сравнивается с историей без нее самой. При недостаточной истории
+        (меньше CATEGORY_STATS_MIN_COUNT) транзакция считается обычной.
+        """
+        stats = CategorySpendingStats
+        is_anomaly = select(
+            Transaction.amount > anomaly_threshold(settings.ANOMALY_THRESHOLD_MULTIPLIER)
+        ).where(
+            stats.user_id == Transaction.user_id,
+            stats.category_id == Transaction.category_id,
+            stats.count >= settings.CATEGORY_STATS_MIN_COUNT
+        ).scalar_subquery()
+
+        await db.execute(
+            update(Transaction).where(
+                Transaction.user_id == user_id,
+                Transaction.transaction_date >= range_start,
+                Transaction.transaction_date < range_end,
+                cast(Transaction.transaction_date, Date).in_(days),
+                Transaction.is_anomaly == None,
+                Transaction.transaction_type == TransactionType.EXPENSE,
+                Transaction.category_id != None
+            ).values(is_anomaly=func.coalesce(is_anomaly, False)).execution_options(synchronize_session=False)
+        )
+
+    async def apply_deltas(self, db: AsyncSession, user_id: UUID, deltas: Dict[UUID, StatsDelta]) -> None:
+        """
+        Учесть изменения расходов пользователя {ID категории: (Δn, Δsum, Δsumsq)}
+
+        Вызывается в той же транзакции БД, что и запись транзакций.
+        """
+        deltas = {category_id: delta for category_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        now = datetime.utcnow()
+        # Сортировка - одинаковый порядок блокировок строк в параллельных записях
+        category_ids = sorted(deltas)
+
+        await db.execute(
+            pg_insert(CategorySpendingStats).values([
+                {
+                    "user_id": user_id, "category_id": category_id, "count": 0, "mean": 0.0, "m2": 0.0,
+                    "decayed_weight": 0.0, "decayed_mean": 0.0, "decayed_m2": 0.0, "updated_at": now
+                }
+                for category_id in category_ids
+            ]).on_conflict_do_nothing(index_elements=["user_id", "category_id"])
+        )
+
+        changes = values(
+            column("category_id", PG_UUID(as_uuid=True)),
+            column("n", Float),
+            column("sum", Float),
+            column("sumsq", Float),
+            name="stats_changes"
+        ).data([(category_id, *map(float, deltas[category_id])) for category_id in category_ids])
+
+        stats = CategorySpendingStats
+        count = stats.count + changes.c.n
+        d = changes.c.sum - changes.c.n * stats.mean
+        q = changes.c.sumsq - 2 * stats.mean * changes.c.sum + changes.c.n * stats.mean * stats.mean
+
+        half_lives = func.extract("epoch", now - stats.updated_at) / (settings.CATEGORY_STATS_HALF_LIFE_DAYS * 86400)
+        decay = func.power(0.5, func.greatest(half_lives, 0))
+        weight = stats.decayed_weight * decay + changes.c.n
+        dw = changes.c.sum - changes.c.n * stats.decayed_mean
+        qw = changes.c.sumsq - 2 * stats.decayed_mean * changes.c.sum + changes.c.n * stats.decayed_mean * stats.decayed_mean
+
+        await db.execute(
+            update(stats).where(
+                stats.user_id == user_id,
+                stats.category_id == changes.c.category_id
+            ).values(
+                count=count,
+                mean=case((count > 0, stats.mean + d / count), else_=0.0),
+                m2=case((count > 0, func.greatest(stats.m2 + q - d * d / count, 0.0)), else_=0.0),
+                decayed_weight=func.greatest(weight, 0.0),
+                decayed_mean=case((weight > 0, stats.decayed_mean + dw / weight), else_=0.0),
+                decayed_m2=case(
+                    (weight > 0, func.greatest(stats.decayed_m2 * decay + qw - dw * dw / weight, 0.0)),
+                    else_=0.0
+                ),
+                updated_at=now
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def rebuild(self, db: AsyncSession, user_id: Optional[UUID] = None) -> None:
+        """
+        Полностью пересчитать статистику по сырым транзакциям (backfill)
+
+        Затухающий вариант пересчитывается с весом транзакции
+        0.5^(возраст / период полураспада).
+        """
+        now = datetime.utcnow()
+        delete_stmt = delete(CategorySpendingStats)
+        conditions = [
+            Transaction.transaction_type == TransactionType.EXPENSE,
+            Transaction.category_id != None
+        ]
+        if user_id is not None:
+            delete_stmt = delete_stmt.where(CategorySpendingStats.user_id == user_id)
+            conditions.append(Transaction.user_id == user_id)
+        await db.execute(delete_stmt)
+
+        amount = cast(Transaction.amount, Float)
+        age = func.extract("epoch", now - Transaction.transaction_date) / (settings.CATEGORY_STATS_HALF_LIFE_DAYS * 86400)
+        w = func.power(0.5, func.greatest(age, 0))
+        weighted = select(
+            Transaction.user_id,
+            Transaction.category_id,
+            amount.label("amount"),
+            w.label("w")
+        ).where(and_(*conditions)).subquery()
+
+        decayed_weight = func.sum(weighted.c.w)
+        decayed_mean = func.sum(weighted.c.w * weighted.c.amount) / decayed_weight
+        stmt = select(
+            weighted.c.user_id,
+            weighted.c.category_id,
+            func.count(),
+            func.avg(weighted.c.amount),
+            func.coalesce(func.var_pop(weighted.c.amount) * func.count(), 0.0),
+            decayed_weight,
+            decayed_mean,
+            func.greatest(
+                func.sum(weighted.c.w * weighted.c.amount * weighted.c.amount) - decayed_weight * decayed_mean * decayed_mean,
+                0.0
+            ),
+            literal(now)
+        ).group_by(weighted.c.user_id, weighted.c.category_id)
+
+        await db.execute(insert(CategorySpendingStats).from_select(
+            ["user_id", "category_id", "count", "mean", "m2",
+             "decayed_weight", "decayed_mean", "decayed_m2", "updated_at"],
+            stmt
+        ))
+
+    async def get_stats(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        category_id: UUID
+    ) -> Optional[CategorySpendingStats]:
+        """Статистика категории пользователя (поиск по первичному ключу)"""
+        return await db.get(CategorySpendingStats, (user_id, category_id))
+
+
+# Singleton instance
+category_stats_service = CategoryStatsService()
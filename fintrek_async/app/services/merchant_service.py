@@ -0,0 +1,276 @@
+"""
+Сервис нормализации продавцов и запомненных категорий продавцов
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import logging
+
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.models.merchant import Merchant, UserMerchantCategory
+from fintrek_async.app.models.category import Category
+from fintrek_async.app.models.transaction import Transaction
+
+logger = logging.getLogger(__name__)
+
+# Транслитерация, чтобы "Яндекс.Такси" и "YANDEX*TAXI" давали один ключ
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "c", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "",
+    "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+# "яндекс" -> "yandeks" -> "yandex"
+_KS_RE = re.compile(r"ks")
+_SEPARATOR_RE = re.compile(r"[^a-z0-9]+")
+_DIGIT_RE = re.compile(r"\d")
+
+# Слова, не идентифицирующие продавца: правовые формы, география, типы операций
+_NOISE_TOKENS = frozenset({
+    "ooo", "oao", "zao", "pao", "ao", "ip", "llc", "ltd", "inc", "gmbh",
+    "rus", "ru", "rf", "moskva", "moscow", "msk", "spb", "sankt", "peterburg",
+    "pos", "www", "com", "oplata", "pokupka", "platezh", "spisanie", "v",
+})
+_MAX_KEY_TOKENS = 4
+
+# Размер пачки для INSERT/SELECT по списку ключей
+_CHUNK_SIZE = 1000
+
+
+def normalize_merchant(raw: Optional[str]) -> Optional[str]:
+    """
+    Канонический ключ продавца
+
+    "YANDEX*TAXI 1234" и "Яндекс.Такси" -> "yandex taxi".
+    Токены с цифрами (номера терминалов, маски карт) и служебные слова
+    отбрасываются.
+
+    Returns:
+        Ключ или None, если в строке нет значимых слов
+    """
+    if not raw:
+        return None
+    text = _KS_RE.sub("x", raw.lower().translate(_TRANSLIT))
+    tokens = [
+        token for token in _SEPARATOR_RE.split(text)
+        if len(token) > 1 and token not in _NOISE_TOKENS and not _DIGIT_RE.search(token)
+    ]
+    if not tokens:
+        return None
+    return " ".join(tokens[:_MAX_KEY_TOKENS])
+
+
+class MerchantService:
+    """
+    Продавцы и запомненные категории продавцов
+
+    Продавец определяется только по merchant_name. Описание транзакции -
+    свободный текст пользователя: в общую таблицу merchants оно не
+    попадает, иначе было бы видно другим пользователям, а типовые описания
+    ("Перевод ...", "Оплата ...") слились бы в одного мнимого продавца.
+    Категория известного продавца берется из памяти (сначала выбор
+    пользователя, затем глобальная категория), без запуска классификатора.
+    Глобальная категория появляется только из явного выбора пользователей:
+    когда одну системную категорию продавцу выбрали не меньше
+    MERCHANT_GLOBAL_MIN_USERS разных пользователей. Догадки модели и
+    правил в память не попадают.
+    """
+
+    # Предел кэша ключ -> ID продавца в процессе
+    MAX_CACHED_KEYS = 100_000
+
+    def __init__(self):
+        # Кэшируются только продавцы, уже существовавшие в БД: ID, вставленный
+        # в незафиксированной транзакции, может исчезнуть при откате
+        self._ids: Dict[str, UUID] = {}
+
+    async def resolve(self, db: AsyncSession, raw_names: Iterable[Optional[str]]) -> Dict[str, UUID]:
+        """
+        Найти или создать продавцов для набора исходных строк
+
+        Args:
+            db: Database session
+            raw_names: Исходные названия продавцов
+
+        Returns:
+            {исходная строка: ID продавца} для строк с непустым ключом
+        """
+        raw_keys: Dict[str, str] = {}
+        names: Dict[str, str] = {}
+        for raw in set(raw_names):
+            key = normalize_merchant(raw)
+            if key:
+                raw_keys[raw] = key
+                names.setdefault(key, raw.strip())
+
+        resolved = {key: self._ids[key] for key in names if key in self._ids}
+        # Сортировка ключей - одинаковый порядок блокировок в параллельных импортах
+        missing = sorted(key for key in names if key not in resolved)
+        now = datetime.utcnow()
+        for start in range(0, len(missing), _CHUNK_SIZE):
+            chunk = missing[start:start + _CHUNK_SIZE]
+            inserted = await db.execute(
+                pg_insert(Merchant).values([
+                    {"key": key, "name": names[key], "created_at": now, "updated_at": now}
+                    for key in chunk
+                ]).on_conflict_do_nothing(index_elements=["key"]).returning(Merchant.key, Merchant.id)
+            )
+            resolved.update(inserted.all())
+
+            existing = [key for key in chunk if key not in resolved]
+            if existing:
+                rows = (await db.execute(
+                    select(Merchant.key, Merchant.id).where(Merchant.key.in_(existing))
+                )).all()
+                if len(self._ids) + len(rows) > self.MAX_CACHED_KEYS:
+                    self._ids.clear()
+                self._ids.update(rows)
+                resolved.update(rows)
+
+        return {raw: resolved[key] for raw, key in raw_keys.items()}
+
+    async def lookup_categories(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        merchant_ids: Iterable[UUID]
+    ) -> Dict[UUID, UUID]:
+        """
+        Запомненные категории продавцов для пользователя (один запрос на пачку)
+
+        Returns:
+            {ID продавца: ID категории}; выбор пользователя важнее глобального
+        """
+        merchant_ids = list(set(merchant_ids))
+        categories: Dict[UUID, UUID] = {}
+        for start in range(0, len(merchant_ids), _CHUNK_SIZE):
+            stmt = select(
+                Merchant.id,
+                func.coalesce(UserMerchantCategory.category_id, Merchant.category_id)
+            ).outerjoin(UserMerchantCategory, and_(
+                UserMerchantCategory.merchant_id == Merchant.id,
+                UserMerchantCategory.user_id == user_id
+            )).where(Merchant.id.in_(merchant_ids[start:start + _CHUNK_SIZE]))
+            categories.update(
+                (merchant_id, category_id)
+                for merchant_id, category_id in (await db.execute(stmt)).all()
+                if category_id is not None
+            )
+        return categories
+
+    async def remember_user_categories(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        categories: Dict[UUID, UUID]
+    ) -> None:
+        """
+        Запомнить выбор пользователя {ID продавца: ID категории}
+
+        Продавцы, для которых набралось согласие пользователей, получают
+        глобальную категорию (см. promote_global_categories).
+        """
+        if not categories:
+            return
+        now = datetime.utcnow()
+        stmt = pg_insert(UserMerchantCategory).values([
+            {"user_id": user_id, "merchant_id": merchant_id, "category_id": category_id, "updated_at": now}
+            for merchant_id, category_id in sorted(categories.items())
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "merchant_id"],
+            set_={"category_id": stmt.excluded.category_id, "updated_at": stmt.excluded.updated_at}
+        ))
+        await self.promote_global_categories(db, categories.keys())
+
+    async def promote_global_categories(self, db: AsyncSession, merchant_ids: Iterable[UUID]) -> None:
+        """
+        Запомнить глобальную категорию продавцов, выбранную разными пользователями
+
+        Берется системная категория, которую выбрали не меньше
+        MERCHANT_GLOBAL_MIN_USERS пользователей (при нескольких - самая
+        частая). Уже запомненная категория не перезаписывается.
+        """
+        merchant_ids = sorted(set(merchant_ids))
+        if not merchant_ids:
+            return
+        choices = UserMerchantCategory
+        agreed = select(
+            choices.merchant_id,
+            choices.category_id
+        ).join(
+            Category, Category.id == choices.category_id
+        ).where(
+            choices.merchant_id.in_(merchant_ids),
+            Category.is_system == True,
+            Category.user_id == None
+        ).group_by(
+            choices.merchant_id, choices.category_id
+        ).having(
+            func.count() >= settings.MERCHANT_GLOBAL_MIN_USERS
+        ).order_by(
+            choices.merchant_id, func.count().desc(), choices.category_id
+        ).distinct(choices.merchant_id).subquery("agreed")
+
+        await db.execute(
+            update(Merchant).where(
+                Merchant.id == agreed.c.merchant_id,
+                Merchant.category_id == None
+            ).values(
+                category_id=agreed.c.category_id,
+                updated_at=datetime.utcnow()
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def assign(self, db: AsyncSession, user_id: UUID, transactions: List[Transaction]) -> int:
+        """
+        Связать новые транзакции с продавцами и проставить запомненные категории
+
+        Вызывается до flush(): объекты транзакций меняются в памяти.
+
+        Returns:
+            Количество транзакций, получивших категорию из памяти
+        """
+        if not transactions:
+            return 0
+
+        merchant_ids = await self.resolve(
+            db, (tx.merchant_name for tx in transactions)
+        )
+        for tx in transactions:
+            tx.merchant_id = merchant_ids.get(tx.merchant_name)
+
+        memo = await self.lookup_categories(
+            db, user_id, (tx.merchant_id for tx in transactions if tx.merchant_id and not tx.category_id)
+        )
+        categorized = 0
+        for tx in transactions:
+            if not tx.category_id and tx.merchant_id in memo:
+                tx.category_id = memo[tx.merchant_id]
+                categorized += 1
+        return categorized
+
+    async def assign_rows(self, db: AsyncSession, user_id: UUID, rows: List[Dict[str, Any]]) -> None:
+        """
+        То же, что assign, для строк многострочного INSERT (словарей значений)
+
+        Заполняет ключи merchant_id и category_id каждой строки.
+        """
+        merchant_ids = await self.resolve(
+            db, (row.get("merchant_name") for row in rows)
+        )
+        for row in rows:
+            row["merchant_id"] = merchant_ids.get(row.get("merchant_name"))
+
+        memo = await self.lookup_categories(db, user_id, (row["merchant_id"] for row in rows if row["merchant_id"]))
+        for row in rows:
+            row["category_id"] = memo.get(row["merchant_id"])
+
+
+# Singleton instance
+merchant_service = MerchantService()
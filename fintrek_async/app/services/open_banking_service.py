@@ -3,7 +3,8 @@
 """
 from typing import Optional, Dict, List, Any
 from datetime import datetime, timedelta
-import httpx
+from fintrek_async.app.clients.http_pool import http_client_pool
+from fintrek_async.app.clients.resilience import send_with_retry
 from fintrek_async.app.models.bank_connection import BankConnection, BankConnectionStatus
 from fintrek_async.app.models.account import Account, AccountType, AccountStatus
 from fintrek_async.app.models.transaction import Transaction, TransactionType, TransactionStatus
@@ -20,7 +21,8 @@ class OpenBankingService:
         self.base_url = getattr(settings, "OPEN_BANKING_API_URL", "https://api.example-bank.ru")
         self.client_id = getattr(settings, "OPEN_BANKING_CLIENT_ID", "")
         self.client_secret = getattr(settings, "OPEN_BANKING_CLIENT_SECRET", "")
-        self.timeout = 30.0
+        # Имя API для circuit breaker и метрик повторов
+        self.provider = "open_banking"
     
     async def initiate_oauth_flow(self, bank_name: str, redirect_uri: str) -> Dict[str, str]:
         """
@@ -59,19 +61,23 @@ class OpenBankingService:
             Dict с access_token, refresh_token, expires_in
         """
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/oauth/token",
-                    data={
-                        "grant_type": "authorization_code",
-                        "code": code,
-                        "redirect_uri": redirect_uri,
-                        "client_id": self.client_id,
-                        "client_secret": self.client_secret
-                    }
-                )
-                response.raise_for_status()
-                return response.json()
+            # Обмен токенов не повторяется (код и refresh token одноразовые)
+            response = await send_with_retry(
+                http_client_pool.client(self.base_url),
+                "POST",
+                f"{self.base_url}/oauth/token",
+                provider=self.provider,
+                idempotent=False,
+                data={
+                    "grant_type": "authorization_code",
+                    "code": code,
+                    "redirect_uri": redirect_uri,
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret
+                }
+            )
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Error exchanging code for tokens: {e}")
             raise
@@ -87,18 +93,22 @@ class OpenBankingService:
             Dict с новым access_token и expires_in
         """
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/oauth/token",
-                    data={
-                        "grant_type": "refresh_token",
-                        "refresh_token": refresh_token,
-                        "client_id": self.client_id,
-                        "client_secret": self.client_secret
-                    }
-                )
-                response.raise_for_status()
-                return response.json()
+            # Обмен токенов не повторяется (код и refresh token одноразовые)
+            response = await send_with_retry(
+                http_client_pool.client(self.base_url),
+                "POST",
+                f"{self.base_url}/oauth/token",
+                provider=self.provider,
+                idempotent=False,
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": refresh_token,
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret
+                }
+            )
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
             logger.error(f"Error refreshing access token: {e}")
             raise
@@ -114,14 +124,16 @@ class OpenBankingService:
             Список счетов
         """
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/accounts",
-                    headers={"Authorization": f"Bearer {access_token}"}
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("accounts", [])
+            response = await send_with_retry(
+                http_client_pool.client(self.base_url),
+                "GET",
+                f"{self.base_url}/api/v1/accounts",
+                provider=self.provider,
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data.get("accounts", [])
         except Exception as e:
             logger.error(f"Error fetching accounts: {e}")
             raise
@@ -152,15 +164,17 @@ class OpenBankingService:
             if date_to:
                 params["date_to"] = date_to.isoformat()
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/accounts/{account_id}/transactions",
-                    headers={"Authorization": f"Bearer {access_token}"},
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("transactions", [])
+            response = await send_with_retry(
+                http_client_pool.client(self.base_url),
+                "GET",
+                f"{self.base_url}/api/v1/accounts/{account_id}/transactions",
+                provider=self.provider,
+                headers={"Authorization": f"Bearer {access_token}"},
+                params=params
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data.get("transactions", [])
         except Exception as e:
             logger.error(f"Error fetching transactions: {e}")
             raise
@@ -0,0 +1,195 @@
+"""
+Сервис поддержки дневных агрегатов транзакций (transaction_daily_rollups)
+"""
+from typing import Dict, Iterable, Optional, Set
+from datetime import date, datetime, time, timedelta
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, func, cast, Date
+import logging
+
+from fintrek_async.app.models.transaction import Transaction, TransactionType
+from fintrek_async.app.models.transaction_rollup import TransactionDailyRollup
+from fintrek_async.app.services.category_stats_service import category_stats_service, StatsDelta
+
+logger = logging.getLogger(__name__)
+
+_ROLLUP_COLUMNS = [
+    "user_id",
+    "day",
+    "category_id",
+    "transaction_type",
+    "total_amount",
+    "tx_count",
+    "sum_squares",
+    "min_amount",
+    "max_amount",
+    "updated_at",
+]
+
+
+class RollupService:
+    """
+    Поддержка таблицы transaction_daily_rollups
+
+    Агрегаты пересчитываются целиком за затронутые дни пользователя:
+    это покрывает создание, изменение категории и удаление транзакций
+    (min/max нельзя корректно уменьшить инкрементально), а стоимость
+    пересчета ограничена транзакциями одного дня.
+
+    Разница расходных агрегатов до и после пересчета передается в
+    category_stats_service, поэтому накопленная статистика категорий
+    обновляется на любом пути записи транзакций без повторного чтения истории.
+    """
+
+    @staticmethod
+    def _expense_deltas(removed, added) -> Dict[UUID, StatsDelta]:
+        """Изменение (число, сумма, сумма квадратов) расходов по категориям"""
+        deltas: Dict[UUID, list] = {}
+        for sign, rows in ((-1, removed), (1, added)):
+            for category_id, transaction_type, tx_count, total_amount, sum_squares in rows:
+                if category_id is None or transaction_type != TransactionType.EXPENSE:
+                    continue
+                delta = deltas.setdefault(category_id, [0, 0.0, 0.0])
+                delta[0] += sign * tx_count
+                delta[1] += sign * float(total_amount or 0)
+                delta[2] += sign * float(sum_squares or 0)
+        return {category_id: tuple(delta) for category_id, delta in deltas.items()}
+
+    def _aggregate_select(self):
+        """SELECT, агрегирующий сырые транзакции в формат таблицы агрегатов"""
+        day = cast(Transaction.transaction_date, Date)
+        return select(
+            Transaction.user_id,
+            day,
+            Transaction.category_id,
+            Transaction.transaction_type,
+            func.sum(Transaction.amount),
+            func.count(),
+            func.sum(Transaction.amount * Transaction.amount),
+            func.min(Transaction.amount),
+            func.max(Transaction.amount),
+            func.now(),
+        ).group_by(
+            Transaction.user_id,
+            day,
+            Transaction.category_id,
+            Transaction.transaction_type
+        )
+
+    async def refresh_days(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        days: Iterable[date]
+    ) -> None:
+        """
+        Пересчитать агрегаты пользователя за указанные дни
+
+        Вызывается после flush() изменений транзакций, в той же транзакции БД.
+        Заодно помечает новые расходы (is_anomaly) и обновляет статистику
+        категорий.
+
+        Пересчеты одного пользователя выполняются по очереди под
+        advisory-блокировкой до конца транзакции: параллельная запись
+        (синхронизация и API, два импорта) после ожидания видит уже
+        зафиксированные агрегаты и вычитает из статистики актуальные строки.
+
+        Args:
+            db: Database session
+            user_id: ID пользователя
+            days: Затронутые дни
+        """
+        days = sorted(set(days))
+        if not days:
+            return
+
+        # Ключ блокировки - первые 8 байт UUID пользователя
+        lock_key = int.from_bytes(user_id.bytes[:8], "big", signed=True)
+        await db.execute(select(func.pg_advisory_xact_lock(lock_key)))
+
+        # Диапазон по transaction_date позволяет использовать индекс,
+        # IN по дням отсекает дни внутри диапазона, которые не менялись
+        range_start = datetime.combine(days[0], time.min)
+        range_end = datetime.combine(days[-1] + timedelta(days=1), time.min)
+
+        # Оценка по статистике без учета самих новых транзакций
+        await category_stats_service.flag_new_transactions(db, user_id, range_start, range_end, days)
+
+        returned = (
+            TransactionDailyRollup.category_id,
+            TransactionDailyRollup.transaction_type,
+            TransactionDailyRollup.tx_count,
+            TransactionDailyRollup.total_amount,
+            TransactionDailyRollup.sum_squares
+        )
+        removed = (await db.execute(delete(TransactionDailyRollup).where(
+            TransactionDailyRollup.user_id == user_id,
+            TransactionDailyRollup.day.in_(days)
+        ).returning(*returned))).all()
+
+        stmt = self._aggregate_select().where(
+            Transaction.user_id == user_id,
+            Transaction.transaction_date >= range_start,
+            Transaction.transaction_date < range_end,
+            cast(Transaction.transaction_date, Date).in_(days)
+        )
+        added = (await db.execute(
+            insert(TransactionDailyRollup).from_select(_ROLLUP_COLUMNS, stmt).returning(*returned)
+        )).all()
+
+        await category_stats_service.apply_deltas(db, user_id, self._expense_deltas(removed, added))
+
+    async def refresh_touched(
+        self,
+        db: AsyncSession,
+        touched: Dict[UUID, Set[date]]
+    ) -> None:
+        """
+        Пересчитать агрегаты для набора {user_id: {day, ...}}
+
+        Удобно для импорта, где затрагивается много дней сразу.
+        Пользователи обходятся по порядку ID - одинаковый порядок блокировок.
+        """
+        for user_id in sorted(touched):
+            await self.refresh_days(db, user_id, touched[user_id])
+
+    async def rebuild(self, db: AsyncSession, user_id: Optional[UUID] = None) -> int:
+        """
+        Полностью перестроить агрегаты и статистику категорий (backfill)
+
+        Args:
+            db: Database session
+            user_id: ID пользователя; если не указан - для всех пользователей
+
+        Returns:
+            Количество строк агрегатов после перестроения
+        """
+        delete_stmt = delete(TransactionDailyRollup)
+        stmt = self._aggregate_select()
+        if user_id is not None:
+            delete_stmt = delete_stmt.where(TransactionDailyRollup.user_id == user_id)
+            stmt = stmt.where(Transaction.user_id == user_id)
+
+        await db.execute(delete_stmt)
+        await db.execute(insert(TransactionDailyRollup).from_select(_ROLLUP_COLUMNS, stmt))
+        await category_stats_service.rebuild(db, user_id)
+
+        count_stmt = select(func.count()).select_from(TransactionDailyRollup)
+        if user_id is not None:
+            count_stmt = count_stmt.where(TransactionDailyRollup.user_id == user_id)
+        rows = (await db.execute(count_stmt)).scalar() or 0
+
+        logger.info(f"Rebuilt {rows} daily rollup rows" + (f" for user {user_id}" if user_id else ""))
+        return rows
+
+
+def mark_touched_day(touched: Dict[UUID, Set[date]], user_id: UUID, transaction_date: Optional[datetime]) -> None:
+    """Отметить день транзакции как затронутый"""
+    if transaction_date is None:
+        return
+    touched.setdefault(user_id, set()).add(transaction_date.date())
+
+
+# Singleton instance
+rollup_service = RollupService()
@@ -0,0 +1,308 @@
+"""
+Фоновые синхронизации с банками: очередь задач в PostgreSQL, воркер и планировщик
+"""
+import asyncio
+import random
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, func, cast, literal, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import logging
+
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.cache import bump_user_data_version
+from fintrek_async.app.db.session import AsyncSessionLocal
+from fintrek_async.app.models.bank_connection import BankConnection, BankConnectionStatus
+from fintrek_async.app.models.sync_job import SyncJob, SyncJobKind, SyncJobStatus
+from fintrek_async.app.services.sync_service import sync_service
+from fintrek_async.app.services.vbank_import import VBankImportService
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (SyncJobStatus.PENDING, SyncJobStatus.RUNNING)
+
+
+class SyncJobService:
+    """
+    Очередь фоновых синхронизаций
+
+    API ставит задачу (enqueue) и сразу отвечает 202 с ее ID. Воркер
+    (run_worker) забирает задачи через SELECT ... FOR UPDATE SKIP LOCKED,
+    поэтому несколько воркеров в разных процессах не берут одну задачу.
+    Планировщик (run_scheduler) периодически ставит синхронизацию активных
+    подключений со случайным сдвигом запуска, чтобы не обращаться к банку
+    всеми подключениями одновременно.
+    """
+
+    @staticmethod
+    def dedupe_key(kind: SyncJobKind, *parts: Any) -> str:
+        """Ключ задачи: одна незавершенная задача на вид и объект синхронизации"""
+        return ":".join([kind.value, *(str(part) for part in parts if part is not None)])
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        kind: SyncJobKind,
+        params: Dict[str, Any],
+        dedupe_key: str
+    ) -> SyncJob:
+        """
+        Поставить задачу в очередь и зафиксировать транзакцию
+
+        Если задача с тем же ключом уже ждет или выполняется, возвращается
+        она (запланированная на будущее запускается сразу).
+
+        Returns:
+            Поставленная или уже существующая задача
+        """
+        now = datetime.utcnow()
+        job_id = (await db.execute(
+            pg_insert(SyncJob).values(
+                id=uuid4(),
+                user_id=user_id,
+                kind=kind,
+                params=params,
+                dedupe_key=dedupe_key,
+                status=SyncJobStatus.PENDING,
+                attempts=0,
+                run_after=now,
+                created_at=now
+            ).on_conflict_do_nothing(
+                index_elements=["dedupe_key"],
+                index_where=SyncJob.status.in_(ACTIVE_STATUSES)
+            ).returning(SyncJob.id)
+        )).scalar_one_or_none()
+
+        if job_id is None:
+            # Запрос пользователя не ждет сдвига запланированной синхронизации
+            await db.execute(
+                update(SyncJob).where(
+                    SyncJob.dedupe_key == dedupe_key,
+                    SyncJob.status == SyncJobStatus.PENDING,
+                    SyncJob.run_after > now
+                ).values(run_after=now).execution_options(synchronize_session=False)
+            )
+            job_id = (await db.execute(
+                select(SyncJob.id).where(
+                    SyncJob.dedupe_key == dedupe_key,
+                    SyncJob.status.in_(ACTIVE_STATUSES)
+                )
+            )).scalar_one_or_none()
+            if job_id is None:
+                # Существующая задача успела завершиться - ставим новую
+                await db.rollback()
+                return await self.enqueue(db, user_id, kind, params, dedupe_key)
+
+        await db.commit()
+        return await db.get(SyncJob, job_id, populate_existing=True)
+
+    async def get_job(self, db: AsyncSession, job_id: UUID, user_id: UUID) -> Optional[SyncJob]:
+        """Задача пользователя по ID"""
+        return (await db.execute(
+            select(SyncJob).where(SyncJob.id == job_id, SyncJob.user_id == user_id)
+        )).scalar_one_or_none()
+
+    async def schedule_active_connections(self, db: AsyncSession) -> int:
+        """
+        Поставить синхронизацию активных подключений, давно не синхронизированных
+
+        Одним INSERT ... SELECT; подключения с незавершенной задачей
+        пропускаются по уникальному индексу dedupe_key.
+
+        Returns:
+            Количество поставленных задач
+        """
+        now = datetime.utcnow()
+        interval = timedelta(seconds=settings.SYNC_SCHEDULE_INTERVAL_SECONDS)
+        jitter = timedelta(seconds=settings.SYNC_SCHEDULE_JITTER_SECONDS)
+        connection_id = cast(BankConnection.id, String)
+
+        stmt = pg_insert(SyncJob).from_select(
+            ["id", "user_id", "kind", "params", "dedupe_key", "status", "attempts", "run_after", "created_at"],
+            select(
+                func.gen_random_uuid(),
+                BankConnection.user_id,
+                literal(SyncJobKind.BANK_CONNECTION, SyncJob.kind.type),
+                func.jsonb_build_object("connection_id", connection_id),
+                literal(self.dedupe_key(SyncJobKind.BANK_CONNECTION) + ":") + connection_id,
+                literal(SyncJobStatus.PENDING, SyncJob.status.type),
+                literal(0),
+                literal(now) + func.random() * literal(jitter),
+                literal(now)
+            ).where(
+                BankConnection.status == BankConnectionStatus.ACTIVE,
+                or_(BankConnection.last_synced_at == None, BankConnection.last_synced_at < now - interval)
+            )
+        ).on_conflict_do_nothing(
+            index_elements=["dedupe_key"],
+            index_where=SyncJob.status.in_(ACTIVE_STATUSES)
+        )
+        scheduled = (await db.execute(stmt)).rowcount
+        await db.commit()
+        return scheduled
+
+    async def requeue_stale(self, db: AsyncSession) -> int:
+        """
+        Вернуть в очередь задачи упавших воркеров
+
+        Задача, выполняющаяся дольше двух таймаутов, считается потерянной:
+        она ставится заново, пока не исчерпан SYNC_JOB_MAX_ATTEMPTS.
+        """
+        now = datetime.utcnow()
+        stale = (
+            SyncJob.status == SyncJobStatus.RUNNING,
+            SyncJob.started_at < now - timedelta(seconds=2 * settings.SYNC_JOB_TIMEOUT_SECONDS)
+        )
+        requeued = (await db.execute(
+            update(SyncJob).where(*stale, SyncJob.attempts < settings.SYNC_JOB_MAX_ATTEMPTS)
+            .values(status=SyncJobStatus.PENDING, run_after=now)
+            .execution_options(synchronize_session=False)
+        )).rowcount
+        # Оставшиеся зависшие задачи исчерпали попытки
+        await db.execute(
+            update(SyncJob).where(*stale)
+            .values(status=SyncJobStatus.FAILED, error="Worker lost", finished_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return requeued
+
+    async def _claim(self, db: AsyncSession) -> Optional[SyncJob]:
+        """Забрать ближайшую готовую к запуску задачу"""
+        now = datetime.utcnow()
+        next_job = select(SyncJob.id).where(
+            SyncJob.status == SyncJobStatus.PENDING,
+            SyncJob.run_after <= now
+        ).order_by(SyncJob.run_after).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+        job = (await db.execute(
+            update(SyncJob).where(SyncJob.id == next_job).values(
+                status=SyncJobStatus.RUNNING,
+                attempts=SyncJob.attempts + 1,
+                started_at=now
+            ).returning(SyncJob).execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
+        await db.commit()
+        return job
+
+    async def _execute(self, db: AsyncSession, job: SyncJob) -> Dict[str, Any]:
+        """
+        Выполнить синхронизацию задачи
+
+        Returns:
+            Результат для ответа GET /sync-jobs/{id}
+
+        Raises:
+            Exception: Ошибка синхронизации (задача завершается с FAILED)
+        """
+        params = job.params
+        if job.kind == SyncJobKind.BANK_CONNECTION:
+            result = await sync_service.sync_bank_connection(
+                db=db,
+                connection_id=params["connection_id"],
+                user_id=str(job.user_id),
+                backfill_days=params.get("backfill_days")
+            )
+            if not result["success"]:
+                raise RuntimeError(result["message"])
+            return result
+
+        svc = VBankImportService()
+        if job.kind == SyncJobKind.VBANK_ACCOUNTS:
+            await svc.fetch_accounts(db, user_id=job.user_id)
+            result = {"status": "ok"}
+        elif params.get("account_id"):
+            await svc.fetch_transactions(
+                db, user_id=job.user_id, account_id=params["account_id"],
+                date_from=params.get("date_from"), date_to=params.get("date_to")
+            )
+            result = {"status": "ok", "accounts_synced": 1}
+        else:
+            accounts_synced = await svc.fetch_all_transactions(
+                db, user_id=job.user_id, date_from=params.get("date_from"), date_to=params.get("date_to")
+            )
+            result = {"status": "ok", "accounts_synced": accounts_synced}
+        await db.commit()
+        await bump_user_data_version(job.user_id)
+        return result
+
+    async def _run(self, job: SyncJob) -> None:
+        """Выполнить задачу в отдельной сессии и записать итог"""
+        result = None
+        error = None
+        async with AsyncSessionLocal() as db:
+            try:
+                result = await asyncio.wait_for(self._execute(db, job), settings.SYNC_JOB_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await db.rollback()
+                error = f"Timed out after {settings.SYNC_JOB_TIMEOUT_SECONDS} s"
+            except Exception as e:
+                await db.rollback()
+                error = str(e) or type(e).__name__
+
+        if error:
+            logger.error(f"Sync job {job.id} ({job.kind.value}) failed: {error}")
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(SyncJob).where(SyncJob.id == job.id).values(
+                    status=SyncJobStatus.FAILED if error else SyncJobStatus.SUCCEEDED,
+                    result=result,
+                    error=error,
+                    finished_at=datetime.utcnow()
+                ).execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _consume(self, stop: asyncio.Event) -> None:
+        """Цикл одного исполнителя: брать задачи, пока очередь не пуста"""
+        while not stop.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await self._claim(db)
+                if job is not None:
+                    await self._run(job)
+                    continue
+            except Exception as e:
+                logger.error(f"Sync worker error: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), settings.SYNC_WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_worker(self, stop: asyncio.Event) -> None:
+        """Выполнять задачи очереди (SYNC_WORKER_CONCURRENCY одновременно) до установки stop"""
+        logger.info(f"Sync worker started, concurrency {settings.SYNC_WORKER_CONCURRENCY}")
+        await asyncio.gather(*(self._consume(stop) for _ in range(max(settings.SYNC_WORKER_CONCURRENCY, 1))))
+        logger.info("Sync worker stopped")
+
+    async def run_scheduler(self, stop: asyncio.Event) -> None:
+        """
+        Периодически ставить синхронизацию активных подключений до установки stop
+
+        Несколько планировщиков (по одному на процесс) безопасны: повторные
+        задачи отсекаются по dedupe_key.
+        """
+        interval = settings.SYNC_SCHEDULE_INTERVAL_SECONDS
+        # Проверка чаще периода синхронизации: подключения становятся "давними" в разное время
+        tick = min(interval, 60) if interval > 0 else 60
+        while not stop.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.requeue_stale(db)
+                    if interval > 0:
+                        scheduled = await self.schedule_active_connections(db)
+                        if scheduled:
+                            logger.info(f"Scheduled {scheduled} bank connection syncs")
+            except Exception as e:
+                logger.error(f"Sync scheduler error: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), tick * random.uniform(0.9, 1.1))
+            except asyncio.TimeoutError:
+                pass
+
+
+# Singleton instance
+sync_job_service = SyncJobService()
@@ -1,10 +1,12 @@
 """
 Сервис синхронизации данных с банками
 """
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Set, Tuple
+import asyncio
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, and_, or_, func, case, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from decimal import Decimal
 from uuid import UUID
 import logging
@@ -13,7 +15,12 @@ from fintrek_async.app.models.bank_connection import BankConnection, BankConnect
 from fintrek_async.app.models.account import Account, AccountType, AccountStatus
 from fintrek_async.app.models.transaction import Transaction, TransactionType, TransactionStatus
 from fintrek_async.app.services.open_banking_service import open_banking_service
+from fintrek_async.app.services.rollup_service import rollup_service, mark_touched_day
+from fintrek_async.app.services.merchant_service import merchant_service
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.concurrency import bank_semaphore, keyed_lock
 from fintrek_async.app.core.security import decrypt_token, encrypt_token
+from fintrek_async.app.core.cache import bump_user_data_version
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +32,8 @@ class SyncService:
         self,
         db: AsyncSession,
         connection_id: str,
-        user_id: str
+        user_id: str,
+        backfill_days: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Синхронизировать данные для конкретного подключения к банку
@@ -34,6 +42,8 @@ class SyncService:
             db: Database session
             connection_id: ID подключения к банку
             user_id: ID пользователя
+            backfill_days: Разовая загрузка за указанное число дней
+                (иначе - только новое с последней синхронизации)
             
         Returns:
             Dict с результатами синхронизации
@@ -54,6 +64,8 @@ class SyncService:
         
         accounts_synced = 0
         transactions_synced = 0
+        transactions_updated = 0
+        transactions_skipped = 0
         
         try:
             # Проверить и обновить токен если нужно
@@ -63,19 +75,24 @@ class SyncService:
             accounts_synced = await self._sync_accounts(db, connection, access_token)
             
             # Синхронизировать транзакции для каждого счета
-            transactions_synced = await self._sync_transactions(db, connection, access_token)
+            transactions_synced, transactions_updated, transactions_skipped = await self._sync_transactions(
+                db, connection, access_token, backfill_days
+            )
             
             # Обновить время последней синхронизации
             connection.last_synced_at = datetime.utcnow()
             connection.status = BankConnectionStatus.ACTIVE
             connection.last_error = None
             await db.commit()
+            await bump_user_data_version(connection.user_id)
             
             return {
                 "success": True,
                 "message": "Synchronization completed successfully",
                 "accounts_synced": accounts_synced,
-                "transactions_synced": transactions_synced
+                "transactions_synced": transactions_synced,
+                "transactions_updated": transactions_updated,
+                "transactions_skipped": transactions_skipped
             }
             
         except Exception as e:
@@ -83,18 +100,28 @@ class SyncService:
             connection.status = BankConnectionStatus.ERROR
             connection.last_error = str(e)
             await db.commit()
+            # Часть счетов и транзакций могла быть сохранена до ошибки
+            await bump_user_data_version(connection.user_id)
             
             return {
                 "success": False,
                 "message": f"Synchronization failed: {str(e)}",
                 "accounts_synced": accounts_synced,
-                "transactions_synced": transactions_synced
+                "transactions_synced": transactions_synced,
+                "transactions_updated": transactions_updated,
+                "transactions_skipped": transactions_skipped
             }
     
     async def _ensure_valid_token(self, db: AsyncSession, connection: BankConnection) -> str:
         """
         Убедиться что access token валиден, обновить если нужно
         
+        Токен обновляется заранее - за TOKEN_REFRESH_MARGIN_SECONDS до
+        истечения. Обновление однократное на подключение: параллельные
+        синхронизации в процессе ждут asyncio-блокировку, в разных процессах -
+        advisory-блокировку PostgreSQL, после чего перечитывают подключение и
+        используют уже обновленный токен.
+        
         Args:
             db: Database session
             connection: BankConnection объект
@@ -102,27 +129,39 @@ class SyncService:
         Returns:
             Валидный access token
         """
-        # Расшифровать токен
-        access_token = decrypt_token(connection.access_token_encrypted)
+        if not self._token_expires_soon(connection):
+            return decrypt_token(connection.access_token_encrypted)
         
-        # Проверить срок действия
-        if connection.token_expires_at and connection.token_expires_at < datetime.utcnow():
-            # Токен истек, обновить
-            refresh_token = decrypt_token(connection.refresh_token_encrypted)
-            
-            tokens = await open_banking_service.refresh_access_token(refresh_token)
+        async with keyed_lock(f"bank-token:{connection.id}"):
+            # Блокировка до конца транзакции; ключ - первые 8 байт UUID подключения
+            lock_key = int.from_bytes(connection.id.bytes[:8], "big", signed=True)
+            await db.execute(select(func.pg_advisory_xact_lock(lock_key)))
+            await db.refresh(connection)
             
-            # Обновить токены в БД
-            connection.access_token_encrypted = encrypt_token(tokens["access_token"])
-            if "refresh_token" in tokens:
-                connection.refresh_token_encrypted = encrypt_token(tokens["refresh_token"])
+            if self._token_expires_soon(connection):
+                refresh_token = decrypt_token(connection.refresh_token_encrypted)
+                
+                tokens = await open_banking_service.refresh_access_token(refresh_token)
+                
+                # Обновить токены в БД
+                connection.access_token_encrypted = encrypt_token(tokens["access_token"])
+                if "refresh_token" in tokens:
+                    connection.refresh_token_encrypted = encrypt_token(tokens["refresh_token"])
+                
+                connection.token_expires_at = datetime.utcnow() + timedelta(seconds=tokens.get("expires_in", 3600))
+                logger.info(f"Access token refreshed for bank connection {connection.id}")
             
-            connection.token_expires_at = datetime.utcnow() + timedelta(seconds=tokens.get("expires_in", 3600))
+            # commit освобождает advisory-блокировку
             await db.commit()
-            
-            access_token = tokens["access_token"]
         
-        return access_token
+        return decrypt_token(connection.access_token_encrypted)
+    
+    @staticmethod
+    def _token_expires_soon(connection: BankConnection) -> bool:
+        """Истекает ли токен в пределах TOKEN_REFRESH_MARGIN_SECONDS"""
+        return bool(connection.token_expires_at) and (
+            connection.token_expires_at < datetime.utcnow() + timedelta(seconds=settings.TOKEN_REFRESH_MARGIN_SECONDS)
+        )
     
     async def _sync_accounts(
         self,
@@ -187,85 +226,205 @@ class SyncService:
         self,
         db: AsyncSession,
         connection: BankConnection,
-        access_token: str
-    ) -> int:
+        access_token: str,
+        backfill_days: Optional[int] = None
+    ) -> Tuple[int, int]:
         """
         Синхронизировать транзакции для всех счетов подключения
         
+        Транзакции всех счетов запрашиваются у банка параллельно (не больше
+        BANK_FETCH_CONCURRENCY запросов к банку одновременно), затем
+        записываются в БД последовательно в одной сессии.
+        
+        У каждого счета хранится sync_watermark - дата последней полученной
+        транзакции; запрашивается только период с нее (минус перекрытие
+        SYNC_WATERMARK_OVERLAP_HOURS для поздно проведенных операций).
+        Счет без watermark загружается за SYNC_INITIAL_DAYS дней.
+        
+        Каждый счет записывается в своей точке сохранения (SAVEPOINT):
+        ошибка БД на одном счете откатывает только его, остальные счета
+        и пересчет агрегатов фиксируются.
+        
         Args:
             db: Database session
             connection: BankConnection объект
             access_token: Access token
+            backfill_days: Разовая загрузка за указанное число дней, без учета watermark
             
         Returns:
-            Количество синхронизированных транзакций
+            (количество новых транзакций, количество измененных банком,
+             количество пропущенных без внешнего ID)
         """
         # Получить все счета этого подключения
         stmt = select(Account).filter(
             Account.bank_connection_id == connection.id
         )
         result = await db.execute(stmt)
-        accounts = result.scalars().all()
+        accounts = [account for account in result.scalars().all() if account.account_number]
         
-        synced_count = 0
+        inserted_count = 0
+        updated_count = 0
+        skipped_count = 0
+        touched = {}
         
-        # Синхронизировать транзакции за последние 30 дней
-        date_from = datetime.utcnow() - timedelta(days=30)
+        semaphore = bank_semaphore(connection.bank_name)
         
-        for account in accounts:
-            if not account.account_number:
-                continue
-            
-            try:
-                # Получить транзакции из банковского API
-                bank_transactions = await open_banking_service.fetch_transactions(
+        async def fetch(account: Account) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await open_banking_service.fetch_transactions(
                     access_token,
                     account.account_number,
-                    date_from=date_from
+                    date_from=self._sync_date_from(account, backfill_days)
                 )
+        
+        # Получить транзакции из банковского API для всех счетов сразу
+        fetched = await asyncio.gather(*(fetch(account) for account in accounts), return_exceptions=True)
+        
+        for account, bank_transactions in zip(accounts, fetched):
+            account_id = account.id
+            try:
+                if isinstance(bank_transactions, Exception):
+                    raise bank_transactions
                 
-                for bank_txn in bank_transactions:
-                    external_id = bank_txn.get("id")
-                    
-                    # Проверить существует ли транзакция
-                    stmt = select(Transaction).filter(
-                        Transaction.external_id == external_id
-                    )
-                    result = await db.execute(stmt)
-                    existing = result.scalar_one_or_none()
-                    
-                    if existing:
-                        continue  # Транзакция уже существует
-                    
-                    # Создать новую транзакцию
-                    amount = Decimal(str(abs(bank_txn.get("amount", 0))))
-                    transaction_type = open_banking_service.map_transaction_type(
-                        bank_txn.get("type", ""),
-                        float(bank_txn.get("amount", 0))
-                    )
-                    
-                    transaction = Transaction(
-                        user_id=connection.user_id,
-                        account_id=account.id,
-                        transaction_type=transaction_type,
-                        amount=amount,
-                        currency=bank_txn.get("currency", "RUB"),
-                        description=bank_txn.get("description"),
-                        merchant_name=bank_txn.get("merchant_name"),
-                        transaction_date=datetime.fromisoformat(bank_txn.get("date")) if bank_txn.get("date") else datetime.utcnow(),
-                        posted_date=datetime.fromisoformat(bank_txn.get("posted_date")) if bank_txn.get("posted_date") else None,
-                        status=TransactionStatus.COMPLETED,
-                        external_id=external_id
+                async with db.begin_nested():
+                    inserted, updated, skipped, latest_date = await self._upsert_transactions(
+                        db, connection.user_id, account_id, bank_transactions, touched
                     )
-                    db.add(transaction)
-                    synced_count += 1
+                inserted_count += inserted
+                updated_count += updated
+                skipped_count += skipped
+                
+                # Watermark только растет: глубокая загрузка его не откатывает
+                if latest_date and (account.sync_watermark is None or latest_date > account.sync_watermark):
+                    account.sync_watermark = latest_date
                 
             except Exception as e:
-                logger.error(f"Error syncing transactions for account {account.id}: {e}")
+                logger.error(f"Error syncing transactions for account {account_id}: {e}")
                 account.sync_error = str(e)
         
+        # Обновить дневные агрегаты за затронутые дни
+        await rollup_service.refresh_touched(db, touched)
+        
         await db.commit()
-        return synced_count
+        return inserted_count, updated_count, skipped_count
+    
+    @staticmethod
+    def _sync_date_from(account: Account, backfill_days: Optional[int] = None) -> datetime:
+        """Начало запрашиваемого у банка периода для счета"""
+        now = datetime.utcnow()
+        if backfill_days:
+            return now - timedelta(days=backfill_days)
+        if account.sync_watermark is None:
+            return now - timedelta(days=settings.SYNC_INITIAL_DAYS)
+        return account.sync_watermark - timedelta(hours=settings.SYNC_WATERMARK_OVERLAP_HOURS)
+    
+    async def _upsert_transactions(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        account_id: UUID,
+        bank_transactions: List[Dict[str, Any]],
+        touched: Dict[UUID, Set]
+    ) -> Tuple[int, int, int, Optional[datetime]]:
+        """
+        Записать транзакции счета пачками INSERT ... ON CONFLICT (external_id) DO UPDATE
+        
+        Новые строки вставляются, у существующих обновляются поля, которые
+        банк мог изменить (сумма, описание, дата проведения, статус), - только
+        если они действительно изменились. RETURNING возвращает лишь
+        вставленные и измененные строки; признак вставки - xmax = 0.
+        
+        Транзакции без внешнего ID пропускаются с предупреждением в логе:
+        повторную выгрузку такой транзакции (перекрытие watermark) нельзя
+        отличить от новой, и каждая синхронизация создавала бы дубликат.
+        
+        Returns:
+            (количество вставленных, количество обновленных,
+             количество пропущенных без внешнего ID,
+             дата самой поздней транзакции в выгрузке)
+        """
+        rows: List[Dict[str, Any]] = []
+        seen: Set[str] = set()
+        skipped_count = 0
+        now = datetime.utcnow()
+        for bank_txn in bank_transactions:
+            external_id = bank_txn.get("id")
+            if not external_id:
+                skipped_count += 1
+                continue
+            if external_id in seen:
+                continue
+            seen.add(external_id)
+            
+            rows.append({
+                "user_id": user_id,
+                "account_id": account_id,
+                "transaction_type": open_banking_service.map_transaction_type(
+                    bank_txn.get("type", ""),
+                    float(bank_txn.get("amount", 0))
+                ),
+                "amount": Decimal(str(abs(bank_txn.get("amount", 0)))),
+                "currency": bank_txn.get("currency", "RUB"),
+                "description": bank_txn.get("description"),
+                "merchant_name": bank_txn.get("merchant_name"),
+                "transaction_date": datetime.fromisoformat(bank_txn.get("date")) if bank_txn.get("date") else now,
+                "posted_date": datetime.fromisoformat(bank_txn.get("posted_date")) if bank_txn.get("posted_date") else None,
+                "status": TransactionStatus.COMPLETED,
+                "external_id": external_id,
+                "created_at": now,
+                "updated_at": now,
+            })
+        
+        inserted_count = 0
+        updated_count = 0
+        chunk_size = settings.SYNC_UPSERT_CHUNK_SIZE
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            
+            # Продавцы и запомненные категории - по одному запросу на пачку
+            await merchant_service.assign_rows(db, user_id, chunk)
+            
+            stmt = pg_insert(Transaction).values(chunk)
+            excluded = stmt.excluded
+            changed = or_(*(
+                getattr(Transaction, name).is_distinct_from(getattr(excluded, name))
+                for name in ("amount", "description", "merchant_name", "posted_date", "status")
+            ))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Transaction.external_id],
+                set_={
+                    "amount": excluded.amount,
+                    "description": excluded.description,
+                    "merchant_name": excluded.merchant_name,
+                    "merchant_id": excluded.merchant_id,
+                    "posted_date": excluded.posted_date,
+                    "status": excluded.status,
+                    "updated_at": excluded.updated_at,
+                    # Новая сумма оценивается заново при пересчете агрегатов
+                    "is_anomaly": case(
+                        (Transaction.amount.is_distinct_from(excluded.amount), None),
+                        else_=Transaction.is_anomaly
+                    ),
+                },
+                # external_id уникален глобально: чужие транзакции не трогаем
+                where=and_(Transaction.user_id == excluded.user_id, changed)
+            ).returning(
+                Transaction.transaction_date,
+                literal_column("xmax = 0").label("inserted")
+            )
+            
+            for transaction_date, inserted in (await db.execute(stmt)).all():
+                mark_touched_day(touched, user_id, transaction_date)
+                if inserted:
+                    inserted_count += 1
+                else:
+                    updated_count += 1
+        
+        if skipped_count:
+            logger.warning(f"Skipped {skipped_count} bank transactions without id for account {account_id}")
+        
+        latest_date = max((row["transaction_date"] for row in rows), default=None)
+        return inserted_count, updated_count, skipped_count, latest_date
 
 
 # Singleton instance
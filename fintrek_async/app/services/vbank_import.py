@@ -1,11 +1,21 @@
-from typing import Optional
-from datetime import datetime
+from typing import List, Optional
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, case, values, column, Numeric, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert, UUID as PG_UUID
 
 from fintrek_async.app.clients.vbank import get_vbank_client
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.concurrency import bank_semaphore
+from fintrek_async.app.services.rollup_service import rollup_service, mark_touched_day
+from fintrek_async.app.services.merchant_service import merchant_service
 from fintrek_async.app import models
 
+logger = logging.getLogger(__name__)
+
 class VBankImportService:
     def __init__(self):
         self.client = get_vbank_client()
@@ -36,11 +46,21 @@ class VBankImportService:
     async def fetch_accounts(self, db: AsyncSession, user_id):
         payload = await self.client.get_accounts()
         # ожидаем структуру наподобие {"accounts":[{id, iban, currency, balance, name, ...}, ...]}
-        for a in payload.get("accounts", []):
-            # находим/создаем account (привяжем к user_id)
-            acc = await db.scalar(
-                select(models.Account).where(models.Account.user_id == user_id, models.Account.external_id == a["id"])
-            )
+        accounts = payload.get("accounts", [])
+        # существующие счета пользователя - одним запросом по всем external_id
+        existing = {}
+        if accounts:
+            existing = {
+                acc.external_id: acc
+                for acc in (await db.scalars(
+                    select(models.Account).where(
+                        models.Account.user_id == user_id,
+                        models.Account.external_id.in_({a["id"] for a in accounts}),
+                    )
+                )).all()
+            }
+        for a in accounts:
+            acc = existing.get(a["id"])
             if not acc:
                 acc = models.Account(
                     user_id=user_id,
@@ -54,6 +74,7 @@ class VBankImportService:
                     status=models.AccountStatus.ACTIVE,
                 )
                 db.add(acc)
+                existing[a["id"]] = acc
             else:
                 acc.balance = a.get("balance", acc.balance)
                 acc.currency = a.get("currency", acc.currency)
@@ -71,32 +92,148 @@ class VBankImportService:
         if not account:
             raise ValueError(f"Account {account_id} not found for user {user_id}")
         
+        payload = await self._get_transactions(account, date_from=date_from, date_to=date_to)
+        await self._import_transactions(db, user_id, account, payload)
+
+    async def fetch_all_transactions(self, db: AsyncSession, user_id, date_from: Optional[str] = None, date_to: Optional[str] = None) -> int:
+        """
+        Загрузить транзакции всех VBank-счетов пользователя: запросы параллельно, запись в БД - по очереди
+
+        Ошибка одного счета (запрос к банку или запись в БД в своей точке
+        сохранения) не прерывает остальные: она записывается в sync_error
+        счета, как в sync_service.
+
+        Returns:
+            Количество успешно загруженных счетов
+        """
+        accounts = (await db.scalars(
+            select(models.Account).where(
+                models.Account.user_id == user_id,
+                models.Account.provider == "vbank",
+            )
+        )).all()
+
+        payloads = await asyncio.gather(*(
+            self._get_transactions(account, date_from=date_from, date_to=date_to) for account in accounts
+        ), return_exceptions=True)
+        synced = 0
+        for account, payload in zip(accounts, payloads):
+            account_id = account.id
+            try:
+                if isinstance(payload, Exception):
+                    raise payload
+                async with db.begin_nested():
+                    await self._import_transactions(db, user_id, account, payload)
+                account.sync_error = None
+                synced += 1
+            except Exception as e:
+                logger.error(f"Error importing VBank transactions for account {account_id}: {e}")
+                account.sync_error = str(e)
+        return synced
+
+    async def _get_transactions(self, account, date_from: Optional[str] = None, date_to: Optional[str] = None) -> dict:
+        # без явного date_from запрашиваем только новое с последней синхронизации (с перекрытием)
+        if date_from is None and account.sync_watermark is not None:
+            date_from = (account.sync_watermark - timedelta(hours=settings.SYNC_WATERMARK_OVERLAP_HOURS)).strftime("%Y-%m-%d")
         # Use the account's external_id to fetch transactions from VBank
-        payload = await self.client.get_transactions(account.external_id or str(account_id), date_from=date_from, date_to=date_to)
+        # не больше BANK_FETCH_CONCURRENCY одновременных запросов к VBank
+        async with bank_semaphore(settings.VBANK_BANK_CODE):
+            return await self.client.get_transactions(account.external_id or str(account.id), date_from=date_from, date_to=date_to)
+
+    async def _import_transactions(self, db: AsyncSession, user_id, account, payload: dict):
         # ожидаем {"transactions":[{id, amount, currency, bookingDate, description, category, ...}, ...]}
-        for t in payload.get("transactions", []):
-            tx = await db.scalar(
-                select(models.Transaction).where(
+        # повторы одного id в выгрузке: побеждает последний
+        items = list({t["id"]: t for t in payload.get("transactions", [])}.values())
+        touched = {}
+        chunk_size = settings.SYNC_UPSERT_CHUNK_SIZE
+        for start in range(0, len(items), chunk_size):
+            await self._import_transactions_chunk(db, user_id, account.id, items[start:start + chunk_size], touched)
+        await rollup_service.refresh_touched(db, touched)
+
+        # watermark только растет: загрузка старого периода его не откатывает
+        latest_date = max(
+            filter(None, (self._parse_date(t.get("bookingDate") or t.get("valueDate")) for t in items)),
+            default=None,
+        )
+        if latest_date and (account.sync_watermark is None or latest_date > account.sync_watermark):
+            account.sync_watermark = latest_date
+
+    async def _import_transactions_chunk(self, db: AsyncSession, user_id, account_id, items: List[dict], touched: dict):
+        """Пачка выгрузки: один SELECT существующих, один INSERT новых, один UPDATE измененных"""
+        existing = {
+            row.external_id: row
+            for row in (await db.execute(
+                select(
+                    models.Transaction.id,
+                    models.Transaction.external_id,
+                    models.Transaction.amount,
+                    models.Transaction.description,
+                    models.Transaction.transaction_date,
+                ).where(
                     models.Transaction.user_id == user_id,
-                    models.Transaction.external_id == t["id"],
+                    models.Transaction.external_id.in_([t["id"] for t in items]),
                 )
+            )).all()
+        }
+
+        now = datetime.utcnow()
+        new_rows = []
+        changes = []
+        for t in items:
+            row = existing.get(t["id"])
+            if row is None:
+                new_rows.append({
+                    "user_id": user_id,
+                    "account_id": account_id,
+                    "external_id": t["id"],
+                    "amount": t.get("amount", 0),
+                    "currency": t.get("currency", "RUB"),
+                    "transaction_date": self._parse_date(t.get("bookingDate") or t.get("valueDate")),
+                    "description": t.get("description") or "",
+                    "category_guess": t.get("category"),
+                    "provider": "vbank",
+                    "status": models.TransactionStatus.COMPLETED,
+                    "transaction_type": models.TransactionType.INCOME if float(t.get("amount", 0)) >= 0 else models.TransactionType.EXPENSE,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                continue
+
+            amount = Decimal(str(t["amount"])) if "amount" in t else row.amount
+            description = t.get("description", row.description)
+            if amount != row.amount or description != row.description:
+                changes.append((row.id, amount, description))
+                mark_touched_day(touched, user_id, row.transaction_date)
+
+        if new_rows:
+            await merchant_service.assign_rows(db, user_id, new_rows)
+            # external_id уникален глобально: строку, занятую другим пользователем, пропускаем
+            inserted = await db.execute(
+                pg_insert(models.Transaction).values(new_rows)
+                .on_conflict_do_nothing(index_elements=[models.Transaction.external_id])
+                .returning(models.Transaction.transaction_date)
+            )
+            for transaction_date in inserted.scalars():
+                mark_touched_day(touched, user_id, transaction_date)
+
+        if changes:
+            changed = values(
+                column("id", PG_UUID(as_uuid=True)),
+                column("amount", Numeric(15, 2)),
+                column("description", String),
+                name="changed_transactions",
+            ).data(changes)
+            await db.execute(
+                update(models.Transaction).where(
+                    models.Transaction.id == changed.c.id
+                ).values(
+                    amount=changed.c.amount,
+                    description=changed.c.description,
+                    # Новая сумма оценивается заново при пересчете агрегатов
+                    is_anomaly=case(
+                        (models.Transaction.amount != changed.c.amount, None),
+                        else_=models.Transaction.is_anomaly
+                    ),
+                    updated_at=now,
+                ).execution_options(synchronize_session=False)
             )
-            if not tx:
-                tx = models.Transaction(
-                    user_id=user_id,
-                    account_id=account_id,  # Use the UUID account_id
-                    external_id=t["id"],
-                    amount=t.get("amount", 0),
-                    currency=t.get("currency", "RUB"),
-                    transaction_date=self._parse_date(t.get("bookingDate") or t.get("valueDate")),
-                    description=t.get("description") or "",
-                    category_guess=t.get("category"),
-                    provider="vbank",
-                    status=models.TransactionStatus.COMPLETED,
-                    transaction_type=models.TransactionType.INCOME if float(t.get("amount", 0)) >= 0 else models.TransactionType.EXPENSE,
-                )
-                db.add(tx)
-            else:
-                tx.amount = t.get("amount", tx.amount)
-                tx.description = t.get("description", tx.description)
-        await db.flush()
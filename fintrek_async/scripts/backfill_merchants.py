@@ -0,0 +1,96 @@
+"""
+Скрипт связывания существующих транзакций с нормализованными продавцами (ASYNC версия)
+
+Транзакции с названием продавца, но без merchant_id, читаются пачками по keyset на id, продавцы
+находятся/создаются одним запросом на пачку, merchant_id проставляется
+одним UPDATE ... FROM (VALUES ...). Каждая пачка фиксируется отдельно,
+поэтому скрипт можно прервать и запустить повторно.
+
+Использование:
+    python scripts/backfill_merchants.py
+    python scripts/backfill_merchants.py --chunk-size 5000
+"""
+import sys
+import os
+import asyncio
+import argparse
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import select, update, values, column
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from fintrek_async.app.db.session import AsyncSessionLocal
+from fintrek_async.app.models.transaction import Transaction
+from fintrek_async.app.services.merchant_service import merchant_service
+
+
+async def backfill_merchants(chunk_size: int):
+    """Проставить merchant_id транзакциям с названием продавца, у которых он не заполнен"""
+    linked = 0
+    processed = 0
+    last_id = None
+
+    async with AsyncSessionLocal() as db:
+        try:
+            while True:
+                stmt = select(
+                    Transaction.id,
+                    Transaction.merchant_name
+                ).filter(
+                    Transaction.merchant_id == None,
+                    Transaction.merchant_name != None
+                ).order_by(Transaction.id).limit(chunk_size)
+                if last_id is not None:
+                    stmt = stmt.filter(Transaction.id > last_id)
+
+                rows = (await db.execute(stmt)).all()
+                if not rows:
+                    break
+                processed += len(rows)
+                last_id = rows[-1].id
+
+                merchant_ids = await merchant_service.resolve(
+                    db, (row.merchant_name for row in rows)
+                )
+                links = [
+                    (row.id, merchant_ids[row.merchant_name])
+                    for row in rows
+                    if row.merchant_name in merchant_ids
+                ]
+                if links:
+                    new_merchants = values(
+                        column("id", PG_UUID(as_uuid=True)),
+                        column("merchant_id", PG_UUID(as_uuid=True)),
+                        name="new_merchants"
+                    ).data(links)
+                    await db.execute(
+                        update(Transaction).where(
+                            Transaction.id == new_merchants.c.id
+                        ).values(
+                            merchant_id=new_merchants.c.merchant_id
+                        ).execution_options(synchronize_session=False)
+                    )
+                    linked += len(links)
+
+                await db.commit()
+                print(f"   обработано {processed}, связано {linked}")
+
+                if len(rows) < chunk_size:
+                    break
+
+            print(f"✅ Связано с продавцами {linked} из {processed} транзакций")
+
+        except Exception as e:
+            print(f"❌ Ошибка при связывании транзакций с продавцами: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Связывание транзакций с нормализованными продавцами")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    asyncio.run(backfill_merchants(args.chunk_size))
@@ -0,0 +1,98 @@
+"""
+Микро-бенчмарк сопоставления ключевых слов в TransactionCategorizer
+
+Генерирует синтетические описания транзакций и сравнивает прежний
+вложенный перебор ключевых слов с автоматом Ахо-Корасик. Результаты
+обоих способов должны совпадать. БД не требуется.
+
+Использование:
+    python scripts/bench_categorizer.py
+    python scripts/bench_categorizer.py --count 100000 --seed 42
+"""
+import sys
+import os
+import argparse
+import random
+import time
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from fintrek_async.app.ml.transaction_categorizer import transaction_categorizer
+
+NOISE_WORDS = [
+    "оплата", "покупка", "карта", "списание", "платеж", "москва", "спб", "ooo",
+    "retail", "pos", "terminal", "ип", "онлайн", "заказ№", "rus", "card",
+]
+
+
+def legacy_match(keywords_dict: dict, text: str):
+    """Прежний алгоритм: для каждой категории проверить каждое ключевое слово"""
+    best_match = None
+    max_matches = 0
+    for category_name, keywords in keywords_dict.items():
+        matches = sum(1 for keyword in keywords if keyword in text)
+        if matches > max_matches:
+            max_matches = matches
+            best_match = category_name
+    return best_match
+
+
+def generate_descriptions(count: int, seed: int) -> list:
+    """Синтетические описания: шум + (иногда) ключевые слова из словарей"""
+    rng = random.Random(seed)
+    all_keywords = [
+        keyword
+        for keywords_dict in (transaction_categorizer.expense_keywords, transaction_categorizer.income_keywords)
+        for keywords in keywords_dict.values()
+        for keyword in keywords
+    ]
+    descriptions = []
+    for _ in range(count):
+        words = rng.sample(NOISE_WORDS, rng.randint(2, 5))
+        for _ in range(rng.choice((0, 1, 1, 2))):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(all_keywords))
+        words.append(str(rng.randint(1000, 99999)))
+        descriptions.append(" ".join(words).lower())
+    return descriptions
+
+
+def run(count: int, seed: int) -> int:
+    descriptions = generate_descriptions(count, seed)
+    print(f"Описаний: {count}, средняя длина {sum(map(len, descriptions)) / count:.1f} символов")
+
+    for is_expense, keywords_dict in (
+        (True, transaction_categorizer.expense_keywords),
+        (False, transaction_categorizer.income_keywords),
+    ):
+        started = time.perf_counter()
+        legacy = [legacy_match(keywords_dict, text) for text in descriptions]
+        legacy_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        current = [transaction_categorizer.match_category_name(text, is_expense) for text in descriptions]
+        current_time = time.perf_counter() - started
+
+        label = "расходы" if is_expense else "доходы"
+        print(
+            f"{label:>8}: перебор {legacy_time * 1e6 / count:6.2f} мкс/шт, "
+            f"Ахо-Корасик {current_time * 1e6 / count:6.2f} мкс/шт "
+            f"(x{legacy_time / current_time:.2f})"
+        )
+
+        mismatches = sum(1 for a, b in zip(legacy, current) if a != b)
+        if mismatches:
+            print(f"❌ Результаты расходятся в {mismatches} описаниях")
+            return 1
+
+    print("✅ Результаты совпадают с прежним алгоритмом")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк категоризации по ключевым словам")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sys.exit(run(args.count, args.seed))
@@ -0,0 +1,124 @@
+"""
+Бенчмарк HTTP-клиента банковских API: новый клиент на вызов против общего пула
+
+Поднимает локальный HTTP/1.1 stub-сервер с keep-alive и сравнивает
+латентность вызова для прежней схемы (новый httpx.AsyncClient, т.е.
+новое соединение, на каждый вызов) и общего клиента http_client_pool.
+--connect-delay добавляет задержку на каждое новое соединение, имитируя
+сетевое рукопожатие TCP+TLS до реального банка. Внешняя сеть не нужна.
+
+Использование:
+    python scripts/bench_http_client.py
+    python scripts/bench_http_client.py --calls 500 --connect-delay 20
+"""
+import sys
+import os
+import asyncio
+import argparse
+import json
+import statistics
+import time
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import httpx
+
+from fintrek_async.app.clients.http_pool import http_client_pool
+
+RESPONSE_BODY = json.dumps({"transactions": [{"id": "tx-1", "amount": -100.0}]}).encode()
+
+
+async def serve(connect_delay: float):
+    """Stub банковского API: на любой запрос отвечает одним JSON, соединения keep-alive"""
+    connections = 0
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        nonlocal connections
+        connections += 1
+        # Цена установления соединения (рукопожатие до удаленного сервера)
+        await asyncio.sleep(connect_delay)
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n\r\n" + RESPONSE_BODY
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, lambda: connections
+
+
+async def call_new_client(base_url: str) -> None:
+    """Прежняя схема: новый клиент (и соединение) на каждый вызов"""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(f"{base_url}/api/v1/accounts/acc/transactions")
+        response.raise_for_status()
+        response.json()
+
+
+async def call_pooled_client(base_url: str) -> None:
+    """Общий клиент с пулом keep-alive соединений"""
+    response = await http_client_pool.client(base_url).get(f"{base_url}/api/v1/accounts/acc/transactions")
+    response.raise_for_status()
+    response.json()
+
+
+async def measure(call, base_url: str, calls: int) -> list:
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await call(base_url)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def run(calls: int, connect_delay_ms: float) -> int:
+    server, connections = await serve(connect_delay_ms / 1000)
+    port = server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    results = {}
+    try:
+        for label, call in (("новый клиент", call_new_client), ("общий пул", call_pooled_client)):
+            before = connections()
+            timings = await measure(call, base_url, calls)
+            results[label] = statistics.median(timings)
+            print(
+                f"{label:>13}: медиана {statistics.median(timings):7.2f} мс, "
+                f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.2f} мс, "
+                f"соединений {connections() - before}"
+            )
+    finally:
+        await http_client_pool.aclose()
+        server.close()
+        await server.wait_closed()
+
+    speedup = results["новый клиент"] / results["общий пул"]
+    print(f"Ускорение вызова: x{speedup:.2f}")
+    if speedup < 1.0:
+        print("❌ Общий пул не быстрее нового клиента на вызов")
+        return 1
+    print("✅ Общий пул снижает латентность вызова")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк HTTP-клиента банковских API")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=10.0, help="Задержка нового соединения, мс")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args.calls, args.connect_delay)))
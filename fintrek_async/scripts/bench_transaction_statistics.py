@@ -0,0 +1,121 @@
+"""
+Регрессионный бенчмарк /analytics/transaction-statistics (ASYNC версия)
+
+Для каждого объема истории создает синтетического пользователя с N транзакциями
+за последний год, строит дневные агрегаты и замеряет латентность и пиковую
+память Python при расчете статистики. Время и память должны оставаться
+примерно постоянными при росте N.
+
+Использование:
+    python scripts/bench_transaction_statistics.py
+    python scripts/bench_transaction_statistics.py --sizes 1000 10000 100000 --repeat 20
+
+Код возврата 1, если на максимальном объеме латентность или память выросли
+больше чем в --max-ratio раз относительно минимального объема.
+"""
+import sys
+import os
+import asyncio
+import argparse
+import statistics
+import time
+import tracemalloc
+import uuid
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import text
+
+from fintrek_async.app.db.session import AsyncSessionLocal
+from fintrek_async.app.models.user import User
+from fintrek_async.app.models.account import Account, AccountType
+from fintrek_async.app.services.rollup_service import rollup_service
+from fintrek_async.app.api.v1.endpoints.analytics import compute_transaction_statistics
+
+
+async def seed_user(size: int) -> uuid.UUID:
+    """Создать пользователя со счетом и size транзакциями (генерация на стороне БД)"""
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-{uuid.uuid4().hex}@example.com", name="Bench", password_hash="-")
+        db.add(user)
+        await db.flush()
+        account = Account(user_id=user.id, account_name="Bench", account_type=AccountType.CHECKING)
+        db.add(account)
+        await db.flush()
+
+        await db.execute(text("""
+            INSERT INTO transactions
+                (id, user_id, account_id, transaction_type, amount, currency,
+                 transaction_date, status, created_at, updated_at)
+            SELECT gen_random_uuid(), :user_id, :account_id,
+                   CASE WHEN g % 4 = 0 THEN 'INCOME' ELSE 'EXPENSE' END::transactiontype,
+                   round((random() * 5000 + 1)::numeric, 2), 'RUB',
+                   now() - (random() * interval '365 days'),
+                   'COMPLETED'::transactionstatus, now(), now()
+            FROM generate_series(1, :size) AS g
+        """), {"user_id": user.id, "account_id": account.id, "size": size})
+
+        await rollup_service.rebuild(db, user_id=user.id)
+        await db.commit()
+        return user.id
+
+
+async def drop_user(user_id: uuid.UUID):
+    """Удалить синтетического пользователя (каскадно удаляет транзакции и агрегаты)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("DELETE FROM users WHERE id = :user_id"), {"user_id": user_id})
+        await db.commit()
+
+
+async def measure(user_id: uuid.UUID, repeat: int) -> tuple:
+    """Медианная латентность (мс) и пиковая память (КБ) расчета статистики за 365 дней"""
+    timings = []
+    peaks = []
+    async with AsyncSessionLocal() as db:
+        # Прогрев: подготовленные выражения и кэш планов
+        await compute_transaction_statistics(db, user_id, 365)
+
+        for _ in range(repeat):
+            tracemalloc.start()
+            started = time.perf_counter()
+            await compute_transaction_statistics(db, user_id, 365)
+            timings.append((time.perf_counter() - started) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+
+    return statistics.median(timings), max(peaks)
+
+
+async def run(sizes: list, repeat: int, max_ratio: float) -> int:
+    results = []
+    for size in sizes:
+        user_id = await seed_user(size)
+        try:
+            latency_ms, peak_kb = await measure(user_id, repeat)
+        finally:
+            await drop_user(user_id)
+        results.append((size, latency_ms, peak_kb))
+        print(f"{size:>10} транзакций: {latency_ms:8.2f} мс, пик памяти {peak_kb:8.1f} КБ")
+
+    _, base_latency, base_peak = results[0]
+    _, top_latency, top_peak = results[-1]
+    latency_ratio = top_latency / base_latency if base_latency else 1.0
+    memory_ratio = top_peak / base_peak if base_peak else 1.0
+    print(f"Рост латентности: x{latency_ratio:.2f}, рост памяти: x{memory_ratio:.2f}")
+
+    if latency_ratio > max_ratio or memory_ratio > max_ratio:
+        print(f"❌ Регрессия: рост больше x{max_ratio}")
+        return 1
+    print("✅ Латентность и память не зависят от объема истории")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк статистики транзакций")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-ratio", type=float, default=3.0)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(sorted(args.sizes), args.repeat, args.max_ratio)))
@@ -0,0 +1,41 @@
+"""
+Скрипт для заполнения/перестроения дневных агрегатов транзакций (ASYNC версия)
+
+Использование:
+    python scripts/rebuild_rollups.py                  # все пользователи
+    python scripts/rebuild_rollups.py --user-id <UUID>  # один пользователь
+"""
+import sys
+import os
+import asyncio
+import argparse
+from uuid import UUID
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from fintrek_async.app.db.session import AsyncSessionLocal
+from fintrek_async.app.services.rollup_service import rollup_service
+
+
+async def rebuild_rollups(user_id: UUID = None):
+    """Перестроить таблицу transaction_daily_rollups из сырых транзакций"""
+    async with AsyncSessionLocal() as db:
+        try:
+            rows = await rollup_service.rebuild(db, user_id=user_id)
+            await db.commit()
+            target = f"пользователя {user_id}" if user_id else "всех пользователей"
+            print(f"✅ Перестроено {rows} строк агрегатов для {target}")
+
+        except Exception as e:
+            print(f"❌ Ошибка при перестроении агрегатов: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перестроение дневных агрегатов транзакций")
+    parser.add_argument("--user-id", type=UUID, default=None, help="ID пользователя (по умолчанию - все)")
+    args = parser.parse_args()
+
+    asyncio.run(rebuild_rollups(args.user_id))
@@ -0,0 +1,55 @@
+"""
+Воркер фоновых синхронизаций с банками (ASYNC версия)
+
+Выполняет задачи очереди sync_jobs и периодически ставит синхронизацию
+активных подключений. Можно запускать несколько экземпляров: задачи
+забираются через SELECT ... FOR UPDATE SKIP LOCKED. API при этом
+работает с SYNC_WORKER_IN_PROCESS=false (по умолчанию).
+
+Использование:
+    python scripts/run_sync_worker.py
+    python scripts/run_sync_worker.py --no-scheduler
+"""
+import sys
+import os
+import asyncio
+import argparse
+import logging
+import signal
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from fintrek_async.app.clients.http_pool import http_client_pool
+from fintrek_async.app.core.cache import init_cache, close_cache
+from fintrek_async.app.services.sync_job_service import sync_job_service
+
+
+async def run(scheduler: bool):
+    """Выполнять задачи до SIGINT/SIGTERM; текущие задачи завершаются"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Кэш нужен для инвалидации аналитики после синхронизации
+    await init_cache()
+    try:
+        tasks = [sync_job_service.run_worker(stop)]
+        if scheduler:
+            tasks.append(sync_job_service.run_scheduler(stop))
+        print("✅ Воркер синхронизаций запущен")
+        await asyncio.gather(*tasks)
+    finally:
+        await http_client_pool.aclose()
+        await close_cache()
+    print("✅ Воркер синхронизаций остановлен")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркер фоновых синхронизаций с банками")
+    parser.add_argument("--no-scheduler", action="store_true", help="Не ставить периодические синхронизации")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(scheduler=not args.no_scheduler))
@@ -0,0 +1,102 @@
+"""
+Обучение модели категоризации транзакций (ASYNC версия)
+
+Обучает CategoryClassifier на транзакциях, отнесенных к системным
+категориям, сохраняет модель в CATEGORY_MODEL_PATH и печатает точность
+на отложенной выборке и скорость пакетного предсказания.
+
+Использование:
+    python scripts/train_category_model.py
+    python scripts/train_category_model.py --holdout 0.2 --output data/category_model.npz
+"""
+import sys
+import os
+import asyncio
+import argparse
+import random
+import time
+
+# Добавить путь к приложению
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import select
+
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.db.session import AsyncSessionLocal
+from fintrek_async.app.models.transaction import Transaction
+from fintrek_async.app.models.category import Category
+from fintrek_async.app.ml.category_classifier import category_classifier
+
+
+async def load_samples() -> tuple:
+    """Тексты, ID и типы категорий размеченных транзакций (потоково)"""
+    texts, category_ids, category_types = [], [], []
+    stmt = select(
+        Transaction.description,
+        Transaction.merchant_name,
+        Category.id,
+        Category.category_type
+    ).join(Category, Category.id == Transaction.category_id).filter(
+        Category.is_system == True
+    ).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt)
+        async for description, merchant_name, category_id, category_type in result:
+            texts.append(category_classifier.normalize(description, merchant_name))
+            category_ids.append(str(category_id))
+            category_types.append(category_type.value)
+
+    return texts, category_ids, category_types
+
+
+async def train(holdout: float, output: str, seed: int) -> int:
+    texts, category_ids, category_types = await load_samples()
+    print(f"Размеченных транзакций: {len(texts)}")
+    if len(texts) < settings.CATEGORY_MODEL_MIN_SAMPLES:
+        print(f"❌ Недостаточно данных: нужно минимум {settings.CATEGORY_MODEL_MIN_SAMPLES}")
+        return 1
+
+    indexes = list(range(len(texts)))
+    random.Random(seed).shuffle(indexes)
+    split = int(len(indexes) * (1 - holdout))
+    train_idx, test_idx = indexes[:split], indexes[split:]
+
+    if test_idx:
+        category_classifier.fit(
+            [texts[i] for i in train_idx],
+            [category_ids[i] for i in train_idx],
+            [category_types[i] for i in train_idx]
+        )
+        test_texts = [texts[i] for i in test_idx]
+        started = time.perf_counter()
+        predicted, confidence = category_classifier.predict(test_texts, [category_types[i] for i in test_idx])
+        elapsed = time.perf_counter() - started
+
+        correct = sum(1 for i, category_id in zip(test_idx, predicted) if category_id == category_ids[i])
+        confident = confidence >= settings.CATEGORY_MODEL_MIN_CONFIDENCE
+        confident_correct = sum(
+            1 for i, category_id, ok in zip(test_idx, predicted, confident) if ok and category_id == category_ids[i]
+        )
+        print(f"Точность на отложенной выборке ({len(test_idx)}): {correct / len(test_idx):.3f}")
+        print(
+            f"Уверенных ответов: {confident.mean():.1%}, "
+            f"точность среди них: {confident_correct / max(int(confident.sum()), 1):.3f}"
+        )
+        print(f"Скорость предсказания: {len(test_idx) / elapsed:,.0f} транзакций/с")
+
+    # Итоговая модель обучается на всех данных
+    category_classifier.fit(texts, category_ids, category_types)
+    category_classifier.save(output)
+    print(f"✅ Модель сохранена в {output} ({len(category_classifier.classes)} категорий)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обучение модели категоризации транзакций")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Доля отложенной выборки (0 - без оценки)")
+    parser.add_argument("--output", default=settings.CATEGORY_MODEL_PATH)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(train(args.holdout, args.output, args.seed)))
@@ -0,0 +1,143 @@
+"""
+Тесты повторов и circuit breaker запросов к банковским API
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from fintrek_async.app.clients import resilience
+from fintrek_async.app.clients.resilience import send_with_retry, circuit_breaker, CircuitBreaker
+from fintrek_async.app.core.config import settings
+from fintrek_async.app.core.exceptions import CircuitOpenError
+
+
+def stub_bank(responses):
+    """Клиент со stub-банком, отвечающим по очереди заданными статусами (или исключениями)"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        result = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(result, Exception):
+            raise result
+        status, headers = result if isinstance(result, tuple) else (result, {})
+        return httpx.Response(status, headers=headers, json={"ok": status == 200})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://bank"), calls
+
+
+@pytest.fixture(autouse=True)
+def no_delays(monkeypatch):
+    """Без реальных пауз между повторами"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", sleep)
+    return delays
+
+
+async def test_retries_transient_errors_then_succeeds():
+    """
+    Таймаут и 503 повторяются, итоговый ответ - успешный
+    """
+    client, calls = stub_bank([httpx.ReadTimeout("slow"), 503, 200])
+
+    response = await send_with_retry(client, "GET", "/accounts", provider="test-retry")
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+async def test_honours_retry_after_on_429(no_delays):
+    """
+    На 429 выдерживается Retry-After, но не дольше предела задержки
+    """
+    client, calls = stub_bank([(429, {"Retry-After": "2"}), (429, {"Retry-After": "3600"}), 200])
+
+    response = await send_with_retry(client, "GET", "/accounts", provider="test-429")
+
+    assert response.status_code == 200
+    assert no_delays == [2.0, settings.BANK_RETRY_MAX_DELAY_SECONDS]
+
+
+async def test_non_idempotent_request_is_not_retried():
+    """
+    POST отправляется один раз
+    """
+    client, calls = stub_bank([503, 200])
+
+    response = await send_with_retry(client, "POST", "/auth/bank-token", provider="test-post", idempotent=False)
+
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+
+async def test_breaker_opens_and_fails_fast(monkeypatch):
+    """
+    При всплеске ошибок breaker размыкается и запросы не доходят до банка
+    """
+    monkeypatch.setattr(settings, "BANK_BREAKER_OPEN_SECONDS", 60.0)
+    client, calls = stub_bank([500])
+
+    # Breaker размыкается посреди повторов, как только ошибок набирается достаточно
+    with pytest.raises(CircuitOpenError):
+        for _ in range(settings.BANK_BREAKER_MIN_CALLS):
+            await send_with_retry(client, "GET", "/accounts", provider="test-breaker")
+    assert circuit_breaker("test-breaker").state == CircuitBreaker.OPEN
+    assert len(calls) == settings.BANK_BREAKER_MIN_CALLS
+
+    with pytest.raises(CircuitOpenError):
+        await send_with_retry(client, "GET", "/accounts", provider="test-breaker")
+    assert len(calls) == settings.BANK_BREAKER_MIN_CALLS
+    assert resilience.get_resilience_stats()["test-breaker"]["breaker_opened"] == 1
+
+
+async def test_breaker_closes_after_successful_probe(monkeypatch):
+    """
+    После паузы пробный успешный запрос замыкает breaker
+    """
+    breaker = circuit_breaker("test-probe")
+    for _ in range(settings.BANK_BREAKER_MIN_CALLS):
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    monkeypatch.setattr(settings, "BANK_BREAKER_OPEN_SECONDS", 0.0)
+    client, _ = stub_bank([200])
+    response = await send_with_retry(client, "GET", "/accounts", provider="test-probe")
+
+    assert response.status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_cancelled_probe_does_not_block_breaker(monkeypatch):
+    """
+    Отмененный пробный запрос не оставляет breaker закрытым для следующих вызовов
+    """
+    breaker = circuit_breaker("test-cancel-probe")
+    for _ in range(settings.BANK_BREAKER_MIN_CALLS):
+        breaker.record(False)
+    monkeypatch.setattr(settings, "BANK_BREAKER_OPEN_SECONDS", 0.0)
+
+    started = asyncio.Event()
+
+    async def hang(request: httpx.Request) -> httpx.Response:
+        started.set()
+        await asyncio.Event().wait()
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(hang), base_url="http://bank")
+    probe = asyncio.create_task(send_with_retry(client, "GET", "/accounts", provider="test-cancel-probe"))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    client, calls = stub_bank([200])
+    response = await send_with_retry(client, "GET", "/accounts", provider="test-cancel-probe")
+
+    assert response.status_code == 200
+    assert len(calls) == 1
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,185 @@
+"""
+Тесты планов выполнения горячих запросов по транзакциям
+
+На синтетическом наборе данных реальные запросы ML-модулей перехватываются
+и прогоняются через EXPLAIN: транзакции не должны читаться seq scan'ом,
+а агрегаты только по индексируемым колонкам должны идти index-only scan'ом.
+"""
+import asyncio
+import json
+import re
+import uuid
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from fintrek_async.tests.conftest import TEST_DATABASE_URL
+from fintrek_async.app.db.base import Base
+from fintrek_async.app.ml.spending_analyzer import spending_analyzer
+from fintrek_async.app.ml.forecasting_model import forecasting_model
+from fintrek_async.app.ml.recommendation_engine import recommendation_engine
+
+USERS = 60
+TRANSACTIONS_PER_USER = 500
+
+# Колонки, которые есть в ix_transactions_user_type_date (ключ + INCLUDE)
+COVERED_COLUMNS = {"user_id", "transaction_type", "transaction_date", "amount", "category_id"}
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _make_engine():
+    # NullPool: каждый asyncio.run работает в своем event loop
+    return create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+
+
+async def _seed() -> list:
+    from fintrek_async.app.models.user import User
+    from fintrek_async.app.models.account import Account, AccountType
+
+    engine = _make_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    user_ids = []
+    async with session_factory() as db:
+        for _ in range(USERS):
+            user = User(email=f"plan-{uuid.uuid4().hex}@example.com", name="Plan test", password_hash="-")
+            db.add(user)
+            await db.flush()
+            account = Account(user_id=user.id, account_name="Plan test", account_type=AccountType.CHECKING)
+            db.add(account)
+            await db.flush()
+            user_ids.append(user.id)
+
+            await db.execute(text("""
+                INSERT INTO transactions
+                    (id, user_id, account_id, transaction_type, amount, currency, description,
+                     transaction_date, status, created_at, updated_at)
+                SELECT gen_random_uuid(), :user_id, :account_id,
+                       CASE WHEN g % 5 = 0 THEN 'INCOME' ELSE 'EXPENSE' END::transactiontype,
+                       round((random() * 3000 + 1)::numeric, 2), 'RUB', 'Покупка ' || (g % 40),
+                       now() - (random() * interval '365 days'),
+                       'COMPLETED'::transactionstatus, now(), now()
+                FROM generate_series(1, :size) AS g
+            """), {"user_id": user.id, "account_id": account.id, "size": TRANSACTIONS_PER_USER})
+        await db.commit()
+
+    # VACUUM нельзя выполнять внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE transactions"))
+        await conn.execute(text("ANALYZE accounts"))
+
+    await engine.dispose()
+    return user_ids
+
+
+async def _cleanup(user_ids: list):
+    engine = _make_engine()
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM users WHERE id = ANY(:ids)"), {"ids": user_ids})
+    await engine.dispose()
+
+
+async def _capture_plans(call) -> list:
+    """Выполнить call(db) и вернуть [(sql, plan)] для всех запросов к transactions"""
+    engine = _make_engine()
+    captured = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if re.search(r"\bFROM transactions\b|\bJOIN transactions\b", statement):
+            captured.append((statement, parameters))
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        await call(db)
+
+    event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+
+    plans = []
+    async with engine.connect() as conn:
+        for statement, parameters in captured:
+            result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            raw = result.scalar()
+            plan = raw if isinstance(raw, list) else json.loads(raw)
+            plans.append((statement, plan[0]["Plan"]))
+
+    await engine.dispose()
+    return plans
+
+
+def _transaction_scans(node: dict) -> list:
+    """Все узлы плана, читающие таблицу transactions"""
+    found = []
+    if node.get("Relation Name") == "transactions" or (
+        node.get("Index Name") or ""
+    ).startswith("ix_transactions"):
+        found.append(node)
+    for child in node.get("Plans", []):
+        found.extend(_transaction_scans(child))
+    return found
+
+
+def _is_covered(statement: str) -> bool:
+    """Запрос использует только колонки покрывающего индекса"""
+    return set(re.findall(r"\btransactions\.(\w+)", statement)) <= COVERED_COLUMNS
+
+
+@pytest.fixture(scope="module")
+def seeded_users():
+    """Синтетический набор данных; пропуск, если PostgreSQL недоступен"""
+    try:
+        user_ids = _run(_seed())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+    yield user_ids
+    _run(_cleanup(user_ids))
+
+
+HOT_QUERIES = {
+    "spending_by_category": lambda db, uid: spending_analyzer.get_spending_by_category(
+        db, uid, *_last_days(90)
+    ),
+    "monthly_spending": lambda db, uid: spending_analyzer.get_monthly_spending(db, uid),
+    "spending_trends": lambda db, uid: spending_analyzer.get_spending_trends(db, uid),
+    "anomalies": lambda db, uid: spending_analyzer.detect_anomalies(db, uid),
+    "anomalies_mad": lambda db, uid: spending_analyzer.detect_anomalies(db, uid, method="mad"),
+    "anomalies_online": lambda db, uid: spending_analyzer.detect_anomalies(db, uid, method="online"),
+    "forecast_spending": lambda db, uid: forecasting_model.forecast_next_month_spending(db, uid),
+    "forecast_income": lambda db, uid: forecasting_model.forecast_next_month_income(db, uid),
+    "financial_health": lambda db, uid: forecasting_model.calculate_financial_health_score(db, uid),
+    "recommendations": lambda db, uid: recommendation_engine.generate_recommendations(db, uid),
+}
+
+
+def _last_days(days: int):
+    from datetime import datetime, timedelta
+    end_date = datetime.utcnow()
+    return end_date - timedelta(days=days), end_date
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_indexes(seeded_users, name):
+    """
+    Запросы аналитики читают транзакции по индексу, без seq scan
+    """
+    user_id = seeded_users[len(seeded_users) // 2]
+    plans = _run(_capture_plans(lambda db: HOT_QUERIES[name](db, user_id)))
+    assert plans, f"{name}: no queries against transactions were captured"
+
+    for statement, plan in plans:
+        scans = _transaction_scans(plan)
+        node_types = {scan["Node Type"] for scan in scans}
+        assert "Seq Scan" not in node_types, f"{name}: seq scan in\n{statement}"
+
+        if _is_covered(statement):
+            assert node_types == {"Index Only Scan"}, (
+                f"{name}: expected index-only scan, got {node_types} in\n{statement}"
+            )
@@ -0,0 +1,108 @@
+"""
+Тесты параллельного пересчета дневных агрегатов
+
+Две транзакции БД одновременно записывают транзакции одного пользователя
+за один день и пересчитывают агрегаты: вторая должна дождаться первой и
+пересчитать день с учетом ее транзакций, а не вставить свою строку рядом.
+"""
+import asyncio
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from fintrek_async.tests.conftest import TEST_DATABASE_URL
+from fintrek_async.app.db.base import Base
+from fintrek_async.app.services.rollup_service import rollup_service
+
+DAY = datetime(2026, 10, 1, 12, 0)
+
+
+async def _seed(session_factory):
+    from fintrek_async.app.models.user import User
+    from fintrek_async.app.models.account import Account, AccountType
+    from fintrek_async.app.models.category import Category, CategoryType
+
+    async with session_factory() as db:
+        user = User(email=f"rollup-{uuid.uuid4().hex}@example.com", name="Rollup test", password_hash="-")
+        db.add(user)
+        await db.flush()
+        account = Account(user_id=user.id, account_name="Rollup test", account_type=AccountType.CHECKING)
+        category = Category(name="Rollup test", category_type=CategoryType.EXPENSE, user_id=user.id)
+        db.add_all([account, category])
+        await db.commit()
+        return user.id, account.id, category.id
+
+
+async def _write(session_factory, user_id, account_id, category_id, refreshed: asyncio.Event, wait: asyncio.Event):
+    """Записать расход с категорией и без, пересчитать день, зафиксировать"""
+    from fintrek_async.app.models.transaction import Transaction, TransactionType
+
+    async with session_factory() as db:
+        for category in (category_id, None):
+            db.add(Transaction(
+                user_id=user_id,
+                account_id=account_id,
+                category_id=category,
+                transaction_type=TransactionType.EXPENSE,
+                amount=Decimal("100.00"),
+                transaction_date=DAY
+            ))
+        await db.flush()
+        await wait.wait()
+        await rollup_service.refresh_days(db, user_id, [DAY.date()])
+        refreshed.set()
+        # Дать второму писателю дойти до пересчета до фиксации первого
+        await asyncio.sleep(0.5)
+        await db.commit()
+
+
+async def _run_concurrent_writers():
+    from fintrek_async.app.models.transaction_rollup import TransactionDailyRollup
+    from fintrek_async.app.models.category_stats import CategorySpendingStats
+
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    user_id, account_id, category_id = await _seed(session_factory)
+    try:
+        start = asyncio.Event()
+        start.set()
+        first_refreshed, second_refreshed = asyncio.Event(), asyncio.Event()
+        await asyncio.gather(
+            _write(session_factory, user_id, account_id, category_id, first_refreshed, start),
+            _write(session_factory, user_id, account_id, category_id, second_refreshed, first_refreshed)
+        )
+
+        async with session_factory() as db:
+            rollups = (await db.execute(
+                select(TransactionDailyRollup.category_id, TransactionDailyRollup.tx_count).where(
+                    TransactionDailyRollup.user_id == user_id
+                )
+            )).all()
+            stats = await db.get(CategorySpendingStats, (user_id, category_id))
+            return sorted(rollups, key=lambda row: str(row.category_id)), stats.count
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+        await engine.dispose()
+
+
+def test_concurrent_refresh_of_same_day():
+    """
+    Параллельные пересчеты одного дня не задваивают строки и статистику
+    """
+    try:
+        rollups, stats_count = asyncio.run(_run_concurrent_writers())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+
+    assert [row.tx_count for row in rollups] == [2, 2]
+    assert {row.category_id is None for row in rollups} == {True, False}
+    assert stats_count == 2
@@ -0,0 +1,98 @@
+"""
+Тесты обучаемого классификатора категорий
+"""
+from fintrek_async.app.ml.category_classifier import CategoryClassifier
+
+SAMPLES = [
+    ("пятерочка продукты", "groceries", "expense"),
+    ("магнит у дома", "groceries", "expense"),
+    ("перекресток супермаркет", "groceries", "expense"),
+    ("яндекс такси поездка", "taxi", "expense"),
+    ("такси ситимобил", "taxi", "expense"),
+    ("uber поездка", "taxi", "expense"),
+    ("зарплата за май", "salary", "income"),
+    ("заработная плата", "salary", "income"),
+]
+
+
+def make_classifier() -> CategoryClassifier:
+    classifier = CategoryClassifier(n_features=2 ** 12)
+    texts, ids, types = zip(*SAMPLES)
+    classifier.fit(list(texts), list(ids), list(types))
+    return classifier
+
+
+def test_predict_respects_category_type():
+    """
+    Предсказывается категория только подходящего типа (доход/расход)
+    """
+    classifier = make_classifier()
+
+    predicted, confidence = classifier.predict(
+        ["пятерочка на углу", "такси до дома", "такси до дома"],
+        ["expense", "expense", "income"]
+    )
+
+    assert predicted == ["groceries", "taxi", "salary"]
+    assert confidence[0] > 0.5 and confidence[1] > 0.5
+    assert confidence[2] == 1.0
+
+
+def test_partial_fit_learns_correction():
+    """
+    Исправление пользователя сразу влияет на предсказание
+    """
+    classifier = make_classifier()
+    text = "кофейня зерно"
+
+    for _ in range(3):
+        classifier.partial_fit([text], ["coffee"], ["expense"])
+
+    assert classifier.predict_one(text, "expense")[0] == "coffee"
+    assert classifier.predict_one("пятерочка", "expense")[0] == "groceries"
+
+
+def test_save_and_load(tmp_path):
+    """
+    Загруженная модель дает те же предсказания
+    """
+    classifier = make_classifier()
+    path = str(tmp_path / "model.npz")
+    classifier.save(path)
+
+    loaded = CategoryClassifier(n_features=2 ** 10)
+    assert loaded.load(path)
+    assert loaded.n_features == classifier.n_features
+
+    texts = ["магнит", "uber", "зарплата"]
+    types = ["expense", "expense", "income"]
+    assert loaded.predict(texts, types)[0] == classifier.predict(texts, types)[0]
+    assert not loaded.load(str(tmp_path / "missing.npz"))
+
+
+def test_save_if_dirty_merges_corrections_of_processes(tmp_path):
+    """
+    Исправления двух процессов сливаются в файле, а не затирают друг друга
+    """
+    path = str(tmp_path / "model.npz")
+    make_classifier().save(path)
+    first, second = CategoryClassifier(), CategoryClassifier()
+    assert first.load(path) and second.load(path)
+
+    for _ in range(3):
+        first.partial_fit(["кофейня зерно"], ["coffee"], ["expense"])
+        second.partial_fit(["аптека здоровье"], ["pharmacy"], ["expense"])
+    first.save_if_dirty(path)
+    second.save_if_dirty(path)
+
+    # Второй процесс принял исправления первого
+    assert second.predict_one("кофейня зерно", "expense")[0] == "coffee"
+    merged = CategoryClassifier()
+    assert merged.load(path)
+    assert merged.predict_one("кофейня зерно", "expense")[0] == "coffee"
+    assert merged.predict_one("аптека здоровье", "expense")[0] == "pharmacy"
+    assert merged._class_count.sum() == len(SAMPLES) + 6
+
+    # Повторное сохранение без новых исправлений ничего не добавляет
+    first.save_if_dirty(path)
+    assert CategoryClassifier()._read(path)[7].sum() == len(SAMPLES) + 6
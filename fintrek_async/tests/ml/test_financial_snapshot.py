@@ -0,0 +1,55 @@
+"""
+Тесты общего снимка данных для ML-анализаторов
+"""
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+
+from fintrek_async.app.ml.financial_snapshot import MonthlyTotal, UserFinancialSnapshot
+from fintrek_async.app.ml.forecasting_model import forecasting_model
+from fintrek_async.app.ml.spending_analyzer import spending_analyzer
+from fintrek_async.app.models.transaction import TransactionType
+
+
+class _NoQuerySnapshot(UserFinancialSnapshot):
+    """Снимок с заранее заданными помесячными суммами; обращение к БД - ошибка"""
+
+    def __init__(self, rows):
+        super().__init__(db=None, user_id="user", now=datetime(2026, 10, 17, 12, 0))
+        self.loads = 0
+        self._rows = rows
+
+    async def _load_monthly_totals(self, db):
+        self.loads += 1
+        return self._rows
+
+
+def test_snapshot_shares_monthly_totals_between_analyzers():
+    """
+    Тренды и прогнозы считаются по одной загрузке помесячных сумм
+    """
+    expense, income = TransactionType.EXPENSE, TransactionType.INCOME
+    snapshot = _NoQuerySnapshot([
+        MonthlyTotal(datetime(2026, 8, 1), expense, Decimal("1000.00"), Decimal(0), Decimal(0)),
+        MonthlyTotal(datetime(2026, 9, 1), expense, Decimal("2000.00"), Decimal("500.00"), Decimal(0)),
+        MonthlyTotal(datetime(2026, 9, 1), income, Decimal("5000.00"), Decimal(0), Decimal(0)),
+        MonthlyTotal(datetime(2026, 10, 1), expense, Decimal("2500.00"), Decimal("2500.00"), Decimal("100.00")),
+    ])
+
+    async def run():
+        trends = await spending_analyzer.get_spending_trends(None, "user", snapshot)
+        spending = await forecasting_model.forecast_next_month_spending(None, "user", snapshot)
+        income_forecast = await forecasting_model.forecast_next_month_income(None, "user", snapshot)
+        # Повторный вызов берет запомненный результат
+        assert await spending_analyzer.get_spending_trends(None, "user", snapshot) is trends
+        return trends, spending, income_forecast
+
+    trends, spending, income_forecast = asyncio.run(run())
+
+    assert snapshot.loads == 1
+    assert trends["current_month"] == 2600.0
+    assert trends["previous_month"] == 2000.0
+    assert trends["trend"] == "up"
+    assert spending["data_points"] == 3
+    assert spending["forecast"] == 3333.33
+    assert income_forecast["forecast"] == 5000.0
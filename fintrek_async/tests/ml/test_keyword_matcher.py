@@ -0,0 +1,41 @@
+"""
+Тесты автомата ключевых слов и категоризации по словарям
+"""
+import random
+
+from fintrek_async.app.ml.keyword_matcher import KeywordMatcher
+from fintrek_async.app.ml.transaction_categorizer import transaction_categorizer
+
+
+def test_keyword_matcher_finds_overlapping_keywords():
+    """
+    Находятся все ключевые слова, включая вложенные и перекрывающиеся
+    """
+    matcher = KeywordMatcher(["he", "she", "his", "hers", "кафе", "кафетерий"])
+
+    assert matcher.find_keywords("ushers") == {"he", "she", "hers"}
+    assert matcher.find_keywords("кафетерий у дома") == {"кафе", "кафетерий"}
+    assert matcher.find_keywords("ничего") == set()
+
+
+def test_keyword_matcher_matches_substring_scan():
+    """
+    Результат совпадает с наивной проверкой `keyword in text`
+    """
+    rng = random.Random(0)
+    alphabet = "абвab "
+    for _ in range(500):
+        keywords = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(6)]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+
+        assert KeywordMatcher(keywords).find_keywords(text) == {k for k in keywords if k in text}
+
+
+def test_match_category_name():
+    """
+    Категория с наибольшим числом совпавших ключевых слов
+    """
+    assert transaction_categorizer.match_category_name("пятерочка, продукты", is_expense=True) == "Продукты"
+    assert transaction_categorizer.match_category_name("starbucks coffee", is_expense=True) == "Кафе и рестораны"
+    assert transaction_categorizer.match_category_name("salary за май", is_expense=False) == "Зарплата"
+    assert transaction_categorizer.match_category_name("неизвестно", is_expense=False) is None
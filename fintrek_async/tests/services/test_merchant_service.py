@@ -0,0 +1,22 @@
+"""
+Тесты нормализации продавцов
+"""
+from fintrek_async.app.services.merchant_service import normalize_merchant
+
+
+def test_normalize_merchant_merges_spellings():
+    """
+    Разные написания одного продавца дают один ключ
+    """
+    assert normalize_merchant("YANDEX*TAXI 1234") == "yandex taxi"
+    assert normalize_merchant("Яндекс.Такси") == "yandex taxi"
+    assert normalize_merchant('ООО "Пятёрочка" Москва') == normalize_merchant("PYATEROCHKA 5123 MOSCOW RUS")
+
+
+def test_normalize_merchant_without_meaningful_words():
+    """
+    Строка из цифр и служебных слов не дает ключа
+    """
+    assert normalize_merchant("12345") is None
+    assert normalize_merchant("ООО РФ") is None
+    assert normalize_merchant(None) is None
@@ -0,0 +1,28 @@
+"""
+Тесты разницы дневных агрегатов для статистики категорий
+"""
+import uuid
+from decimal import Decimal
+
+from fintrek_async.app.models.transaction import TransactionType
+from fintrek_async.app.services.rollup_service import RollupService
+
+
+def test_expense_deltas_subtract_old_rollups():
+    """
+    Разница учитывает только расходы с категорией; удаленные строки вычитаются
+    """
+    food, fun = uuid.uuid4(), uuid.uuid4()
+    removed = [
+        (food, TransactionType.EXPENSE, 2, Decimal("300.00"), Decimal("50000.00")),
+        (fun, TransactionType.EXPENSE, 1, Decimal("50.00"), Decimal("2500.00")),
+    ]
+    added = [
+        (food, TransactionType.EXPENSE, 1, Decimal("100.00"), Decimal("10000.00")),
+        (food, TransactionType.INCOME, 1, Decimal("900.00"), Decimal("810000.00")),
+        (None, TransactionType.EXPENSE, 3, Decimal("30.00"), Decimal("300.00")),
+    ]
+
+    deltas = RollupService._expense_deltas(removed, added)
+
+    assert deltas == {food: (-1, -200.0, -40000.0), fun: (-1, -50.0, -2500.0)}